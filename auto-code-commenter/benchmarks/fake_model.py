@@ -0,0 +1,108 @@
+# benchmarks/fake_model.py
+"""A local stand-in for a model provider, with simulated latency, failures and throttling.
+
+The fake echoes the code each prompt carries (see `models_replay.echo_response`), so every
+stage of the pipeline, verification included, does its real work on the response. It reports
+token usage like a provider would, so throughput in tokens is measured too.
+"""
+
+import asyncio
+import random
+import threading
+import time
+
+from bot.core.completion import Completion
+from bot.core.models_replay import echo_response
+from bot.core.usage import record_usage
+from bot.utils.packing import estimate_tokens
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+
+class InjectedError(RuntimeError):
+    """A simulated provider failure (e.g. a 500 or a dropped connection)."""
+
+
+class InjectedThrottle(InjectedError):
+    """A simulated 429, which the rate limiter retries after backing off."""
+    status_code = 429
+
+
+class FakeModel:
+    """Model wrapper that sleeps instead of calling an API.
+
+    Args:
+        latency: "fixed", "uniform" (0 to 2 × median) or "lognormal"
+        median: Median latency of a call in seconds
+        sigma: Spread of the lognormal distribution (larger means a longer tail)
+        seconds_per_output_token: Extra latency per generated token, like a decoding model
+        error_rate: Fraction of calls that fail with `InjectedError`
+        throttle_rate: Fraction of calls rejected with `InjectedThrottle` (HTTP 429)
+        seed: Seed for the latency and failure draws
+
+    Attributes:
+        calls (int): Calls received, failed ones included
+        errors (int): Calls failed with `InjectedError`
+        throttles (int): Calls rejected with `InjectedThrottle`
+    """
+    def __init__(self, latency: str = "lognormal", median: float = 0.5, sigma: float = 0.5,
+                 seconds_per_output_token: float = 0.0, error_rate: float = 0.0, throttle_rate: float = 0.0,
+                 seed: int = 0):
+        if latency not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {latency} (expected one of {', '.join(LATENCY_DISTRIBUTIONS)})")
+        self.latency = latency
+        self.median = median
+        self.sigma = sigma
+        self.seconds_per_output_token = seconds_per_output_token
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.calls = 0
+        self.errors = 0
+        self.throttles = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self, prompt: str):
+        """Decide one call's outcome: (delay in seconds, response or exception)."""
+        response = echo_response(prompt)
+        with self._lock:
+            self.calls += 1
+            if self.latency == "fixed":
+                delay = self.median
+            elif self.latency == "uniform":
+                delay = self._random.uniform(0, 2 * self.median)
+            else:
+                delay = self.median * self._random.lognormvariate(0, self.sigma)
+            outcome = self._random.random()
+            if outcome < self.throttle_rate:
+                self.throttles += 1
+                return delay * 0.1, InjectedThrottle("429 Too Many Requests (injected)")
+            if outcome < self.throttle_rate + self.error_rate:
+                self.errors += 1
+                return delay, InjectedError("Internal server error (injected)")
+        return delay + self.seconds_per_output_token * estimate_tokens(response), response
+
+    @staticmethod
+    def _finish(prompt: str, result):
+        if isinstance(result, Exception):
+            raise result
+        record_usage(estimate_tokens(prompt), 0, estimate_tokens(result))
+        return Completion(result, "stop")
+
+    def generate(self, prompt: str):
+        delay, result = self._draw(prompt)
+        time.sleep(delay)
+        return self._finish(prompt, result)
+
+    async def agenerate(self, prompt: str):
+        delay, result = self._draw(prompt)
+        await asyncio.sleep(delay)
+        return self._finish(prompt, result)
+
+    def timing_summary(self) -> str:
+        return f"fake      calls={self.calls} errors={self.errors} throttles={self.throttles}"
+
+
+def create_fake_model(config: dict) -> FakeModel:
+    """Provider factory for `provider.type: fake`; settings come from the config's `fake` dict."""
+    return FakeModel(**(config.get("fake") or {}))
@@ -0,0 +1,217 @@
+# benchmarks/run.py
+"""Measure pipeline throughput on a synthetic tree against a fake, local model.
+
+Each scenario runs in a fresh process (so peak RSS and the shared rate controllers are its
+own) on a freshly generated tree, and reports files/second, tokens/second, peak RSS and
+p50/p95/p99 latency of model calls and of whole files. With `--runs 2` the second run finds
+the cache manifest written by the first, which shows what the manifest saves.
+
+Usage (from the `auto-code-commenter` directory):
+
+    python -m benchmarks.run --python-files 200 --concurrency 4 16 64
+    python -m benchmarks.run --latency lognormal --median 0.8 --sigma 1.0 --throttle-rate 0.05
+    python -m benchmarks.run --runs 2 --set python_mode=chunked --set pack_token_budget=2000 -o bench.json
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+
+from benchmarks.fake_model import LATENCY_DISTRIBUTIONS
+from bot.utils.report import percentile
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MiB (None where `resource` is unavailable)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _run_metrics(report: dict, fake) -> dict:
+    totals = report["totals"]
+    wall = totals["wall_seconds"] or None
+    file_walls = [f["wall_seconds"] for f in report["files"] if f["status"] != "skipped"]
+    tokens = totals["input_tokens"] + totals["output_tokens"]
+    return {
+        "wall_seconds": totals["wall_seconds"],
+        "files": totals["files"],
+        "written": totals["written"],
+        "skipped": totals["skipped"],
+        "failed": totals["failed"],
+        "files_per_second": round(totals["files"] / wall, 2) if wall else None,
+        "tokens_per_second": round(tokens / wall, 1) if wall else None,
+        "llm_calls": totals["llm_calls"],
+        "llm_latency_seconds": totals["llm_latency_seconds"],
+        "file_latency_seconds": {p: percentile(file_walls, int(p[1:])) for p in ("p50", "p95", "p99")},
+        "retries": totals["retries"],
+        "injected_errors": fake.errors,
+        "injected_throttles": fake.throttles,
+    }
+
+
+def run_scenario(scenario: dict) -> dict:
+    """Generate a tree, run the pipeline over it `runs` times and collect the metrics.
+
+    Meant to run in its own process; the pipeline's output is discarded unless `verbose`.
+    """
+    from benchmarks.fake_model import create_fake_model
+    from benchmarks.synthetic import make_repo
+    from bot.core.models import register_provider
+    from bot.pipeline import run_commenting_pipeline
+
+    fakes = []  # kept so the injected failures can be reported
+
+    def create(config):
+        fakes.append(create_fake_model(config))
+        return fakes[-1]
+    register_provider("fake", create)
+
+    concurrency = scenario["concurrency"]
+    config = {
+        "model": {
+            "provider": {"type": "fake"},
+            "model_name": "fake",
+            "fake": scenario["fake"],
+            "rate_limit": {
+                "initial_concurrency": concurrency,
+                "max_concurrency": max(64, concurrency),
+                "max_retries": 8,
+                "base_delay": scenario["backoff"],
+            },
+        },
+        "project": {
+            "include": ["./src"],
+            "file_types": [".py", ".sql", ".ipynb"],
+            "concurrency": concurrency,
+            "cache_file": ".commenter-cache.json",
+            "report_file": ".commenter-report.json",
+            **scenario["project"],
+        },
+    }
+    with tempfile.TemporaryDirectory(prefix="commenter-bench-") as root:
+        tree = make_repo(root, **scenario["tree"])
+        runs, previous = [], os.getcwd()
+        os.chdir(root)
+        try:
+            for _ in range(scenario["runs"]):
+                with open(os.devnull, "w") as devnull, contextlib.ExitStack() as stack:
+                    if not scenario["verbose"]:
+                        stack.enter_context(contextlib.redirect_stdout(devnull))
+                    run_commenting_pipeline(config)
+                with open(".commenter-report.json", encoding="utf-8") as f:
+                    runs.append(_run_metrics(json.load(f), fakes[-1]))
+        finally:
+            os.chdir(previous)
+    return {"scenario": scenario, "tree": tree, "runs": runs, "peak_rss_mb": peak_rss_mb()}
+
+
+def _format_row(concurrency: int, index: int, run: dict, rss) -> str:
+    def fmt(value):
+        return f"{value:.2f}" if value is not None else "n/a"
+    llm, files = run["llm_latency_seconds"], run["file_latency_seconds"]
+    return (
+        f"{concurrency:>5} {index:>3} {run['files']:>6} {run['failed']:>5} {fmt(run['wall_seconds']):>8} "
+        f"{fmt(run['files_per_second']):>8} {fmt(run['tokens_per_second']):>10} "
+        f"{fmt(llm['p50']):>7} {fmt(llm['p95']):>7} {fmt(llm['p99']):>7} {fmt(files['p99']):>8} "
+        f"{run['retries']:>7} {fmt(rss):>8}"
+    )
+
+
+def _parse_overrides(pairs: list[str]) -> dict:
+    """`key=value` project settings; values are parsed as YAML (numbers, booleans, strings)."""
+    overrides = {}
+    for pair in pairs:
+        key, sep, value = pair.partition("=")
+        if not sep:
+            raise SystemExit(f"❌ --set expects key=value, got: {pair}")
+        overrides[key.strip()] = yaml.safe_load(value)
+    return overrides
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the commenting pipeline against a fake model.")
+    tree = parser.add_argument_group("synthetic tree")
+    tree.add_argument("--python-files", type=int, default=100)
+    tree.add_argument("--median-lines", type=int, default=80, help="Median Python module length (lognormal)")
+    tree.add_argument("--notebooks", type=int, default=5)
+    tree.add_argument("--notebook-cells", type=int, default=20)
+    tree.add_argument("--sql-files", type=int, default=10)
+    tree.add_argument("--sql-statements", type=int, default=4)
+    model = parser.add_argument_group("fake model")
+    model.add_argument("--latency", choices=LATENCY_DISTRIBUTIONS, default="lognormal")
+    model.add_argument("--median", type=float, default=0.5, help="Median call latency in seconds")
+    model.add_argument("--sigma", type=float, default=0.5, help="Lognormal spread; larger means a longer tail")
+    model.add_argument("--seconds-per-output-token", type=float, default=0.0)
+    model.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls that fail")
+    model.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of calls rejected with a 429")
+    model.add_argument("--backoff", type=float, default=0.05, help="Rate limiter backoff base in seconds")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[4, 16],
+                        help="One scenario per value")
+    parser.add_argument("--runs", type=int, default=1, help="Runs per scenario over the same tree (later runs hit the cache)")
+    parser.add_argument("--set", dest="overrides", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra `project` setting, e.g. python_mode=chunked")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Write the results as JSON to this file")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show the pipeline's output")
+    args = parser.parse_args(argv)
+
+    base = {
+        "tree": {
+            "python_files": args.python_files,
+            "median_lines": args.median_lines,
+            "notebooks": args.notebooks,
+            "notebook_cells": args.notebook_cells,
+            "sql_files": args.sql_files,
+            "sql_statements": args.sql_statements,
+            "seed": args.seed,
+        },
+        "fake": {
+            "latency": args.latency,
+            "median": args.median,
+            "sigma": args.sigma,
+            "seconds_per_output_token": args.seconds_per_output_token,
+            "error_rate": args.error_rate,
+            "throttle_rate": args.throttle_rate,
+            "seed": args.seed,
+        },
+        "backoff": args.backoff,
+        "project": _parse_overrides(args.overrides),
+        "runs": max(1, args.runs),
+        "verbose": args.verbose,
+    }
+
+    print(f"{'conc':>5} {'run':>3} {'files':>6} {'fail':>5} {'wall_s':>8} {'files/s':>8} {'tokens/s':>10} "
+          f"{'llm_p50':>7} {'llm_p95':>7} {'llm_p99':>7} {'file_p99':>8} {'retries':>7} {'rss_mb':>8}")
+    results, started = [], time.perf_counter()
+    spawn = multiprocessing.get_context("spawn")
+    for concurrency in args.concurrency:
+        scenario = {**base, "concurrency": concurrency}
+        with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+            result = pool.submit(run_scenario, scenario).result()
+        results.append(result)
+        for index, run in enumerate(result["runs"], 1):
+            print(_format_row(concurrency, index, run, result["peak_rss_mb"]))
+    print(f"📊 {len(results)} scenario(s) in {time.perf_counter() - started:.1f}s")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"📄 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
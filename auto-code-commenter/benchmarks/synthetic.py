@@ -0,0 +1,118 @@
+# benchmarks/synthetic.py
+"""Generate synthetic source trees to benchmark the pipeline on.
+
+Trees are deterministic for a given seed: Python modules whose sizes follow a lognormal
+distribution (a few large modules among many small ones, as in real repositories), Jupyter
+notebooks with a fixed number of code cells, and SQL files of several statements.
+"""
+
+import json
+import os
+import random
+
+_NAMES = ["load", "parse", "score", "merge", "render", "fetch", "update", "resolve", "plan", "split"]
+_NOUNS = ["order", "user", "batch", "record", "token", "window", "report", "event", "item", "rule"]
+
+
+def _function(rng: random.Random, name: str, indent: str = "") -> list[str]:
+    args = rng.sample(["value", "items", "limit", "key", "default", "options"], rng.randint(1, 3))
+    lines = [f"{indent}def {name}({', '.join(args)}):", f"{indent}    result = []"]
+    for step in range(rng.randint(2, 8)):
+        arg = rng.choice(args)
+        if step % 3 == 0:
+            lines += [f"{indent}    for index, entry in enumerate({arg} or []):",
+                      f"{indent}        if index % {rng.randint(2, 9)} == 0:",
+                      f"{indent}            result.append((index, entry))"]
+        elif step % 3 == 1:
+            lines += [f"{indent}    if {arg} is None:", f"{indent}        {arg} = {rng.randint(0, 100)}"]
+        else:
+            lines.append(f"{indent}    result.append(str({arg})[:{rng.randint(4, 40)}])")
+    lines.append(f"{indent}    return result")
+    return lines
+
+
+def python_module(rng: random.Random, target_lines: int) -> str:
+    """An undocumented module of functions and classes, about `target_lines` long."""
+    lines = ["import os", "import json", ""]
+    count = 0
+    while len(lines) < target_lines:
+        count += 1
+        name = f"{rng.choice(_NAMES)}_{rng.choice(_NOUNS)}_{count}"
+        lines.append("")
+        if rng.random() < 0.25:
+            lines += [f"class {name.title().replace('_', '')}:", ""]
+            for method in range(rng.randint(1, 3)):
+                lines += _function(rng, f"{rng.choice(_NAMES)}_{method}", "    ") + [""]
+        else:
+            lines += _function(rng, name)
+        lines.append("")
+    return "\n".join(lines) + "\n"
+
+
+def notebook(rng: random.Random, cells: int) -> str:
+    """An nbformat 4 notebook with `cells` code cells and a Markdown title."""
+    nb_cells = [{"cell_type": "markdown", "metadata": {}, "source": "# Synthetic analysis"}]
+    for index in range(cells):
+        source = "\n".join(_function(rng, f"cell_{index}")) + f"\n\ncell_{index}(list(range({rng.randint(5, 50)})))"
+        nb_cells.append({"cell_type": "code", "execution_count": None, "metadata": {}, "outputs": [], "source": source})
+    return json.dumps({
+        "cells": nb_cells,
+        "metadata": {"language_info": {"name": "python"}},
+        "nbformat": 4,
+        "nbformat_minor": 5,
+    }, indent=1)
+
+
+def sql_file(rng: random.Random, statements: int) -> str:
+    """Several SELECT statements with joins, filters and aggregations."""
+    parts = []
+    for index in range(statements):
+        a, b = rng.sample(_NOUNS, 2)
+        parts.append(
+            f"SELECT {a}.id, COUNT({b}.id) AS {b}_count, MAX({b}.updated_at) AS last_{b}\n"
+            f"FROM {a}s AS {a}\n"
+            f"LEFT JOIN {b}s AS {b} ON {b}.{a}_id = {a}.id\n"
+            f"WHERE {a}.created_at > DATE '2024-01-{index % 28 + 1:02d}'\n"
+            f"GROUP BY {a}.id\n"
+            f"HAVING COUNT({b}.id) > {rng.randint(1, 20)};\n"
+        )
+    return "\n".join(parts)
+
+
+def make_repo(root: str, python_files: int = 100, median_lines: int = 80, notebooks: int = 5,
+              notebook_cells: int = 20, sql_files: int = 10, sql_statements: int = 4, seed: int = 0) -> dict:
+    """Write a synthetic tree under `root/src`.
+
+    Args:
+        root: Directory to create the tree in
+        python_files: Number of Python modules
+        median_lines: Median module length; lengths are lognormal around it
+        notebooks: Number of Jupyter notebooks
+        notebook_cells: Code cells per notebook
+        sql_files: Number of SQL files
+        sql_statements: Statements per SQL file
+        seed: Seed for sizes and contents
+
+    Returns:
+        dict: Files and bytes written per kind
+    """
+    rng = random.Random(seed)
+    src = os.path.join(root, "src")
+    written = {"python": 0, "notebook": 0, "sql": 0, "bytes": 0}
+
+    def emit(kind: str, relpath: str, text: str):
+        path = os.path.join(src, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        written[kind] += 1
+        written["bytes"] += len(text.encode("utf-8"))
+
+    for index in range(python_files):
+        lines = max(10, int(median_lines * rng.lognormvariate(0, 0.8)))
+        emit("python", os.path.join(f"pkg_{index % 10}", f"module_{index}.py"), python_module(rng, lines))
+    for index in range(notebooks):
+        emit("notebook", os.path.join("notebooks", f"analysis_{index}.ipynb"), notebook(rng, notebook_cells))
+    for index in range(sql_files):
+        emit("sql", os.path.join("sql", f"query_{index}.sql"), sql_file(rng, sql_statements))
+    return written
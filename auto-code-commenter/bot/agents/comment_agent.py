@@ -1,14 +1,333 @@
 # bot/agents/comment_agent.py
+import ast
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from bot.core.completion import is_truncated, join_completions
+from bot.core.usage import record_retry, timed_call
+from bot.utils.ast_verify import ast_equivalent
+from bot.utils.output_guard import STRICT_PREFIX, detect_violation, head_is_decided
+from bot.utils.notebook_cells import mark_commented, needs_commenting
+from bot.utils.sql_splitter import code_signature, has_code, is_trivial, split_statements
+from bot.utils.packing import estimate_tokens, pack_sections, plan_batches, unpack_sections
+from bot.utils.docstring_patch import MODULE_KEY, apply_patch, number_lines, parse_patch_response
+from bot.utils.python_chunks import split_module, splice_chunks, strip_code_fences
+from bot.utils.windows import plan_windows, stitch_continuation
+
+# Bump whenever the prompts below change so cached "already commented" results are invalidated
+PROMPT_VERSION = "2"
+
+# Every prompt is a fixed instruction prefix with the variable code appended last, so providers
+# with automatic prompt-prefix caching (DeepSeek, OpenAI) can reuse the whole prefix across calls.
+# Keep anything request-specific out of these strings.
+
+_PYTHON_WHOLE_PROMPT = """You are a Python expert code reviewer.
+
+Your job is to annotate the given Python source code by:
+- Inserting or updating docstrings for all functions, classes, and modules.
+- Adding helpful inline comments only where necessary (for non-obvious logic).
+- **Never** modifying or uncommenting any code (especially if it is commented out).
+- **Never** changing any logic, even if it seems broken.
+- **Never** reformatting large code sections.
+- Preserve all original indentation, spacing, and comments exactly as-is.
+
+⚠️ **Critical Output Rules**:
+- Return only the **full Python source code** with added docstrings and inline comments.
+- Do **not** change or uncomment existing `#` comments or commented-out code.
+- Do **not** output anything except the raw Python code.
+- Do **not** use Markdown (` ``` ` or `python`), no prose, no explanations.
+- If the input contains only commented-out code or blank content, return exactly the same input — unchanged.
+
+🔁 Repeat: Only return the fully annotated Python source code as plain text. No markdown. No explanations. No changes to existing logic or commented code. No blank lines removed. Do not try to fix or uncomment anything. Preserve all existing structure exactly as-is.
+
+Here is the code:
+
+"""
+
+_PYTHON_CHUNK_PROMPT = """You are a Python expert code reviewer.
+
+The code at the end is one fragment (a function, a class, or the module header) taken from a larger Python module. Annotate only this fragment by:
+- Inserting or updating docstrings for the functions and classes it contains, and a module docstring at the very top if the fragment is the module header.
+- Adding helpful inline comments only where necessary (for non-obvious logic).
+- **Never** modifying or uncommenting any code (especially if it is commented out).
+- **Never** changing any logic, even if it seems broken.
+- Preserve all original indentation, spacing, and comments exactly as-is.
+
+⚠️ **Critical Output Rules**:
+- Return only this fragment with added docstrings and inline comments — nothing from the rest of the module.
+- Do **not** output anything except the raw Python code.
+- Do **not** use Markdown (` ``` ` or `python`), no prose, no explanations.
+
+Here is the fragment, """
+
+_PYTHON_PATCH_PROMPT = f"""You are a Python expert code reviewer.
+
+Your job is to document the given Python source code, which is shown with a `N| ` line-number prefix on every line.
+Do **not** return the code. Instead return a single JSON object describing the documentation to add:
+- `"{MODULE_KEY}"`: the module docstring.
+- `"<qualified name>"` (e.g. `"parse"`, `"Parser"`, `"Parser.feed"`): the docstring for that function, method or class.
+- `"<line number>"` (e.g. `"42"`): a short inline comment for that line, only where the logic is non-obvious.
+
+⚠️ **Critical Output Rules**:
+- Docstring values contain only the docstring text, without quotes or indentation.
+- Comment values contain only the comment text, without the leading `#`.
+- Omit symbols that already have a good docstring and lines that already have a comment.
+- Output only the JSON object. No Markdown, no prose, no explanations.
+
+Here is the code:
+
+"""
+
+_PYTHON_FILES_PROMPT = """You are a Python expert code reviewer.
+
+Below are several small, independent Python source files. Each file starts with a `# <<<FILE n>>>` line and ends with a matching `# <<<END FILE n>>>` line.
+Annotate every file independently by:
+- Inserting or updating docstrings for all functions, classes, and modules.
+- Adding helpful inline comments only where necessary (for non-obvious logic).
+- **Never** modifying or uncommenting any code, and **never** changing any logic.
+- Preserve all original indentation, spacing, and comments exactly as-is.
+
+⚠️ **Critical Output Rules**:
+- Return every file, in the same order, wrapped in its original `# <<<FILE n>>>` / `# <<<END FILE n>>>` lines, unchanged.
+- Do **not** merge, split, drop or renumber files.
+- Do **not** use Markdown (` ``` ` or `python`), no prose, no explanations.
+
+Here are the files:
+
+"""
+
+_PYTHON_DEFS_PROMPT = """You are a Python expert code reviewer.
+
+Below are several top-level functions/classes from one Python module. Each starts with a `# <<<DEF n>>>` line and ends with a matching `# <<<END DEF n>>>` line.
+Annotate each one by:
+- Inserting or updating docstrings for the functions and classes it contains.
+- Adding helpful inline comments only where necessary (for non-obvious logic).
+- **Never** modifying or uncommenting any code, and **never** changing any logic.
+- Preserve all original indentation, spacing, and comments exactly as-is.
+
+⚠️ **Critical Output Rules**:
+- Return every definition, in the same order, wrapped in its original `# <<<DEF n>>>` / `# <<<END DEF n>>>` lines, unchanged.
+- Do **not** use Markdown (` ``` ` or `python`), no prose, no explanations.
+
+Here are the definitions:
+
+"""
+
+_NOTEBOOK_CELLS_PROMPT = """You are a Python expert code reviewer.
+
+Below are several code cells from one Jupyter notebook. Each cell starts with a `# <<<CELL n>>>` line and ends with a matching `# <<<END CELL n>>>` line.
+Annotate every cell independently by:
+- Adding docstrings for functions and classes defined in the cell.
+- Adding helpful inline comments only where necessary (for non-obvious logic).
+- **Never** modifying or uncommenting any code, and **never** changing any logic.
+- Preserve IPython magics (`%...`, `!...`), indentation and existing comments exactly as-is.
+
+⚠️ **Critical Output Rules**:
+- Return every cell, in the same order, wrapped in its original `# <<<CELL n>>>` / `# <<<END CELL n>>>` lines, unchanged.
+- Do **not** merge, split, drop or renumber cells.
+- Do **not** use Markdown (` ``` ` or `python`), no prose, no explanations.
+
+Here are the cells:
+
+"""
+
+_SQL_PROMPT = """You are an expert SQL code annotator.
+
+Your task is to add **concise and meaningful inline comments** to the given SQL query. Only comment on non-trivial logic such as joins, subqueries, aggregations, filters, or expressions. Do **not** comment on simple SELECTs, FROMs, or aliases unless there is useful context to add.
+
+❗️**Output Requirements**:
+- Return the SQL code as plain text only (no Markdown formatting).
+- Do NOT include code blocks (no triple backticks).
+- Do NOT add any prose, headings, or explanations before or after the SQL.
+- Keep all comments inline, using `--` after the relevant line of code.
+- Return ONLY the annotated SQL query as plain text.
+
+Here is the SQL query to annotate:
+
+"""
+
+_PYTHON_WINDOW_PROMPT = """You are a Python expert code reviewer.
+
+Below is one window of a Python module that is too large to send at once. It may start with a `# <<<CONTEXT BEFORE>>>` block: code from earlier in the module, shown for reference only. After it come top-level sections of the module, each starting with a `# <<<DEF n>>>` line and ending with a matching `# <<<END DEF n>>>` line.
+Annotate each DEF section by:
+- Inserting or updating docstrings for the functions and classes it contains, and a module docstring at the very top if the section is the module header.
+- Adding helpful inline comments only where necessary (for non-obvious logic).
+- **Never** modifying or uncommenting any code, and **never** changing any logic.
+- Preserve all original indentation, spacing, and comments exactly as-is.
+
+⚠️ **Critical Output Rules**:
+- Return every DEF section, in the same order, wrapped in its original `# <<<DEF n>>>` / `# <<<END DEF n>>>` lines, unchanged.
+- Do **not** return the CONTEXT block.
+- Do **not** use Markdown (` ``` ` or `python`), no prose, no explanations.
+
+Here is the window:
+
+"""
+
+# Appended after the original prompt (so the provider can reuse its cached prefix) when a
+# response stopped at the output token limit, followed by the response so far
+_CONTINUATION_PROMPT = """
+
+---
+Your answer to the request above was cut off at the output token limit. It is repeated below up to the point where it stopped.
+Reply with only the text that comes next, starting exactly where it stops. Do **not** repeat anything already written. No Markdown, no prose, no explanations.
+
+Your answer so far:
+
+"""
+
+# Set while an agent coroutine is driven by one of the synchronous methods
+_blocking_calls = contextvars.ContextVar("_blocking_calls", default=False)
+
+
 class CodeCommentAgent:
-    """Agent for generating comments and docstrings for various code types (Python, SQL, Jupyter notebooks)."""
+    """Agent for generating comments and docstrings for various code types (Python, SQL, Jupyter notebooks).
+
+    Each public method has an `a`-prefixed coroutine counterpart (e.g. `agenerate_comment_for_python`)
+    that calls the model's `agenerate` so a single event loop can keep many requests in flight.
+    """
     
-    def __init__(self, llm):
+    def __init__(self, llm, python_mode: str = "whole", chunk_concurrency: int = 4, notebook_batch_tokens: int = 0,
+                 stream_guard: bool = True, sql_split: bool = True, window_tokens: int = 0,
+                 max_continuations: int = 2):
         """Initialize the comment agent with an LLM instance.
         
         Args:
             llm: Language model instance used for generating comments
+            python_mode: 'whole' sends each Python file in one request, 'chunked' splits it into
+                top-level functions/classes that are commented independently and in parallel,
+                'patch' asks the model for a compact JSON patch of docstrings/comments only
+            chunk_concurrency: Maximum number of chunk (or notebook batch) requests in flight per file
+            notebook_batch_tokens: If > 0, notebook code cells are packed into requests of up to
+                this many (estimated) tokens instead of one request per cell
+            stream_guard: Stream code responses (when the model supports `generate_stream`) and
+                abort as soon as they open with a Markdown fence or prose, retrying once with
+                a stricter prompt
+            sql_split: Split SQL files into statements, skip trivial ones and annotate the rest
+                concurrently instead of sending the whole file in one request
+            window_tokens: If > 0, Python modules estimated above this many tokens are commented
+                in windows of top-level definitions instead of one request (whole mode only)
+            max_continuations: How many times a response cut off by the output token limit is
+                continued before the request is given up on
         """
         self.llm = llm
+        self.python_mode = python_mode
+        self.chunk_concurrency = max(1, chunk_concurrency)
+        self.notebook_batch_tokens = notebook_batch_tokens
+        self.stream_guard = stream_guard
+        self.sql_split = sql_split
+        self.window_tokens = window_tokens
+        self.max_continuations = max(0, max_continuations)
+
+    def _generate_code(self, prompt: str) -> str:
+        """Call the model for a code-only response, aborting early on output-rule violations.
+
+        The stream is inspected as it arrives; if it opens with a fence or prose the request
+        is cancelled, saving the rest of the generation, and retried with `STRICT_PREFIX`.
+        The retry is not guarded, so callers always get a response to post-process.
+        """
+        if not self.stream_guard or not hasattr(self.llm, "generate_stream"):
+            with timed_call():
+                return self.llm.generate(prompt)
+
+        with timed_call():
+            stream = self.llm.generate_stream(prompt)
+            pieces, head = [], ""
+            try:
+                for piece in stream:
+                    pieces.append(piece)
+                    if head is None:
+                        continue
+                    head += piece
+                    violation = detect_violation(head)
+                    if violation:
+                        print(f"⚠️  Aborting response that opened with {violation}, retrying with a stricter prompt.")
+                        break
+                    if head_is_decided(head):
+                        head = None  # opening looks fine; stop inspecting
+                else:
+                    return join_completions(pieces)
+            finally:
+                stream.close()
+        record_retry()
+        with timed_call():
+            return self.llm.generate(STRICT_PREFIX + prompt)
+
+    async def _agenerate_code(self, prompt: str) -> str:
+        """Async `_generate_code`, continuing the response if it stopped at the output token limit."""
+        return await self._acontinue(prompt, await self._agenerate_code_once(prompt))
+
+    async def _agenerate_code_once(self, prompt: str) -> str:
+        """Async `_generate_code`, using the model's `agenerate`/`agenerate_stream` when it has them.
+
+        Under a synchronous caller, or for models without `agenerate`, the blocking call runs
+        in a worker thread instead.
+        """
+        if _blocking_calls.get() or not hasattr(self.llm, "agenerate"):
+            return await asyncio.to_thread(self._generate_code, prompt)
+        if not self.stream_guard or not hasattr(self.llm, "agenerate_stream"):
+            with timed_call():
+                return await self.llm.agenerate(prompt)
+
+        with timed_call():
+            stream = self.llm.agenerate_stream(prompt)
+            pieces, head = [], ""
+            try:
+                async for piece in stream:
+                    pieces.append(piece)
+                    if head is None:
+                        continue
+                    head += piece
+                    violation = detect_violation(head)
+                    if violation:
+                        print(f"⚠️  Aborting response that opened with {violation}, retrying with a stricter prompt.")
+                        break
+                    if head_is_decided(head):
+                        head = None  # opening looks fine; stop inspecting
+                else:
+                    return join_completions(pieces)
+            finally:
+                await stream.aclose()
+        record_retry()
+        with timed_call():
+            return await self.llm.agenerate(STRICT_PREFIX + prompt)
+
+    async def _agenerate(self, prompt: str) -> str:
+        """Call the model for a free-form (non-code) response."""
+        with timed_call():
+            if _blocking_calls.get() or not hasattr(self.llm, "agenerate"):
+                return await asyncio.to_thread(self.llm.generate, prompt)
+            return await self.llm.agenerate(prompt)
+
+    async def _acontinue(self, prompt: str, response) -> str:
+        """Request continuations while `response` is cut off by the output token limit.
+
+        Continuations are free-form requests made of the original prompt, so the provider can
+        reuse its cached prefix, plus the text so far; repeated text is trimmed when stitching.
+
+        Raises:
+            RuntimeError: If the response is still cut off after `max_continuations` continuations
+        """
+        text = response
+        for _ in range(self.max_continuations):
+            if not is_truncated(response):
+                return text
+            print(f"✂️  Response hit the output token limit after {len(text)} chars, requesting a continuation.")
+            response = await self._agenerate(f"{prompt}{_CONTINUATION_PROMPT}{text}")
+            text = stitch_continuation(text, response)
+        if is_truncated(response):
+            raise RuntimeError(f"Response still cut off after {self.max_continuations} continuation(s)")
+        return text
+
+    async def _gather_limited(self, coros) -> list:
+        """Await coroutines concurrently, at most `chunk_concurrency` at a time, keeping their order."""
+        semaphore = asyncio.Semaphore(self.chunk_concurrency)
+
+        async def run(coro):
+            async with semaphore:
+                return await coro
+        return await asyncio.gather(*(run(coro) for coro in coros))
 
     def generate_comment_for_python(self, code: str) -> str:
         """Generate Python docstrings and comments for the given code.
@@ -19,64 +338,320 @@ class CodeCommentAgent:
         Returns:
             str: The original code with added docstrings and comments
         """
-        
+        return _run_sync(self.agenerate_comment_for_python(code))
+
+    async def agenerate_comment_for_python(self, code: str) -> str:
+        """Async version of `generate_comment_for_python`."""
+        # Chunked mode already splits the module, and patch responses stay small however large the
+        # module is; only modes that echo the whole code need windows
+        if self.window_tokens and self.python_mode == "whole" and estimate_tokens(code) > self.window_tokens:
+            return await self.agenerate_comment_for_python_windowed(code)
+        if self.python_mode == "chunked":
+            return await self.agenerate_comment_for_python_chunked(code)
+        if self.python_mode == "patch":
+            return await self.agenerate_comment_for_python_patch(code)
+        return await self._comment_python_whole(code)
+
+    def generate_comment_for_python_patch(self, code: str) -> str:
+        """Ask the model for docstring/comment edits as JSON and apply them locally.
+
+        The model never reproduces the source, so output tokens only scale with the amount of
+        documentation added and the code itself cannot be altered. If the response cannot be
+        decoded the code is returned unchanged; code that cannot be parsed (e.g. notebook cells
+        with magics) falls back to a whole-file request.
+
+        Args:
+            code: Python source code to be commented
 
-        prompt = f"""
-        You are a Python expert code reviewer.
+        Returns:
+            str: The code with the returned docstrings and inline comments inserted
+        """
+        return _run_sync(self.agenerate_comment_for_python_patch(code))
 
-        Your job is to annotate the given Python source code by:
-        - Inserting or updating docstrings for all functions, classes, and modules.
-        - Adding helpful inline comments only where necessary (for non-obvious logic).
-        - **Never** modifying or uncommenting any code (especially if it is commented out).
-        - **Never** changing any logic, even if it seems broken.
-        - **Never** reformatting large code sections.
-        - Preserve all original indentation, spacing, and comments exactly as-is.
+    async def agenerate_comment_for_python_patch(self, code: str) -> str:
+        """Async version of `generate_comment_for_python_patch`."""
+        try:
+            ast.parse(code)
+        except SyntaxError:
+            return await self._comment_python_whole(code)
 
-        ⚠️ **Critical Output Rules**:
-        - Return only the **full Python source code** with added docstrings and inline comments.
-        - Do **not** change or uncomment existing `#` comments or commented-out code.
-        - Do **not** output anything except the raw Python code.
-        - Do **not** use Markdown (` ``` ` or `python`), no prose, no explanations.
-        - If the input contains only commented-out code or blank content, return exactly the same input — unchanged.
+        prompt = _PYTHON_PATCH_PROMPT + number_lines(code)
+        try:
+            patch = parse_patch_response(await self._acontinue(prompt, await self._agenerate(prompt)))
+            patched = apply_patch(code, patch)
+            ast.parse(patched)
+        except Exception as e:
+            print(f"⚠️  Could not apply docstring patch, keeping code unchanged: {e}")
+            return code
+        return patched
 
-        Here is the code:
+    def generate_comment_for_python_chunked(self, code: str) -> str:
+        """Comment a module one top-level function/class at a time and splice the results back.
 
-        {code}
+        Each chunk is sent in its own request and the requests run in parallel, so output size
+        per request stays small and latency is bounded by the slowest chunk. Chunks whose
+        response is not valid Python are left unchanged. Falls back to a whole-file request if
+        the module cannot be parsed or has nothing worth splitting.
+
+        Args:
+            code: Python source code to be commented
 
-        🔁 Repeat: Only return the fully annotated Python source code as plain text. No markdown. No explanations. No changes to existing logic or commented code. No blank lines removed. Do not try to fix or uncomment anything. Preserve all existing structure exactly as-is.
+        Returns:
+            str: The code with added docstrings and comments
         """
+        return _run_sync(self.agenerate_comment_for_python_chunked(code))
+
+    async def agenerate_comment_for_python_chunked(self, code: str) -> str:
+        """Async version of `generate_comment_for_python_chunked`."""
+        try:
+            chunks = split_module(code)
+        except SyntaxError:
+            return await self._comment_python_whole(code)
+
+        targets = [i for i, chunk in enumerate(chunks) if chunk.has_code]
+        if len(targets) < 2:
+            return await self._comment_python_whole(code)
+
+        results = await self._gather_limited(self._comment_python_chunk(chunks[i]) for i in targets)
+        replacements = {i: text for i, text in zip(targets, results) if text is not None}
+        return splice_chunks(chunks, replacements)
+
+    def generate_comment_for_python_windowed(self, code: str) -> str:
+        """Comment a module too large for one request in windows of whole top-level definitions.
+
+        Windows are filled up to `window_tokens` and sent in parallel, each with the module
+        header and the code just before it as read-only context. Only each window's own
+        definitions are taken from its response, so the overlap is never duplicated, and a
+        definition whose response is missing or does not parse keeps its original text.
+        Falls back to a whole-file request if the module cannot be parsed or fits one window.
+
+        Args:
+            code: Python source code to be commented
+
+        Returns:
+            str: The code with added docstrings and comments
+        """
+        return _run_sync(self.agenerate_comment_for_python_windowed(code))
+
+    async def agenerate_comment_for_python_windowed(self, code: str) -> str:
+        """Async version of `generate_comment_for_python_windowed`."""
+        try:
+            chunks = split_module(code)
+        except SyntaxError:
+            return await self._comment_python_whole(code)
+
+        windows = plan_windows(chunks, self.window_tokens, self.window_tokens // 8)
+        if len(windows) < 2:
+            return await self._comment_python_whole(code)
+        print(f"🪟 Module is ~{estimate_tokens(code)} tokens, commenting it in {len(windows)} windows.")
+        replacements = {}
+        for result in await self._gather_limited(self._comment_python_window(chunks, w) for w in windows):
+            replacements.update(result)
+        return splice_chunks(chunks, replacements)
+
+    def generate_comment_for_python_files(self, sources: list[str]) -> list:
+        """Comment several small Python files in a single request.
+
+        Files are packed with `# <<<FILE n>>>` delimiters and the response is split back per
+        file. A file whose section is missing or does not parse is returned as None so the
+        caller can fall back to a solo request.
+
+        Args:
+            sources: Source code of each file
+
+        Returns:
+            list[str|None]: Commented source per file, in the same order
+        """
+        return _run_sync(self.agenerate_comment_for_python_files(sources))
+
+    async def agenerate_comment_for_python_files(self, sources: list[str]) -> list:
+        """Async version of `generate_comment_for_python_files`."""
+        prompt = _PYTHON_FILES_PROMPT + pack_sections(list(enumerate(sources)), "FILE")
+        try:
+            unpacked = unpack_sections(await self._agenerate_code(prompt), "FILE")
+        except Exception as e:
+            print(f"⚠️  Packed request failed, files will be sent individually: {e}")
+            return [None] * len(sources)
+
+        results = []
+        for index, source in enumerate(sources):
+            commented = unpacked.get(str(index))
+            if commented is not None and not _parses(commented):
+                commented = None
+            results.append(commented)
+        return results
+
+    def generate_comment_for_python_symbols(self, code: str, names: list[str]) -> str:
+        """Comment only the named top-level functions/classes of a partially documented module.
+
+        The selected definitions are packed into a single request (or sent alone if there is
+        just one); everything else is left exactly as-is. Definitions whose response is missing
+        or changes logic keep their original text.
+
+        Args:
+            code: Python source code
+            names: Top-level definition names to send
+
+        Returns:
+            str: The code with the selected definitions commented
+        """
+        return _run_sync(self.agenerate_comment_for_python_symbols(code, names))
+
+    async def agenerate_comment_for_python_symbols(self, code: str, names: list[str]) -> str:
+        """Async version of `generate_comment_for_python_symbols`."""
+        chunks = split_module(code)
+        targets = [i for i, c in enumerate(chunks) if c.kind in ("function", "class") and c.name in names]
+        if not targets:
+            return code
+        if len(targets) == 1:
+            text = await self._comment_python_chunk(chunks[targets[0]])
+            return splice_chunks(chunks, {targets[0]: text} if text is not None else {})
 
-        response = self.llm.generate(prompt)
+        # Selected definitions of an oversized module are split into window-sized requests
+        sections = [(i, chunks[i].source) for i in targets]
+        groups = plan_batches(sections, self.window_tokens) if self.window_tokens else [sections]
+        replacements = {}
+        for result in await self._gather_limited(self._comment_python_defs(chunks, group) for group in groups):
+            replacements.update(result)
+        return splice_chunks(chunks, replacements)
+
+    async def _comment_python_defs(self, chunks, sections: list[tuple]) -> dict:
+        """Comment packed `(chunk index, source)` definitions, keeping only logic-preserving results."""
+        prompt = _PYTHON_DEFS_PROMPT + pack_sections(sections, "DEF")
+        try:
+            unpacked = unpack_sections(await self._agenerate_code(prompt), "DEF")
+        except Exception as e:
+            print(f"⚠️  Could not comment selected definitions, keeping them unchanged: {e}")
+            return {}
+
+        replacements = {}
+        for index, _ in sections:
+            text = unpacked.get(str(index))
+            try:
+                if text is not None and ast_equivalent(chunks[index].source, text):
+                    replacements[index] = text
+            except SyntaxError:
+                pass
+        return replacements
+
+    def repair_definitions(self, original: str, updated: str, ordinals: list[int]) -> str:
+        """Re-request only the top-level definitions the model changed and splice them back.
+
+        Each listed definition is commented again from its original source, in parallel. A
+        retry that still alters the logic is replaced by the untouched original definition,
+        so the result is guaranteed to match the original outside of docstrings and comments.
+
+        Args:
+            original: Source before commenting
+            updated: Commented source whose definitions at `ordinals` differ from the original
+            ordinals: 0-based positions of the offending top-level functions/classes
+
+        Returns:
+            str: `updated` with the offending definitions replaced
+        """
+        return _run_sync(self.arepair_definitions(original, updated, ordinals))
+
+    async def arepair_definitions(self, original: str, updated: str, ordinals: list[int]) -> str:
+        """Async version of `repair_definitions`."""
+        definition_kinds = ("function", "class")
+        original_defs = [c for c in split_module(original) if c.kind in definition_kinds]
+        updated_chunks = split_module(updated)
+        updated_positions = [i for i, c in enumerate(updated_chunks) if c.kind in definition_kinds]
+
+        async def retry(ordinal):
+            chunk = original_defs[ordinal]
+            text = await self._comment_python_chunk(chunk)
+            if text is None or not ast_equivalent(chunk.source, text):
+                print(f"⚠️  Retry for {chunk.label} still changed its logic, keeping the original.")
+                return chunk.source
+            return text
+
+        results = await self._gather_limited(retry(ordinal) for ordinal in ordinals)
+        replacements = {updated_positions[o]: text for o, text in zip(ordinals, results)}
+        return splice_chunks(updated_chunks, replacements)
+
+    async def _comment_python_chunk(self, chunk):
+        """Comment a single chunk, returning None if the call fails or the output does not parse."""
+        prompt = f"{_PYTHON_CHUNK_PROMPT}{chunk.label}:\n\n{chunk.source}"
+        try:
+            response = strip_code_fences(await self._agenerate_code(prompt))
+            ast.parse(response)
+        except Exception as e:
+            print(f"⚠️  Could not comment {chunk.label}, keeping it unchanged: {e}")
+            return None
+        return response
+
+    async def _comment_python_window(self, chunks, window) -> dict:
+        """Comment one window, returning `{chunk index: text}` for the owned chunks that parse."""
+        context = pack_sections([("BEFORE", window.context)], "CONTEXT") if window.context else ""
+        sections = pack_sections([(i, chunks[i].source) for i in window.indexes], "DEF")
+        try:
+            unpacked = unpack_sections(await self._agenerate_code(_PYTHON_WINDOW_PROMPT + context + sections), "DEF")
+        except Exception as e:
+            labels = ", ".join(chunks[i].label for i in window.indexes)
+            print(f"⚠️  Could not comment window ({labels}), keeping it unchanged: {e}")
+            return {}
+        replacements = {}
+        for index in window.indexes:
+            text = unpacked.get(str(index))
+            if text is not None and _parses(text):
+                replacements[index] = text
+        return replacements
+
+    async def _comment_python_whole(self, code: str) -> str:
+        """Send a whole Python source in one request and return the annotated code."""
+        prompt = _PYTHON_WHOLE_PROMPT + code
+        response = await self._agenerate_code(prompt)
         return response
 
     def generate_comment_for_sql(self, code: str) -> str:
         """Generate SQL comments for the given query.
         
+        With `sql_split`, the file is split into statements by a local tokenizer that respects
+        strings, comments and dollar-quoting. Trivial statements are left alone and the rest are
+        annotated concurrently, then reassembled in order. An annotated statement whose code
+        differs from the original (ignoring comments and whitespace) is kept unannotated.
+
         Args:
             code: SQL query to be commented
             
         Returns:
             str: The original SQL with added comments
         """
-        prompt = f"""
-        You are an expert SQL code annotator.
+        return _run_sync(self.agenerate_comment_for_sql(code))
 
-        Your task is to add **concise and meaningful inline comments** to the given SQL query. Only comment on non-trivial logic such as joins, subqueries, aggregations, filters, or expressions. Do **not** comment on simple SELECTs, FROMs, or aliases unless there is useful context to add.
+    async def agenerate_comment_for_sql(self, code: str) -> str:
+        """Async version of `generate_comment_for_sql`."""
+        if not self.sql_split:
+            return await self._comment_sql_statement(code)
 
-        ❗️**Output Requirements**:
-        - Return the SQL code as plain text only (no Markdown formatting).
-        - Do NOT include code blocks (no triple backticks).
-        - Do NOT add any prose, headings, or explanations before or after the SQL.
-        - Keep all comments inline, using `--` after the relevant line of code.
+        statements = split_statements(code)
+        targets = [i for i, stmt in enumerate(statements) if has_code(stmt) and not is_trivial(stmt)]
+        if not targets:
+            return code
 
-        Here is the SQL query to annotate:
+        async def annotate(index):
+            statement = statements[index]
+            core = statement.strip()
+            try:
+                commented = strip_code_fences(await self._comment_sql_statement(core)).strip()
+            except Exception as e:
+                print(f"⚠️  Could not annotate SQL statement {index + 1}, keeping it unchanged: {e}")
+                return statement
+            if code_signature(commented) != code_signature(core):
+                print(f"⚠️  Annotation changed SQL statement {index + 1}, keeping it unchanged.")
+                return statement
+            lead = len(statement) - len(statement.lstrip())
+            return statement[:lead] + commented + statement[len(statement.rstrip()):]
 
-        {code}
+        for index, annotated in zip(targets, await self._gather_limited(annotate(i) for i in targets)):
+            statements[index] = annotated
+        return "".join(statements)
 
-        Now return ONLY the annotated SQL query as plain text.
-        """
-    
-        response = self.llm.generate(prompt)
+    async def _comment_sql_statement(self, code: str) -> str:
+        """Send SQL to the model in one request and return the annotated SQL."""
+        prompt = _SQL_PROMPT + code
+        response = await self._agenerate_code(prompt)
         return response
     
     def generate_comment_for_ipynb(self, nb_node) -> dict:
@@ -87,10 +662,95 @@ class CodeCommentAgent:
             
         Returns:
             dict: Modified notebook with commented code cells
+
+        Markdown cells, empty cells, cells made only of magics/shell escapes and cells whose
+        hash matches the one stored in their metadata after the last run are skipped, so
+        editing one cell costs exactly one LLM call.
         """
+        return _run_sync(self.agenerate_comment_for_ipynb(nb_node))
+
+    async def agenerate_comment_for_ipynb(self, nb_node) -> dict:
+        """Async version of `generate_comment_for_ipynb`; cells are commented concurrently."""
         modified_nb = nb_node.copy()
-        for cell in modified_nb.cells:
-            if cell.cell_type == 'code' and cell.source.strip():  # Only process non-empty code cells
-                commented_code = self.generate_comment_for_python(cell.source)
-                cell.source = commented_code
-        return modified_nb
\ No newline at end of file
+        targets = [i for i, cell in enumerate(modified_nb.cells) if needs_commenting(cell, PROMPT_VERSION)]
+        if self.notebook_batch_tokens > 0:
+            await self._comment_ipynb_batched(modified_nb, targets)
+        else:
+            sources = [modified_nb.cells[index].source for index in targets]
+            results = await self._gather_limited(self.agenerate_comment_for_python(source) for source in sources)
+            for index, commented in zip(targets, results):
+                modified_nb.cells[index].source = commented
+        for index in targets:
+            mark_commented(modified_nb.cells[index], PROMPT_VERSION)
+        return modified_nb
+
+    async def _comment_ipynb_batched(self, nb_node, targets: list[int]):
+        """Comment code cells in batches of up to `notebook_batch_tokens` tokens per request.
+
+        Cells are packed with stable `# <<<CELL n>>>` delimiters (n is the cell index) and the
+        response is split back per cell. Cells missing from the response, or whose commented
+        version no longer parses when the original did, are retried with a single-cell request.
+        """
+        sections = [(index, nb_node.cells[index].source) for index in targets]
+        batches = plan_batches(sections, self.notebook_batch_tokens)
+        results = await self._gather_limited(self._comment_cell_batch(batch) for batch in batches)
+
+        for batch, commented in zip(batches, results):
+            for index, source in batch:
+                updated = commented.get(str(index))
+                if updated is None:
+                    updated = await self.agenerate_comment_for_python(source)
+                elif not source.endswith("\n"):
+                    updated = updated.rstrip("\n")
+                nb_node.cells[index].source = updated
+
+    async def _comment_cell_batch(self, batch: list[tuple]) -> dict:
+        """Comment a batch of notebook cells in one request, returning `{cell index: source}`.
+
+        Only cells that came back intact are included in the result.
+        """
+        if len(batch) == 1:
+            return {str(batch[0][0]): await self.agenerate_comment_for_python(batch[0][1])}
+
+        prompt = _NOTEBOOK_CELLS_PROMPT + pack_sections(batch, "CELL")
+        try:
+            unpacked = unpack_sections(await self._agenerate_code(prompt), "CELL")
+        except Exception as e:
+            print(f"⚠️  Notebook batch request failed, retrying cells individually: {e}")
+            return {}
+
+        results = {}
+        for index, source in batch:
+            commented = unpacked.get(str(index))
+            if commented is None or (_parses(source) and not _parses(commented)):
+                continue
+            results[str(index)] = commented
+        return results
+
+
+def _parses(code: str) -> bool:
+    """Return True if `code` is syntactically valid Python."""
+    try:
+        ast.parse(code)
+    except SyntaxError:
+        return False
+    return True
+
+
+def _run_sync(coro):
+    """Run an agent coroutine to completion for a synchronous caller.
+
+    Model calls inside it use the blocking `generate` in worker threads, so provider async
+    clients are never shared between the short-lived event loops created here.
+    """
+    async def runner():
+        _blocking_calls.set(True)
+        return await coro
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(runner())
+    # Called from inside a running loop (e.g. Jupyter): drive the coroutine on another thread
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, runner()).result()
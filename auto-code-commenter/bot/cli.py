@@ -1,5 +1,6 @@
 # bot/cli.py
 import argparse
+from bot.client import DEFAULT_IDLE_TIMEOUT
 from bot.pipeline import run_commenting_pipeline
 from bot.utils.config_loader import load_config
 
@@ -23,10 +24,26 @@ def main():
     parser.add_argument(
         "--src", nargs="+", default=["./src"], help="Source code folder(s). Space-separated."
     )
+    parser.add_argument(
+        "--files", nargs="*", default=None,
+        help="Only process these files (must live under --src / config include). Space-separated."
+    )
+
+    # Warm daemon for the pre-commit hook (see bot/client.py)
+    parser.add_argument("--daemon", action="store_true",
+                        help="Serve comment requests on a Unix socket, keeping models and imports warm")
+    parser.add_argument("--socket", help="Daemon socket path (default: derived from the current directory)")
+    parser.add_argument("--idle-timeout", type=int, default=DEFAULT_IDLE_TIMEOUT,
+                        help="Seconds the daemon stays up without requests")
 
 
     args = parser.parse_args()
 
+    if args.daemon:
+        from bot.daemon import serve
+        serve(args.socket, args.idle_timeout)
+        return
+
     config = load_config(args.config) if args.config else None
 
     # Only override if provider is passed (so config fallback works)
@@ -50,7 +67,8 @@ def main():
     run_commenting_pipeline(
         config=config,
         model_name=args.model_name,  # fallback for legacy
-        src_folder=args.src
+        src_folder=args.src,
+        only_files=args.files,
     )
 
 if __name__ == "__main__":
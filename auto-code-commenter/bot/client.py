@@ -0,0 +1,132 @@
+# bot/client.py
+"""Thin pre-commit client for the commenter daemon.
+
+The hook runs `comment-code-client <staged files>`. This module imports only the standard
+library, so the hook starts in milliseconds; the heavy lifting happens in the warm daemon
+(`python -m bot.cli --daemon`), which the client starts in the background on first use.
+If the daemon cannot be reached, the files are commented in-process instead.
+
+Unix sockets are required, so the daemon is not available on Windows.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+DEFAULT_START_TIMEOUT = 30.0
+DEFAULT_IDLE_TIMEOUT = 1800
+
+
+def default_socket_path(root: str) -> str:
+    """Socket path for a repository root.
+
+    Lives in the temp dir rather than the repo because socket paths are limited to ~100 bytes.
+    """
+    digest = hashlib.sha256(os.path.abspath(root).encode()).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f"auto-code-commenter-{os.getuid()}-{digest}.sock")
+
+
+def _connect(path: str):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def spawn_daemon(path: str, idle_timeout: int = DEFAULT_IDLE_TIMEOUT, start_timeout: float = DEFAULT_START_TIMEOUT):
+    """Start a detached daemon on `path` and wait until it accepts connections.
+
+    Returns:
+        socket.socket|None: A connection to the new daemon, or None if it did not come up in time
+    """
+    # Make sure the daemon can import `bot` however this client was started
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [package_root, env.get("PYTHONPATH")]))
+    with open(f"{path}.log", "ab") as log:
+        subprocess.Popen(
+            [sys.executable, "-m", "bot.cli", "--daemon", "--socket", path, "--idle-timeout", str(idle_timeout)],
+            stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT, env=env, start_new_session=True,
+        )
+    deadline = time.monotonic() + start_timeout
+    while time.monotonic() < deadline:
+        try:
+            return _connect(path)
+        except OSError:
+            time.sleep(0.1)
+    return None
+
+
+def send_request(sock, request: dict) -> int:
+    """Send one request and echo the daemon's output as it streams back.
+
+    Returns:
+        int: The run's exit code (1 if the daemon hung up before reporting one)
+    """
+    with sock, sock.makefile("rwb") as stream:
+        stream.write((json.dumps(request) + "\n").encode())
+        stream.flush()
+        for line in stream:
+            message = json.loads(line)
+            if "out" in message:
+                sys.stdout.write(message["out"])
+                sys.stdout.flush()
+            elif "exit" in message:
+                return int(message["exit"])
+    print("❌ Commenter daemon closed the connection before finishing.")
+    return 1
+
+
+def _run_in_process(request: dict) -> int:
+    # Only imported on this fallback path so the normal hook run stays light
+    from bot.pipeline import run_commenting_pipeline
+    from bot.utils.config_loader import load_config
+
+    config = load_config(request["config"]) if request.get("config") else None
+    run_commenting_pipeline(config=config, src_folder=request["src"], only_files=request["files"])
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Comment staged files through the warm commenter daemon")
+    parser.add_argument("files", nargs="*", help="Files to comment (pre-commit passes the staged ones)")
+    parser.add_argument("--config", help="YAML config file path")
+    parser.add_argument("--src", nargs="+", default=["./src"], help="Source code folder(s). Space-separated.")
+    parser.add_argument("--socket", help="Daemon socket path (default: derived from the current directory)")
+    parser.add_argument("--idle-timeout", type=int, default=DEFAULT_IDLE_TIMEOUT,
+                        help="Seconds a spawned daemon stays up without requests")
+    parser.add_argument("--no-spawn", action="store_true", help="Do not start a daemon if none is running")
+    args = parser.parse_args(argv)
+
+    if not args.files:
+        return 0  # nothing staged that the hook cares about
+
+    request = {
+        "cwd": os.getcwd(),
+        "config": os.path.abspath(args.config) if args.config else None,
+        "src": args.src,
+        "files": args.files,
+    }
+    path = args.socket or default_socket_path(os.getcwd())
+    try:
+        sock = _connect(path)
+    except OSError:
+        sock = None if args.no_spawn else spawn_daemon(path, args.idle_timeout)
+
+    if sock is None:
+        print("⚠️ Commenter daemon unavailable, running in-process.")
+        return _run_in_process(request)
+    return send_request(sock, request)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,44 @@
+# bot/core/completion.py
+"""Model output text that remembers why generation stopped.
+
+Wrappers return `Completion` (a `str`) instead of plain text so callers that only want the text
+are unaffected, while the agent can tell a response cut off by the output token limit from a
+finished one and ask for a continuation instead of writing a truncated file.
+"""
+
+# Finish reasons meaning "stopped at the output token limit" across providers
+# (OpenAI/DeepSeek "length", Anthropic/Bedrock "max_tokens", Bedrock Titan "LENGTH")
+TRUNCATED_REASONS = ("length", "max_tokens", "LENGTH")
+
+
+class Completion(str):
+    """Generated text plus the provider's finish reason (None when unknown)."""
+    finish_reason = None
+
+    def __new__(cls, text: str = "", finish_reason: str = None):
+        completion = super().__new__(cls, text or "")
+        completion.finish_reason = finish_reason
+        return completion
+
+    @property
+    def truncated(self) -> bool:
+        return self.finish_reason in TRUNCATED_REASONS
+
+
+def completion_from_message(message) -> Completion:
+    """Wrap a LangChain message or chunk, reading `finish_reason`/`stop_reason` from its metadata."""
+    metadata = getattr(message, "response_metadata", None) or {}
+    return Completion(message.content, metadata.get("finish_reason") or metadata.get("stop_reason"))
+
+
+def join_completions(pieces) -> Completion:
+    """Concatenate streamed pieces, keeping the last finish reason any of them reported."""
+    finish_reason = None
+    for piece in pieces:
+        finish_reason = getattr(piece, "finish_reason", None) or finish_reason
+    return Completion("".join(pieces), finish_reason)
+
+
+def is_truncated(text) -> bool:
+    """True if `text` is a `Completion` that stopped at the output token limit."""
+    return bool(getattr(text, "truncated", False))
@@ -0,0 +1,165 @@
+# bot/core/hedging.py
+"""Hedged requests across an ordered list of providers.
+
+The primary provider gets every request first. If it has not answered within its rolling
+p95 latency, the same request is also sent to the next provider; whichever answers first
+wins and the other request is cancelled. A provider that fails outright is replaced by
+the next one immediately.
+"""
+
+import asyncio
+import contextvars
+import functools
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from bot.core.usage import add_queued_seconds, queued_seconds, record_retry
+
+# Blocking `generate` calls run here rather than in the event loop's default executor, so a
+# losing request left running in its thread does not hold up `asyncio.run` on shutdown.
+_executor = ThreadPoolExecutor(thread_name_prefix="hedge")
+
+
+class LatencyTracker:
+    """Rolling window of request latencies.
+
+    Args:
+        window: Number of recent latencies kept
+    """
+    def __init__(self, window: int = 200):
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, p: float):
+        """Return the `p`-th percentile (0-100) of the window, or None if it is empty."""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+class HedgedModel:
+    """Sends each request to the first provider and hedges to the next one on slow responses.
+
+    Streaming is not hedged: the wrapper only exposes `generate`/`agenerate`, so callers use
+    whole responses.
+
+    Args:
+        models: Model wrappers in order of preference
+        names: Display names for the models, used in logs
+        percentile: Latency percentile of the primary after which a hedge is fired
+        window: Number of recent primary latencies the percentile is computed over
+        min_samples: Latencies needed before the percentile is trusted
+        initial_delay: Hedge delay in seconds until `min_samples` latencies are known
+        min_delay: Lower bound on the hedge delay, so fast providers are not hedged constantly
+
+    Attributes:
+        hedges_fired (int): Duplicate requests sent because the primary was slow
+        hedges_won (int): Hedged requests that answered before the request they duplicated
+        fallbacks (int): Requests moved to the next provider because one failed
+    """
+    def __init__(self, models: list, names: list = None, percentile: float = 95, window: int = 200,
+                 min_samples: int = 20, initial_delay: float = 60.0, min_delay: float = 2.0):
+        self.models = models
+        self.names = names or [type(m).__name__ for m in models]
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.primary_latency = LatencyTracker(window)
+        self.hedges_fired = 0
+        self.hedges_won = 0
+        self.fallbacks = 0
+
+    def hedge_delay(self) -> float:
+        """Seconds to wait on the primary before firing a hedge."""
+        if len(self.primary_latency.samples) < self.min_samples:
+            return self.initial_delay
+        return max(self.min_delay, self.primary_latency.percentile(self.percentile))
+
+    async def _call(self, index: int, prompt: str, blocking: bool):
+        """Call one provider; returns its response and the time it queued in our rate limiter."""
+        model = self.models[index]
+        started = time.monotonic()
+        # Time queued in our own rate limiter says nothing about the provider, so it is left out
+        # of the latency samples; otherwise local throttling would fire more hedges
+        context = None if not blocking and hasattr(model, "agenerate") else contextvars.copy_context()
+        queued_before = queued_seconds(context)
+
+        def provider_latency():
+            return time.monotonic() - started - (queued_seconds(context) - queued_before)
+        try:
+            if context is None:
+                result = await model.agenerate(prompt)
+            else:
+                # Run in the copied context so usage scopes still see the call (run_in_executor does not)
+                call = functools.partial(context.run, model.generate, prompt)
+                result = await asyncio.get_running_loop().run_in_executor(_executor, call)
+        except asyncio.CancelledError:
+            # A cancelled primary was at least this slow; keep it so the tail is not forgotten
+            if index == 0:
+                self.primary_latency.record(provider_latency())
+            raise
+        if index == 0:
+            self.primary_latency.record(provider_latency())
+        return result, queued_seconds(context) - queued_before
+
+    async def _hedge(self, prompt: str, blocking: bool):
+        pending, reasons = set(), {}
+        last_error = None
+
+        def launch(reason):
+            task = asyncio.ensure_future(self._call(len(reasons), prompt, blocking))
+            reasons[task] = reason
+            pending.add(task)
+
+        launch("primary")
+        try:
+            while pending:
+                more = len(reasons) < len(self.models)
+                done, pending = await asyncio.wait(pending, timeout=self.hedge_delay() if more else None,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.hedges_fired += 1
+                    print(f"⏳ {self.names[len(reasons) - 1]} is slow, hedging to {self.names[len(reasons)]}.")
+                    launch("hedge")
+                    continue
+                for task in done:
+                    if task.exception() is None:
+                        if reasons[task] == "hedge":
+                            self.hedges_won += 1
+                        return task.result()
+                    last_error = task.exception()
+                if not pending and len(reasons) < len(self.models):
+                    self.fallbacks += 1
+                    print(f"🔁 Provider failed ({last_error}), falling back to {self.names[len(reasons)]}.")
+                    record_retry()
+                    launch("fallback")
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def agenerate(self, prompt: str):
+        """Generate a response, hedging to the next provider if the primary is slow."""
+        result, queued = await self._hedge(prompt, blocking=False)
+        add_queued_seconds(queued)  # the winner queued in its own task; charge it to our caller
+        return result
+
+    def generate(self, prompt: str):
+        """Blocking `agenerate`; model calls run in threads and a losing call is abandoned."""
+        result, queued = asyncio.run(self._hedge(prompt, blocking=True))
+        add_queued_seconds(queued)
+        return result
+
+    def timing_summary(self) -> str:
+        """One-line summary of hedging activity."""
+        p = self.primary_latency.percentile(self.percentile)
+        p_text = f"{p:.1f}s" if p is not None else "n/a"
+        return (
+            f"hedging {' → '.join(self.names)} p{self.percentile:g}={p_text} "
+            f"hedges fired={self.hedges_fired} won={self.hedges_won} fallbacks={self.fallbacks}"
+        )
@@ -1,57 +1,159 @@
 # app/core/models.py
+"""Model factory backed by a lazy provider registry.
+
+Provider modules (and the SDKs they wrap) are imported only when a config selects their
+`type`, so a DeepSeek-only run never loads `langchain_aws`. Third-party packages add
+providers through the `auto_code_commenter.providers` entry point group, each entry point
+naming a factory that takes the model config dict and returns a wrapper with `generate`::
+
+    [project.entry-points."auto_code_commenter.providers"]
+    mistral = "my_package.models:create_mistral_model"
+"""
 import os
-from bot.core.models_openai import OpenAIModel
-from bot.core.models_deepseek import DeepSeekModel
-from bot.core.models_bedrock import get_bedrock_model
+from importlib.metadata import entry_points
+
+from bot.core.rate_limit import RateLimitedModel, get_rate_controller
+from bot.core.hedging import HedgedModel
+
+ENTRY_POINT_GROUP = "auto_code_commenter.providers"
+
+
+def _openai(config):
+    from bot.core.models_openai import OpenAIModel
+    return OpenAIModel(
+        model_name=config.get("model_name"),
+        temperature=config.get("temperature", 0),
+        credentials=config.get("credentials", {}),
+        additional_params=config.get("additional_params", {}),
+    )
+
+
+def _deepseek(config):
+    from bot.core.models_deepseek import DeepSeekModel
+    return DeepSeekModel(
+        model_name=config.get("model_name"),
+        temperature=config.get("temperature", 0),
+        credentials=config.get("credentials", {}),
+    )
+
+
+def _bedrock(config):
+    from bot.core.models_bedrock import get_bedrock_model
+    return get_bedrock_model(config)
+
+
+def _custom(config):
+    from bot.core.models_custom import CustomModel
+    return CustomModel(config)
+
+
+def _local(config):
+    from bot.core.models_local import LocalModel
+    return LocalModel(config)
+
+
+def _replay(config):
+    from bot.core.models_replay import DEFAULT_CASSETTE, ReplayModel
+    upstream = config.get("upstream")
+    return ReplayModel(
+        cassette=config.get("cassette", DEFAULT_CASSETTE),
+        on_miss=config.get("on_miss", "passthrough" if upstream else "fail"),
+        upstream=get_model_instance(upstream) if upstream else None,
+    )
 
-# Add imports for other provider model wrappers here
 
-def get_model_instance(config: dict):
+# Provider type -> factory(config). Add built-in provider wrappers here (google_gemini and
+# groq are not implemented yet). "huggingface" runs a GGUF model from the Hub locally.
+_PROVIDERS = {
+    "openai": _openai,
+    "deepseek": _deepseek,
+    "bedrock": _bedrock,
+    "custom": _custom,
+    "local": _local,
+    "huggingface": _local,
+    "replay": _replay,
+}
+
+# Wrappers that make no requests of their own; the models they wrap are rate limited instead
+_UNLIMITED_PROVIDERS = {"replay"}
+
+
+def register_provider(provider_type: str, factory):
+    """Register (or replace) the factory used for a provider `type`.
+
+    Args:
+        provider_type: Value of `provider.type` in the model config
+        factory: Callable taking the model config dict and returning a model wrapper
+    """
+    _PROVIDERS[provider_type] = factory
+
+
+def _entry_point_factory(provider_type: str):
+    """Load a provider factory from installed entry points, or None if none is registered."""
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        if entry_point.name == provider_type:
+            return entry_point.load()
+    return None
+
+
+def available_providers() -> list[str]:
+    """Built-in, registered and entry point provider types (entry points are listed, not loaded)."""
+    return sorted(set(_PROVIDERS) | {entry_point.name for entry_point in entry_points(group=ENTRY_POINT_GROUP)})
+
+
+def get_model_instance(config):
     """Factory function to create and return an appropriate model instance based on configuration.
     
     Args:
-        config (dict): Configuration dictionary containing:
+        config (dict|list[dict]): Configuration dictionary, or a list of them ordered by
+            preference to hedge slow requests and fall back on errors across providers.
+            Each dictionary contains:
             - provider: Dictionary with 'type' key specifying the model provider
             - model_name: Name of the model to use
             - temperature: Temperature parameter for model generation
             - credentials: Provider-specific authentication credentials
             - additional_params: Any additional model parameters
+            - rate_limit: Optional dict of `RateController` settings (requests_per_minute,
+              tokens_per_minute, initial_concurrency, max_concurrency, max_retries), or
+              false to disable client-side rate limiting
+            - hedge: Optional dict of `HedgedModel` settings (percentile, window, min_samples,
+              initial_delay, min_delay), only read from the first entry of a list
+            - cassette, on_miss, upstream: `replay` provider settings; `upstream` is the model
+              config used to record misses (see `models_replay`)
     
     Returns:
-        An instance of the requested model provider's wrapper class
+        An instance of the requested model provider's wrapper class, wrapped in a
+        `RateLimitedModel` shared with every other instance of the same provider; for a
+        list of providers, a `HedgedModel` over those instances
     
     Raises:
         ValueError: If the provider type is not supported
     """
-    provider_cfg = config.get("provider", {})
-    provider_type = provider_cfg.get("type")
-
-    if provider_type == "openai":
-        return OpenAIModel(
-            model_name=config.get("model_name"),
-            temperature=config.get("temperature", 0),
-            credentials=config.get("credentials", {}),
-            additional_params=config.get("additional_params", {}),
-        )
-    elif provider_type == "deepseek":
-        return DeepSeekModel(
-            model_name=config.get("model_name"),
-            temperature=config.get("temperature", 0),
-            credentials=config.get("credentials", {}),
-        )
-    elif provider_type == "bedrock":
-        return get_bedrock_model(config)
-    elif provider_type == "huggingface":
-        # Return HuggingFaceModel(...)
-        pass
-    elif provider_type == "google_gemini":
-        # Return GoogleGeminiModel(...)
-        pass
-    elif provider_type == "groq":
-        # Return GroqModel(...)
-        pass
-    elif provider_type == "custom":
-        # Return CustomModel(...)
-        pass
-    else:
-        raise ValueError(f"Unsupported provider type: {provider_type}")
\ No newline at end of file
+    if isinstance(config, list):
+        models = [get_model_instance(entry) for entry in config]
+        if len(models) == 1:
+            return models[0]
+        names = [entry.get("model_name") or entry.get("provider", {}).get("type") for entry in config]
+        return HedgedModel(models, names, **(config[0].get("hedge") or {}))
+
+    provider_type = config.get("provider", {}).get("type")
+    model = _create_model(config, provider_type)
+    rate_limit = config.get("rate_limit", {})
+    if model is None or rate_limit is False or provider_type in _UNLIMITED_PROVIDERS:
+        return model
+    # Custom endpoints are limited per endpoint rather than sharing one "custom" budget
+    key = f"custom:{config['endpoint']}" if provider_type == "custom" else provider_type
+    return RateLimitedModel(model, get_rate_controller(key, rate_limit or {}))
+
+
+def _create_model(config: dict, provider_type: str):
+    """Instantiate the bare provider wrapper for `provider_type`, importing its module on first use."""
+    factory = _PROVIDERS.get(provider_type)
+    if factory is None:
+        factory = _entry_point_factory(provider_type)
+        if factory is None:
+            raise ValueError(
+                f"Unsupported provider type: {provider_type} (available: {', '.join(available_providers())})"
+            )
+        _PROVIDERS[provider_type] = factory
+    return factory(config)
@@ -35,6 +35,40 @@ class WrappedBedrockModel:
         print("PROMPT BEING SENT TO BEDROCK:\n", prompt)
         return self.llm.invoke(prompt)
 
+    def generate_stream(self, prompt: str):
+        """Stream the Bedrock model's response for the given prompt.
+        
+        Args:
+            prompt: Input text to send to the model
+            
+        Yields:
+            Successive pieces of the generated text
+        """
+        yield from self.llm.stream(prompt)
+
+    async def agenerate(self, prompt: str):
+        """Async version of `generate`, using LangChain's async Bedrock interface.
+        
+        Args:
+            prompt: Input text to send to the model
+            
+        Returns:
+            The model's generated response
+        """
+        return await self.llm.ainvoke(prompt)
+
+    async def agenerate_stream(self, prompt: str):
+        """Async version of `generate_stream`.
+        
+        Args:
+            prompt: Input text to send to the model
+            
+        Yields:
+            Successive pieces of the generated text
+        """
+        async for chunk in self.llm.astream(prompt):
+            yield chunk
+
 
 def get_bedrock_model(model_cfg: dict):
     """Factory function to create a configured WrappedBedrockModel instance.
@@ -1,23 +1,137 @@
 # app/core/models_custom.py
-import requests
-import json
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import httpx
+
+from bot.core.completion import Completion
+from bot.core.rate_limit import classify_error
+from bot.core.usage import record_retry
+
+# Keep-alive connection pools, one per endpoint origin, shared by every CustomModel instance
+_clients = {}
+_async_clients = {}
+_clients_lock = threading.Lock()
+
+# How many per-attempt timings each model keeps for `timing_summary`
+TIMING_HISTORY = 1000
+
+
+def _origin(endpoint: str) -> str:
+    """Scheme, host and port of an endpoint URL, which is what a connection pool is keyed on."""
+    parts = urlsplit(endpoint)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _limits(pool_size: int) -> httpx.Limits:
+    return httpx.Limits(max_connections=None, max_keepalive_connections=pool_size)
+
+
+def get_http_client(endpoint: str, pool_size: int = 32) -> httpx.Client:
+    """Return the shared keep-alive client for an endpoint's origin, creating it on first use."""
+    origin = _origin(endpoint)
+    with _clients_lock:
+        if origin not in _clients:
+            _clients[origin] = httpx.Client(limits=_limits(pool_size))
+        return _clients[origin]
+
+
+def get_async_http_client(endpoint: str, pool_size: int = 32) -> httpx.AsyncClient:
+    """Return the shared async client for an endpoint's origin on the running event loop.
+
+    httpx async clients are bound to the loop they were first used on, so a new pool is
+    opened when the endpoint is used from a different loop.
+    """
+    origin, loop = _origin(endpoint), asyncio.get_running_loop()
+    with _clients_lock:
+        owner, client = _async_clients.get(origin, (None, None))
+        if owner is not loop:
+            client = httpx.AsyncClient(limits=_limits(pool_size))
+            _async_clients[origin] = (loop, client)
+        return client
+
+
+class AttemptTiming:
+    """Timing of one HTTP attempt, collected from httpx's connection trace events.
+
+    Attributes:
+        attempt (int): 0-based attempt number within the call
+        status (int|None): HTTP status, or None if no response arrived
+        total (float): Wall time of the attempt in seconds
+    """
+    def __init__(self, attempt: int):
+        self.attempt = attempt
+        self.status = None
+        self.total = 0.0
+        self._started = time.perf_counter()
+        self._events = {}
+
+    def trace(self, event_name: str, info: dict):
+        """httpx/httpcore `trace` extension callback."""
+        self._events[event_name] = time.perf_counter()
+
+    async def atrace(self, event_name: str, info: dict):
+        """Async `trace` callback for `httpx.AsyncClient`."""
+        self.trace(event_name, info)
+
+    def finish(self, response=None):
+        self.total = time.perf_counter() - self._started
+        self.status = response.status_code if response is not None else None
+
+    def _span(self, start: str, end: str) -> float:
+        # Event names are prefixed by protocol ("http11." / "http2.") or "connection."
+        starts = [t for name, t in self._events.items() if name.endswith(start)]
+        ends = [t for name, t in self._events.items() if name.endswith(end)]
+        return max(0.0, ends[-1] - starts[-1]) if starts and ends else 0.0
+
+    @property
+    def connect(self) -> float:
+        """TCP connect time; 0 when a pooled keep-alive connection was reused."""
+        return self._span("connect_tcp.started", "connect_tcp.complete")
+
+    @property
+    def tls(self) -> float:
+        """TLS handshake time; 0 for plain HTTP or a reused connection."""
+        return self._span("start_tls.started", "start_tls.complete")
+
+    @property
+    def server(self) -> float:
+        """Time from the request being fully sent to the response headers arriving."""
+        return self._span("send_request_body.complete", "receive_response_headers.complete")
+
+    @property
+    def reused(self) -> bool:
+        return "connection.connect_tcp.started" not in self._events
+
 
 class CustomModel:
     """A customizable model class for making API requests to external model endpoints.
-    
+
     Attributes:
         endpoint (str): The API endpoint URL
         method (str): HTTP method (default: POST)
         headers (dict): Additional request headers
         body_template (dict): Template for constructing request body
         response_path (str): Dot-path to extract response data
+        finish_reason_path (str): Dot-path to the finish reason, so truncated responses can be
+            continued (e.g. 'choices.0.finish_reason'; optional)
         timeout (int): Request timeout in seconds (default: 10)
         retries (int): Number of retry attempts (default: 3)
         request_format (str): Request format - 'json' or 'form' (default: 'json')
+        backoff_base (float): Base delay in seconds for jittered exponential backoff (default: 0.5)
+        backoff_max (float): Cap on a single backoff delay without `Retry-After` (default: 30)
+        pool_size (int): Keep-alive connections kept per endpoint (default: 32)
+        retry_throttled (bool): Retry 429/503 here instead of surfacing them to the shared rate
+            controller; on by default only when `rate_limit` is false
+        timings (deque[AttemptTiming]): Most recent per-attempt timings
     """
     def __init__(self, config):
         """Initialize CustomModel with configuration.
-        
+
         Args:
             config (dict): Configuration dictionary containing:
                 - endpoint: API endpoint URL
@@ -25,71 +139,199 @@ class CustomModel:
                 - headers: Request headers (optional)
                 - body_template: Request body template (optional)
                 - response_path: Path to extract response (optional)
+                - finish_reason_path: Path to the finish reason (optional)
                 - timeout: Request timeout (optional)
                 - retries: Retry attempts (optional)
                 - request_format: Request format (optional)
+                - backoff_base, backoff_max, pool_size: Retry and pooling settings (optional)
+                - rate_limit: The model's rate limit settings; false means this class retries throttling itself
         """
         self.endpoint = config["endpoint"]
         self.method = config.get("method", "POST").upper()
         self.headers = config.get("headers", {})
         self.body_template = config.get("body_template", {})
         self.response_path = config.get("response_path")
+        self.finish_reason_path = config.get("finish_reason_path")
         self.timeout = config.get("timeout", 10)
         self.retries = config.get("retries", 3)
         self.request_format = config.get("request_format", "json")
+        self.backoff_base = config.get("backoff_base", 0.5)
+        self.backoff_max = config.get("backoff_max", 30)
+        self.pool_size = config.get("pool_size", 32)
+        self.retry_throttled = config.get("retry_throttled", config.get("rate_limit") is False)
+        self.timings = deque(maxlen=TIMING_HISTORY)
+
+    def _build_request(self, prompt, temperature, max_tokens, stop):
+        """Build the request keyword arguments for a prompt."""
+        # Build request body mapping using template keys or defaults
+        body = {}
+        body[self.body_template.get("prompt_key", "prompt")] = prompt
+        body[self.body_template.get("temperature_key", "temperature")] = temperature
+        body[self.body_template.get("max_tokens_key", "max_tokens")] = max_tokens
+        if self.body_template.get("stop_key") and stop:
+            body[self.body_template["stop_key"]] = stop
+
+        # Format request based on specified format
+        if self.request_format == "json":
+            return {"json": body, "headers": {"Content-Type": "application/json", **self.headers}}
+        elif self.request_format == "form":
+            return {"data": body, "headers": {"Content-Type": "application/x-www-form-urlencoded", **self.headers}}
+        return {"data": body, "headers": self.headers}
+
+    @staticmethod
+    def _walk(data, path: str):
+        """Follow a dot path into nested response data (numeric parts index lists)."""
+        for key in path.split('.'):
+            data = data[int(key)] if isinstance(data, list) else data[key]
+        return data
+
+    def _extract(self, data):
+        """Extract the response text using `response_path`, tagged with the finish reason if configured."""
+        text = self._walk(data, self.response_path) if self.response_path else data
+        if not self.finish_reason_path or not isinstance(text, str):
+            return text
+        try:
+            finish_reason = self._walk(data, self.finish_reason_path)
+        except (KeyError, IndexError, TypeError, ValueError):
+            finish_reason = None
+        return Completion(text, finish_reason)
+
+    def _retry_delay(self, exc, attempt: int):
+        """Seconds to wait before retrying after `exc`, or None if retrying cannot help.
+
+        A `Retry-After` header is honoured as-is; otherwise the delay is exponential with
+        full jitter so concurrent callers do not retry in lockstep.
+
+        Raises:
+            The original exception if it is a throttle left to the shared rate controller
+        """
+        throttled, retry_after = classify_error(exc)
+        if throttled and not self.retry_throttled:
+            raise exc
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+        if not throttled and isinstance(status, int) and 400 <= status < 500:
+            return None  # client errors will not succeed on retry
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
 
     def generate(self, prompt: str, temperature=0, max_tokens=512, stop=None):
         """Generate a response from the custom model.
-        
+
         Args:
             prompt (str): Input prompt for the model
             temperature (float): Sampling temperature (default: 0)
             max_tokens (int): Maximum tokens to generate (default: 512)
             stop (str|None): Stop sequence (optional)
-            
+
         Returns:
             The generated response from the model
-            
+
         Raises:
             RuntimeError: If all retry attempts fail
         """
-        # Build request body mapping using template keys or defaults
-        body = {}
-        body[self.body_template.get("prompt_key", "prompt")] = prompt
-        body[self.body_template.get("temperature_key", "temperature")] = temperature
-        body[self.body_template.get("max_tokens_key", "max_tokens")] = max_tokens
-        if self.body_template.get("stop_key") and stop:
-            body[self.body_template["stop_key"]] = stop
+        request = self._build_request(prompt, temperature, max_tokens, stop)
+        client = get_http_client(self.endpoint, self.pool_size)
+        attempts = self.retries or 1
+        last_error = None
 
-        # Format request based on specified format
-        if self.request_format == "json":
-            req_data = json.dumps(body)
-            headers = {"Content-Type": "application/json", **self.headers}
-        elif self.request_format == "form":
-            req_data = body
-            headers = {"Content-Type": "application/x-www-form-urlencoded", **self.headers}
-        else:
-            req_data = body
-            headers = self.headers
-
-        # Attempt request with retries
-        for _ in range(self.retries or 1):
+        for attempt in range(attempts):
+            timing, resp = AttemptTiming(attempt), None
+            try:
+                resp = client.request(self.method, self.endpoint, timeout=self.timeout,
+                                      extensions={"trace": timing.trace}, **request)
+                resp.raise_for_status()
+                return self._extract(resp.json())
+            except Exception as e:
+                last_error = e
+                delay = self._retry_delay(e, attempt)
+                print(f"Error calling custom model (attempt {attempt + 1}/{attempts}): {e}")
+                if delay is None:
+                    break
+                if attempt + 1 < attempts:
+                    record_retry()
+                    time.sleep(delay)
+            finally:
+                timing.finish(resp)
+                self.timings.append(timing)
+        raise RuntimeError("Failed to get response from custom model") from last_error
+
+    def generate_stream(self, prompt: str, **kwargs):
+        """Yield the full response as a single chunk; custom endpoints are not streamed.
+
+        Args:
+            prompt (str): Input prompt for the model
+            **kwargs: Passed through to `generate`
+
+        Yields:
+            The generated response from the model
+        """
+        yield self.generate(prompt, **kwargs)
+
+    async def agenerate(self, prompt: str, temperature=0, max_tokens=512, stop=None):
+        """Async version of `generate`, sending the request with `httpx.AsyncClient`.
+
+        Args:
+            prompt (str): Input prompt for the model
+            temperature (float): Sampling temperature (default: 0)
+            max_tokens (int): Maximum tokens to generate (default: 512)
+            stop (str|None): Stop sequence (optional)
+
+        Returns:
+            The generated response from the model
+
+        Raises:
+            RuntimeError: If all retry attempts fail
+        """
+        request = self._build_request(prompt, temperature, max_tokens, stop)
+        client = get_async_http_client(self.endpoint, self.pool_size)
+        attempts = self.retries or 1
+        last_error = None
+
+        for attempt in range(attempts):
+            timing, resp = AttemptTiming(attempt), None
             try:
-                resp = requests.request(
-                    self.method,
-                    self.endpoint,
-                    headers=headers,
-                    data=req_data if self.request_format != "json" else None,
-                    json=body if self.request_format == "json" else None,
-                    timeout=self.timeout,
-                )
+                resp = await client.request(self.method, self.endpoint, timeout=self.timeout,
+                                            extensions={"trace": timing.atrace}, **request)
                 resp.raise_for_status()
-                data = resp.json()
-                # Extract nested response data using dot path
-                if self.response_path:
-                    for key in self.response_path.split('.'):
-                        data = data[key]
-                return data
+                return self._extract(resp.json())
             except Exception as e:
-                print(f"Error calling custom model: {e}")
-        raise RuntimeError("Failed to get response from custom model")
\ No newline at end of file
+                last_error = e
+                delay = self._retry_delay(e, attempt)
+                print(f"Error calling custom model (attempt {attempt + 1}/{attempts}): {e}")
+                if delay is None:
+                    break
+                if attempt + 1 < attempts:
+                    record_retry()
+                    await asyncio.sleep(delay)
+            finally:
+                timing.finish(resp)
+                self.timings.append(timing)
+        raise RuntimeError("Failed to get response from custom model") from last_error
+
+    async def agenerate_stream(self, prompt: str, **kwargs):
+        """Async version of `generate_stream`; yields the full response as a single chunk.
+
+        Args:
+            prompt (str): Input prompt for the model
+            **kwargs: Passed through to `agenerate`
+
+        Yields:
+            The generated response from the model
+        """
+        yield await self.agenerate(prompt, **kwargs)
+
+    def timing_summary(self) -> str:
+        """One-line summary of recent attempts: connection setup vs server time."""
+        timings = list(self.timings)
+        if not timings:
+            return "custom model: no requests"
+        fresh = [t for t in timings if not t.reused]
+
+        def avg(values):
+            return sum(values) / len(values) if values else 0.0
+        return (
+            f"custom model attempts={len(timings)} failed={sum(t.status is None or t.status >= 400 for t in timings)} "
+            f"new_connections={len(fresh)} connect+tls(new)={avg([t.connect + t.tls for t in fresh]):.3f}s "
+            f"server={avg([t.server for t in timings]):.3f}s total={avg([t.total for t in timings]):.3f}s"
+        )
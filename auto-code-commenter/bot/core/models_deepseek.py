@@ -2,6 +2,9 @@
 import os
 from langchain_openai import ChatOpenAI
 
+from bot.core.completion import completion_from_message
+from bot.core.usage import record_response_usage
+
 class DeepSeekModel:
     """Wrapper for DeepSeek's OpenAI-compatible API interface.
     
@@ -24,6 +27,10 @@ class DeepSeekModel:
             'temperature': temperature,
             'openai_api_key': self.api_key,
             'openai_api_base': self.api_base,
+            # Retries are handled by the shared rate controller, which backs off on 429s
+            'max_retries': 0,
+            # Report token usage (including prompt-cache hits) on streamed responses too
+            'stream_usage': True,
         }
 
         # Initialize LangChain's OpenAI client with DeepSeek's API parameters
@@ -36,6 +43,51 @@ class DeepSeekModel:
             prompt: Input text to send to the model
             
         Returns:
-            str: Generated text completion
+            Completion: Generated text, with the provider's finish reason
+        """
+        response = self.llm.invoke(prompt)
+        record_response_usage(response)
+        return completion_from_message(response)
+
+    def generate_stream(self, prompt: str):
+        """Stream the response for a prompt chunk by chunk.
+
+        Closing the returned generator aborts the underlying HTTP stream.
+
+        Args:
+            prompt: Input text to send to the model
+
+        Yields:
+            Completion: Successive pieces of the generated text; the last carries the finish reason
+        """
+        for chunk in self.llm.stream(prompt):
+            if chunk.usage_metadata:  # sent with the final chunk
+                record_response_usage(chunk)
+            yield completion_from_message(chunk)
+
+    async def agenerate(self, prompt: str) -> str:
+        """Async version of `generate`, using the OpenAI client's native async transport.
+
+        Args:
+            prompt: Input text to send to the model
+
+        Returns:
+            Completion: The generated response, with the provider's finish reason
+        """
+        response = await self.llm.ainvoke(prompt)
+        record_response_usage(response)
+        return completion_from_message(response)
+
+    async def agenerate_stream(self, prompt: str):
+        """Async version of `generate_stream`; closing the generator aborts the HTTP stream.
+
+        Args:
+            prompt: Input text to send to the model
+
+        Yields:
+            Completion: Successive pieces of the generated text; the last carries the finish reason
         """
-        return self.llm.predict(prompt)
\ No newline at end of file
+        async for chunk in self.llm.astream(prompt):
+            if chunk.usage_metadata:
+                record_response_usage(chunk)
+            yield completion_from_message(chunk)
@@ -0,0 +1,337 @@
+# bot/core/models_local.py
+"""Local CPU inference, either in-process through llama.cpp or against a local server.
+
+`backend: llama_cpp` loads a quantized GGUF model with `llama-cpp-python` (a local
+`model_path`, or `repo_id` + `filename` downloaded from the Hugging Face Hub) and runs it on
+`n_threads` CPU threads. One llama.cpp context decodes one sequence at a time, so calls are
+serialized; `n_batch` sets how many prompt tokens are evaluated per step.
+
+`backend: server` talks to an OpenAI-compatible server on the build machine (llama.cpp's
+`llama-server`, vLLM, Ollama, ...) over pooled keep-alive connections. Chat requests are
+batched by the server itself when several are in flight (e.g. `llama-server --parallel N`).
+With `api: completion` and `batch_size > 1`, concurrent prompts are also coalesced into one
+`/completions` request carrying a list of prompts, for servers that batch those natively.
+Prompts reach the batcher only once the provider's rate limiter admits them, so a batch can
+never hold more than the limiter's concurrency window (`rate_limit.initial_concurrency`, and
+`project.concurrency` files in flight): keep `batch_size` at or below both, or batches wait
+out `batch_wait` half-empty.
+"""
+
+import asyncio
+import os
+import threading
+import weakref
+
+from bot.core.completion import Completion
+from bot.core.models_custom import get_async_http_client, get_http_client
+from bot.core.rate_limit import DEFAULT_INITIAL_CONCURRENCY
+from bot.core.usage import record_usage
+from bot.utils.packing import estimate_tokens
+
+BACKENDS = ("llama_cpp", "server")
+DEFAULT_BASE_URL = "http://localhost:8080/v1"
+
+
+class ChoiceCountError(ValueError):
+    """The server answered a batched request with a different number of choices than prompts."""
+
+
+def _usage(data: dict):
+    """`(input, cached, output)` tokens from an OpenAI-style `usage` block, or None."""
+    usage = data.get("usage") or {}
+    if "prompt_tokens" not in usage:
+        return None
+    cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+    return usage["prompt_tokens"], cached, usage.get("completion_tokens", 0)
+
+
+def _split_usage(usage, prompts: list[str], texts: list[str]) -> list:
+    """Share a batched request's usage between its prompts in proportion to their sizes."""
+    if usage is None:
+        return [None] * len(prompts)
+    input_tokens, cached, output_tokens = usage
+    in_weights = [estimate_tokens(p) for p in prompts]
+    out_weights = [estimate_tokens(t) for t in texts]
+    in_total, out_total = sum(in_weights) or 1, sum(out_weights) or 1
+    return [
+        (input_tokens * wi // in_total, cached * wi // in_total, output_tokens * wo // out_total)
+        for wi, wo in zip(in_weights, out_weights)
+    ]
+
+
+def _load_llama(config: dict):
+    """Load the GGUF model for the in-process backend."""
+    try:
+        from llama_cpp import Llama
+    except ImportError as e:
+        raise ImportError("The llama_cpp backend needs llama-cpp-python: pip install llama-cpp-python") from e
+    kwargs = {
+        "n_threads": config.get("n_threads") or os.cpu_count(),
+        "n_threads_batch": config.get("n_threads_batch") or config.get("n_threads") or os.cpu_count(),
+        "n_ctx": config.get("n_ctx", 8192),
+        "n_batch": config.get("n_batch", 512),
+        "n_gpu_layers": config.get("n_gpu_layers", 0),
+        "verbose": False,
+    }
+    if config.get("chat_format"):
+        kwargs["chat_format"] = config["chat_format"]
+    if config.get("model_path"):
+        return Llama(model_path=config["model_path"], **kwargs)
+    if config.get("repo_id") and config.get("filename"):
+        return Llama.from_pretrained(repo_id=config["repo_id"], filename=config["filename"], **kwargs)
+    raise ValueError("The llama_cpp backend needs `model_path`, or `repo_id` and `filename`")
+
+
+class _PromptBatcher:
+    """Coalesces prompts submitted concurrently on one event loop into batched requests.
+
+    A batch is sent when `batch_size` prompts are waiting or `wait` seconds after its first
+    prompt arrived, whichever comes first.
+    """
+    def __init__(self, send, batch_size: int, wait: float):
+        self.send = send
+        self.batch_size = batch_size
+        self.wait = wait
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+
+    async def submit(self, prompt: str):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((prompt, future))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._dispatch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, batch: list):
+        try:
+            results = await self.send([prompt for prompt, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for index, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            if index < len(results):
+                future.set_result(results[index])
+            else:  # never leave a caller waiting on a prompt that got no answer
+                future.set_exception(ChoiceCountError(f"No response for prompt {index + 1} of {len(batch)}"))
+
+
+class LocalModel:
+    """Model wrapper for local inference with no per-token cost.
+
+    Args:
+        config (dict): Model configuration containing:
+            - backend: "llama_cpp" (in-process) or "server" (default: "server" when
+              `base_url` is set, otherwise "llama_cpp")
+            - model_path, or repo_id + filename: GGUF model for llama_cpp
+            - n_threads, n_threads_batch, n_ctx, n_batch, n_gpu_layers, chat_format: llama.cpp settings
+            - base_url: Server URL up to and including `/v1` (default: http://localhost:8080/v1)
+            - model_name: Model name sent to the server (default: "local")
+            - credentials.api_key: Bearer token, if the server wants one
+            - api: "chat" (the model's chat template is applied) or "completion"
+            - prompt_template: Template for `api: completion`, with `{prompt}` where the prompt goes
+            - temperature, max_tokens, timeout, pool_size: Generation and HTTP settings
+            - batch_size, batch_wait: Prompts per batched `/completions` request (at most the
+              rate-limit concurrency window), and how long (seconds) to wait for a batch to fill
+
+    Attributes:
+        requests (int): Requests sent (a batch counts once)
+        prompts (int): Prompts answered
+
+    Raises:
+        ValueError: If the backend or api is unknown, or the llama_cpp model is not specified
+    """
+    def __init__(self, config: dict):
+        self.backend = config.get("backend") or ("server" if config.get("base_url") else "llama_cpp")
+        if self.backend not in BACKENDS:
+            raise ValueError(f"Unknown local backend: {self.backend} (expected one of {', '.join(BACKENDS)})")
+        self.api = config.get("api", "chat")
+        if self.api not in ("chat", "completion"):
+            raise ValueError(f"Unknown local api: {self.api} (expected chat or completion)")
+        self.prompt_template = config.get("prompt_template", "{prompt}")
+        self.model_name = config.get("model_name") or "local"
+        self.temperature = config.get("temperature", 0)
+        self.max_tokens = config.get("max_tokens", 4096)
+        self.timeout = config.get("timeout", 600)
+        self.pool_size = config.get("pool_size", 8)
+        self.batch_size = max(1, int(config.get("batch_size", 1)))
+        self.batch_wait = float(config.get("batch_wait", 0.05))
+        rate_limit = config.get("rate_limit", {})
+        window = (rate_limit or {}).get("initial_concurrency", DEFAULT_INITIAL_CONCURRENCY)
+        if self.batch_size > 1 and rate_limit is not False and self.batch_size > window:
+            print(f"⚠️ Local batch_size={self.batch_size} exceeds rate_limit.initial_concurrency={window}; "
+                  f"batches will wait out batch_wait before they are sent.")
+        self.requests = 0
+        self.prompts = 0
+        self._counter_lock = threading.Lock()
+        self._batchers = weakref.WeakKeyDictionary()  # event loop -> _PromptBatcher
+        # Prompt lists only go to completion endpoints, and only until a server mishandles one
+        self._batchable = self.backend == "server" and self.api == "completion"
+
+        if self.backend == "llama_cpp":
+            self.llm = _load_llama(config)
+            self._llm_lock = threading.Lock()
+        else:
+            self.base_url = (config.get("base_url") or DEFAULT_BASE_URL).rstrip("/")
+            api_key = (config.get("credentials") or {}).get("api_key")
+            self.headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+
+    def _count(self, prompts: int):
+        with self._counter_lock:
+            self.requests += 1
+            self.prompts += prompts
+
+    def _render(self, prompt: str) -> str:
+        # str.replace rather than format: prompts are full of braces
+        return self.prompt_template.replace("{prompt}", prompt)
+
+    def _request(self, prompts: list[str]) -> tuple[str, dict]:
+        """Endpoint path and body for the prompts (a list only for a batched completion)."""
+        options = {"temperature": self.temperature, "max_tokens": self.max_tokens}
+        if self.api == "chat":
+            return "/chat/completions", {"messages": [{"role": "user", "content": prompts[0]}], **options}
+        rendered = [self._render(p) for p in prompts]
+        return "/completions", {"prompt": rendered if len(rendered) > 1 else rendered[0], **options}
+
+    def _parse(self, data: dict, prompts: list[str]) -> list:
+        """`(Completion, usage)` per prompt, with the response's usage shared between them."""
+        choices = sorted(data["choices"], key=lambda choice: choice.get("index", 0))
+        if len(choices) != len(prompts):
+            raise ChoiceCountError(f"Local server returned {len(choices)} choice(s) for {len(prompts)} prompt(s)")
+        if self.api == "chat":
+            texts = [choice["message"].get("content") or "" for choice in choices]
+        else:
+            texts = [choice.get("text") or "" for choice in choices]
+        completions = [Completion(text, choice.get("finish_reason")) for text, choice in zip(texts, choices)]
+        return list(zip(completions, _split_usage(_usage(data), prompts, texts)))
+
+    @staticmethod
+    def _finish(result):
+        completion, usage = result
+        if usage is not None:
+            record_usage(*usage)
+        return completion
+
+    def _run_llama(self, prompt: str):
+        with self._llm_lock:
+            if self.api == "chat":
+                data = self.llm.create_chat_completion(
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=self.temperature, max_tokens=self.max_tokens,
+                )
+            else:
+                data = self.llm.create_completion(
+                    self._render(prompt), temperature=self.temperature, max_tokens=self.max_tokens,
+                )
+        self._count(1)
+        return self._parse(data, [prompt])[0]
+
+    def _post(self, prompts: list[str]) -> list:
+        path, body = self._request(prompts)
+        client = get_http_client(self.base_url, self.pool_size)
+        resp = client.post(self.base_url + path, json={"model": self.model_name, **body},
+                           headers=self.headers, timeout=self.timeout)
+        resp.raise_for_status()
+        results = self._parse(resp.json(), prompts)
+        self._count(len(prompts))
+        return results
+
+    async def _apost(self, prompts: list[str]) -> list:
+        path, body = self._request(prompts)
+        client = get_async_http_client(self.base_url, self.pool_size)
+        resp = await client.post(self.base_url + path, json={"model": self.model_name, **body},
+                                 headers=self.headers, timeout=self.timeout)
+        resp.raise_for_status()
+        results = self._parse(resp.json(), prompts)
+        self._count(len(prompts))
+        return results
+
+    def generate(self, prompt: str):
+        """Generate a response for one prompt.
+
+        Args:
+            prompt (str): The input text prompt for the model
+
+        Returns:
+            Completion: The generated response, with its finish reason
+        """
+        if self.backend == "llama_cpp":
+            return self._finish(self._run_llama(prompt))
+        return self._finish(self._post([prompt])[0])
+
+    def generate_batch(self, prompts: list[str]) -> list:
+        """Generate responses for several prompts, in one request where the backend allows it.
+
+        Only a server with `api: completion` takes a list of prompts. The in-process llama_cpp
+        backend (and any other server API) runs the prompts one after another.
+
+        Args:
+            prompts (list[str]): Input prompts
+
+        Returns:
+            list[Completion]: Responses in prompt order
+        """
+        if self._batchable and len(prompts) > 1:
+            try:
+                return [self._finish(result) for result in self._post(prompts)]
+            except ChoiceCountError as e:
+                self._disable_batching(e)
+        return [self.generate(prompt) for prompt in prompts]
+
+    def _disable_batching(self, error: Exception):
+        """Stop sending prompt lists to a server that does not answer every prompt in one."""
+        if self._batchable:
+            print(f"⚠️ Local server does not answer batched prompts ({error}); sending them one at a time.")
+        self._batchable = False
+
+    async def _apost_batch(self, prompts: list[str]) -> list:
+        """Send a batch, resending its prompts one at a time if the server does not answer lists."""
+        if self._batchable and len(prompts) > 1:
+            try:
+                return await self._apost(prompts)
+            except ChoiceCountError as e:
+                self._disable_batching(e)
+        return [result for (result,) in await asyncio.gather(*(self._apost([prompt]) for prompt in prompts))]
+
+    async def agenerate(self, prompt: str):
+        """Async `generate`; concurrent prompts share batched requests when batching is on.
+
+        The in-process backend runs in a worker thread so the event loop stays free.
+
+        Args:
+            prompt (str): The input text prompt for the model
+
+        Returns:
+            Completion: The generated response, with its finish reason
+        """
+        if self.backend == "llama_cpp":
+            return self._finish(await asyncio.to_thread(self._run_llama, prompt))
+        if self._batchable and self.batch_size > 1:
+            loop = asyncio.get_running_loop()
+            batcher = self._batchers.get(loop)
+            if batcher is None:
+                batcher = self._batchers[loop] = _PromptBatcher(self._apost_batch, self.batch_size, self.batch_wait)
+            return self._finish(await batcher.submit(prompt))
+        return self._finish((await self._apost([prompt]))[0])
+
+    def timing_summary(self) -> str:
+        """One-line summary of requests and batching."""
+        average = self.prompts / self.requests if self.requests else 0.0
+        return f"local     backend={self.backend} requests={self.requests} prompts={self.prompts} avg_batch={average:.1f}"
@@ -2,6 +2,9 @@
 import os
 from langchain_openai import ChatOpenAI
 
+from bot.core.completion import completion_from_message
+from bot.core.usage import record_response_usage
+
 class OpenAIModel:
     """Wrapper class for OpenAI's chat models using LangChain's ChatOpenAI interface.
     
@@ -20,7 +23,9 @@ class OpenAIModel:
             temperature=temperature,
             openai_api_key=api_key,
             max_tokens=max_tokens,
-            **(additional_params or {}),
+            # Retries are handled by the shared rate controller, which backs off on 429s;
+            # stream_usage makes streamed responses report (cached) token usage
+            **{"max_retries": 0, "stream_usage": True, **(additional_params or {})},
         )
 
     def generate(self, prompt: str) -> str:
@@ -30,6 +35,51 @@ class OpenAIModel:
             prompt (str): The input text prompt for the model
             
         Returns:
-            str: The generated response from the model
+            Completion: The generated response, with the provider's finish reason
+        """
+        response = self.llm.invoke(prompt)
+        record_response_usage(response)
+        return completion_from_message(response)
+
+    def generate_stream(self, prompt: str):
+        """Stream the response for a prompt chunk by chunk.
+
+        Closing the returned generator aborts the underlying HTTP stream.
+
+        Args:
+            prompt (str): The input text prompt for the model
+
+        Yields:
+            Completion: Successive pieces of the generated text; the last carries the finish reason
+        """
+        for chunk in self.llm.stream(prompt):
+            if chunk.usage_metadata:  # sent with the final chunk
+                record_response_usage(chunk)
+            yield completion_from_message(chunk)
+
+    async def agenerate(self, prompt: str) -> str:
+        """Async version of `generate`, using the OpenAI client's native async transport.
+
+        Args:
+            prompt (str): The input text prompt for the model
+
+        Returns:
+            Completion: The generated response, with the provider's finish reason
+        """
+        response = await self.llm.ainvoke(prompt)
+        record_response_usage(response)
+        return completion_from_message(response)
+
+    async def agenerate_stream(self, prompt: str):
+        """Async version of `generate_stream`; closing the generator aborts the HTTP stream.
+
+        Args:
+            prompt (str): The input text prompt for the model
+
+        Yields:
+            Completion: Successive pieces of the generated text; the last carries the finish reason
         """
-        return self.llm.predict(prompt)
\ No newline at end of file
+        async for chunk in self.llm.astream(prompt):
+            if chunk.usage_metadata:
+                record_response_usage(chunk)
+            yield completion_from_message(chunk)
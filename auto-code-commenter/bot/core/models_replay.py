@@ -0,0 +1,165 @@
+# bot/core/models_replay.py
+"""Record model responses once and replay them offline, deterministically.
+
+`provider.type: replay` puts a cassette in front of another provider (`upstream`). Each prompt
+is normalized (line endings, trailing whitespace) and hashed; a response recorded under that
+hash is returned without a network call, together with its finish reason and the token usage
+the provider reported, so reports and continuations behave as they did when it was recorded.
+
+What happens on a miss is set by `on_miss`:
+- ``fail``: raise, so a regression run cannot silently reach the network
+- ``passthrough``: call `upstream` and append its response to the cassette
+- ``echo``: return the code the prompt carries, unchanged (no upstream needed); useful to
+  profile everything except the model on any source tree
+
+The cassette is a JSON-lines file with one recorded response per line. It is only ever
+appended to, so an interrupted run loses at most the line being written.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+
+from bot.core.completion import Completion
+from bot.core.usage import record_usage, usage_scope
+
+DEFAULT_CASSETTE = ".commenter-cassette.jsonl"
+MISS_POLICIES = ("fail", "passthrough", "echo")
+
+# The line every prompt puts right before the code it carries
+_PAYLOAD_LEAD = re.compile(r"^Here (?:is|are) the [^\n]*:\n\n", re.MULTILINE)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Make prompts that differ only in line endings or trailing whitespace identical."""
+    lines = prompt.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip("\n")
+
+
+def prompt_key(prompt: str) -> str:
+    """SHA-256 of the normalized prompt, the cassette's lookup key."""
+    return hashlib.sha256(normalize_prompt(prompt).encode("utf-8")).hexdigest()
+
+
+def echo_response(prompt: str) -> Completion:
+    """The code a prompt carries (everything after its last "Here is the ...:" line)."""
+    matches = list(_PAYLOAD_LEAD.finditer(prompt))
+    return Completion(prompt[matches[-1].end():] if matches else prompt, "stop")
+
+
+class ReplayModel:
+    """Serves responses from a cassette, recording misses from an upstream model.
+
+    Args:
+        cassette: Path of the JSON-lines cassette (created on first record)
+        on_miss: "fail", "passthrough" or "echo"
+        upstream: Model wrapper called on a miss with `on_miss: passthrough`
+
+    Attributes:
+        hits (int): Prompts answered from the cassette
+        misses (int): Prompts that were not in the cassette
+        recorded (int): Responses appended to the cassette in this process
+
+    Raises:
+        ValueError: If `on_miss` is unknown, or "passthrough" without an upstream model
+    """
+    def __init__(self, cassette: str = DEFAULT_CASSETTE, on_miss: str = "fail", upstream=None):
+        if on_miss not in MISS_POLICIES:
+            raise ValueError(f"Unknown replay on_miss policy: {on_miss} (expected one of {', '.join(MISS_POLICIES)})")
+        if on_miss == "passthrough" and upstream is None:
+            raise ValueError("Replay on_miss: passthrough needs an `upstream` model config")
+        self.cassette = cassette
+        self.on_miss = on_miss
+        self.upstream = upstream
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def _load(self) -> dict:
+        """Read the cassette; later lines win, and a line cut off by an interrupted run is skipped."""
+        entries = {}
+        if not os.path.exists(self.cassette):
+            return entries
+        with open(self.cassette, "r", encoding="utf-8") as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                    entries[entry["key"]] = entry
+                except (ValueError, KeyError):
+                    print(f"⚠️ Ignoring unreadable line {number} of cassette {self.cassette}")
+        return entries
+
+    def _lookup(self, key: str):
+        """Return the recorded response for `key` (replaying its token usage), or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        if entry.get("usage"):
+            record_usage(*entry["usage"])
+        return Completion(entry["text"], entry.get("finish_reason"))
+
+    def _record(self, key: str, response, usage):
+        entry = {
+            "key": key,
+            "text": str(response),
+            "finish_reason": getattr(response, "finish_reason", None),
+            "usage": [usage.input_tokens, usage.cached_tokens, usage.output_tokens] if usage.requests else None,
+        }
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._entries[key] = entry
+            with open(self.cassette, "a", encoding="utf-8") as f:
+                f.write(line)
+            self.recorded += 1
+
+    def _miss(self, prompt: str):
+        """Response for a prompt that is not in the cassette, unless it has to come from upstream."""
+        if self.on_miss == "echo":
+            return echo_response(prompt)
+        if self.on_miss == "fail":
+            raise LookupError(f"No recorded response for prompt {prompt_key(prompt)[:12]} in {self.cassette}")
+        return None
+
+    def generate(self, prompt: str):
+        """Return the recorded response for `prompt`, applying the miss policy if there is none."""
+        key = prompt_key(prompt)
+        response = self._lookup(key)
+        if response is None:
+            response = self._miss(prompt)
+        if response is None:
+            with usage_scope() as usage:
+                response = self.upstream.generate(prompt)
+            self._record(key, response, usage)
+        return response
+
+    async def agenerate(self, prompt: str):
+        """Async `generate`; only a passthrough miss waits on the upstream model."""
+        key = prompt_key(prompt)
+        response = self._lookup(key)
+        if response is None:
+            response = self._miss(prompt)
+        if response is None:
+            with usage_scope() as usage:
+                if hasattr(self.upstream, "agenerate"):
+                    response = await self.upstream.agenerate(prompt)
+                else:
+                    response = await asyncio.to_thread(self.upstream.generate, prompt)
+            self._record(key, response, usage)
+        return response
+
+    def timing_summary(self) -> str:
+        """One-line summary of cassette activity."""
+        return (
+            f"replay    hits={self.hits} misses={self.misses} recorded={self.recorded} "
+            f"on_miss={self.on_miss} cassette={self.cassette}"
+        )
@@ -0,0 +1,365 @@
+# bot/core/rate_limit.py
+"""Adaptive client-side rate limiting shared by all model wrappers of a provider.
+
+Each provider gets one `RateController` combining:
+- a requests/min and a tokens/min token bucket (either can be left unlimited), and
+- an AIMD concurrency window that grows by roughly one slot per window of successful calls
+  and halves on HTTP 429/503 (or provider throttling errors), honouring `Retry-After`.
+
+The aim is to sit at the provider's real ceiling without tripping bans.
+"""
+
+import asyncio
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from bot.core.usage import add_queued_seconds, record_retry
+from bot.utils.packing import estimate_tokens
+
+THROTTLE_STATUS_CODES = (429, 503)
+DEFAULT_INITIAL_CONCURRENCY = 4
+_THROTTLE_TEXT = re.compile(r"\b429\b|\b503\b|rate.?limit|too many requests|throttl|overloaded", re.IGNORECASE)
+
+# One controller per provider key, shared across model instances and threads
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+
+def _status_code(exc):
+    """Best-effort HTTP status code of an exception from requests, httpx, openai or botocore."""
+    for candidate in (exc, getattr(exc, "response", None)):
+        code = getattr(candidate, "status_code", None)
+        if isinstance(code, int):
+            return code
+    response = getattr(exc, "response", None)
+    if isinstance(response, dict):  # botocore ClientError
+        return response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return None
+
+
+def _retry_after(exc):
+    """Parse a `Retry-After` header (seconds) from the exception's response, if present."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:  # HTTP-date form
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(exc):
+    """Decide whether an exception means "slow down".
+
+    Returns:
+        tuple[bool, float|None]: (is_throttle, retry_after_seconds)
+    """
+    status = _status_code(exc)
+    if status is not None:
+        return status in THROTTLE_STATUS_CODES, _retry_after(exc)
+    response = getattr(exc, "response", None)
+    if isinstance(response, dict) and "Throttl" in response.get("Error", {}).get("Code", ""):
+        return True, None
+    return bool(_THROTTLE_TEXT.search(f"{type(exc).__name__} {exc}")), _retry_after(exc)
+
+
+class TokenBucket:
+    """A per-minute token bucket; `per_minute=None` means unlimited.
+
+    Args:
+        per_minute: Sustained rate, which is also the burst capacity
+    """
+    def __init__(self, per_minute=None):
+        self.capacity = float(per_minute) if per_minute else None
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if self.capacity is None:
+            return
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` is available (0 if it is available now)."""
+        if self.capacity is None:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)  # never wait forever on an oversized request
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * 60.0 / self.capacity
+
+    def take(self, amount: float):
+        """Consume `amount` tokens (call only after `wait_time` returned 0)."""
+        if self.capacity is not None:
+            self.tokens -= min(amount, self.capacity)
+
+
+class RateController:
+    """Token buckets plus an AIMD concurrency window for one provider.
+
+    Args:
+        requests_per_minute: Request budget, or None for unlimited
+        tokens_per_minute: Token budget, or None for unlimited
+        initial_concurrency: Starting size of the concurrency window
+        max_concurrency: Upper bound for the window
+        max_retries: How many times a throttled call is retried
+        base_delay: Backoff base (seconds) when the provider gives no `Retry-After`
+    """
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, initial_concurrency: int = DEFAULT_INITIAL_CONCURRENCY,
+                 max_concurrency: int = 64, max_retries: int = 5, base_delay: float = 1.0):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.limit = float(max(1, initial_concurrency))
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.throttles = 0
+        self._cond = threading.Condition()
+        self._async_waiters = []  # (loop, future) of coroutines waiting for a slot
+
+    def _try_acquire(self, cost: float):
+        """Take a slot and budget if available. Caller holds the lock.
+
+        Returns:
+            float|None: 0 once acquired, the seconds to wait for budget, or None to wait
+            until a slot is released
+        """
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.in_flight >= int(self.limit):
+            return None
+        wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(cost, now))
+        if wait > 0:
+            return wait
+        self.requests.take(1)
+        self.tokens.take(cost)
+        self.in_flight += 1
+        return 0.0
+
+    def acquire(self, cost: float = 0):
+        """Block until a request costing `cost` tokens may be sent."""
+        started = time.monotonic()
+        try:
+            with self._cond:
+                while (wait := self._try_acquire(cost)) != 0:
+                    self._cond.wait(timeout=wait)
+        finally:
+            add_queued_seconds(time.monotonic() - started)
+
+    async def aacquire(self, cost: float = 0):
+        """Async `acquire`: waits on the event loop instead of blocking a thread.
+
+        A coroutine waiting for a slot sleeps until `release` wakes it rather than polling.
+        """
+        loop, started = asyncio.get_running_loop(), time.monotonic()
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_acquire(cost)
+                    if wait is None:
+                        future = loop.create_future()
+                        self._async_waiters.append((loop, future))
+                if wait == 0:
+                    return
+                if wait is None:
+                    await future
+                else:
+                    await asyncio.sleep(wait)
+        finally:
+            add_queued_seconds(time.monotonic() - started)
+
+    def _notify(self):
+        """Wake blocked threads and coroutines so they retry. Caller holds the lock."""
+        self._cond.notify_all()
+        waiters, self._async_waiters = self._async_waiters, []
+        for loop, future in waiters:
+            if not future.done():
+                try:
+                    loop.call_soon_threadsafe(_wake, future)
+                except RuntimeError:  # the waiter's loop has closed
+                    pass
+
+    def release(self, throttled: bool = False, retry_after=None, attempt: int = 0, succeeded: bool = True):
+        """Return a slot and adapt the window: additive increase on success, halve on throttle.
+
+        A call that neither succeeded nor was throttled (an error, a cancelled hedge, a stream
+        aborted by its consumer) passes `succeeded=False` and only frees its slot.
+        """
+        with self._cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            if throttled:
+                self.throttles += 1
+                self.limit = max(1.0, self.limit / 2)
+                delay = retry_after if retry_after is not None else self.backoff(attempt)
+                self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+            elif succeeded:
+                self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+            self._notify()
+
+    def backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter for the given (0-based) attempt."""
+        return random.uniform(0, self.base_delay * (2 ** attempt))
+
+    def call(self, fn, *args, cost: float = 0, **kwargs):
+        """Run `fn` under the controller, retrying throttled calls up to `max_retries` times."""
+        for attempt in range(self.max_retries + 1):
+            self.acquire(cost)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                throttled, retry_after = classify_error(e)
+                self.release(throttled=throttled, retry_after=retry_after, attempt=attempt, succeeded=False)
+                if not throttled or attempt == self.max_retries:
+                    raise
+                print(f"⏳ Provider throttled the request, retrying (window={int(self.limit)}): {e}")
+                record_retry()
+                continue
+            except BaseException:
+                self.release(succeeded=False)
+                raise
+            self.release()
+            return result
+
+    async def acall(self, fn, *args, cost: float = 0, **kwargs):
+        """Async `call` for a coroutine function `fn`; a cancelled call gives its slot back."""
+        for attempt in range(self.max_retries + 1):
+            await self.aacquire(cost)
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                throttled, retry_after = classify_error(e)
+                self.release(throttled=throttled, retry_after=retry_after, attempt=attempt, succeeded=False)
+                if not throttled or attempt == self.max_retries:
+                    raise
+                print(f"⏳ Provider throttled the request, retrying (window={int(self.limit)}): {e}")
+                record_retry()
+                continue
+            except BaseException:
+                self.release(succeeded=False)
+                raise
+            self.release()
+            return result
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def get_rate_controller(key: str, settings: dict = None) -> RateController:
+    """Return the shared controller for a provider key, creating it on first use.
+
+    Args:
+        key: Provider identifier, e.g. 'deepseek' or 'custom:https://host/v1'
+        settings: Keyword arguments for `RateController`, used only on creation
+    """
+    with _controllers_lock:
+        if key not in _controllers:
+            _controllers[key] = RateController(**(settings or {}))
+        return _controllers[key]
+
+
+class RateLimitedModel:
+    """Wraps a model wrapper so every call goes through a shared `RateController`.
+
+    Args:
+        model: The provider model wrapper (anything with `generate`)
+        controller: Controller shared by all wrappers of the same provider
+    """
+    def __init__(self, model, controller: RateController):
+        self.model = model
+        self.controller = controller
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    @staticmethod
+    def _cost(prompt: str) -> float:
+        # Budget for the prompt plus a response of similar size (the code is echoed back)
+        return 2 * estimate_tokens(prompt)
+
+    def generate(self, prompt: str):
+        """Generate a response, waiting for budget and retrying on throttling."""
+        return self.controller.call(self.model.generate, prompt, cost=self._cost(prompt))
+
+    def generate_stream(self, prompt: str):
+        """Stream a response under the controller.
+
+        Throttling is retried only if it happens before the first piece arrives.
+        """
+        cost = self._cost(prompt)
+        for attempt in range(self.controller.max_retries + 1):
+            self.controller.acquire(cost)
+            throttled, retry_after, started, completed = False, None, False, False
+            try:
+                if hasattr(self.model, "generate_stream"):
+                    for piece in self.model.generate_stream(prompt):
+                        started = True
+                        yield piece
+                else:
+                    yield self.model.generate(prompt)
+                completed = True
+                return
+            except Exception as e:
+                throttled, retry_after = classify_error(e)
+                if not throttled or started or attempt == self.controller.max_retries:
+                    raise
+                print(f"⏳ Provider throttled the stream, retrying (window={int(self.controller.limit)}): {e}")
+                record_retry()
+            finally:
+                # A stream the consumer abandoned early (or that failed) only frees its slot
+                self.controller.release(throttled=throttled, retry_after=retry_after, attempt=attempt,
+                                        succeeded=completed)
+
+    async def _agenerate_model(self, prompt: str):
+        # Models without a native async client are run in a worker thread
+        if hasattr(self.model, "agenerate"):
+            return await self.model.agenerate(prompt)
+        return await asyncio.to_thread(self.model.generate, prompt)
+
+    async def agenerate(self, prompt: str):
+        """Async `generate`: waits for budget on the event loop and retries on throttling."""
+        return await self.controller.acall(self._agenerate_model, prompt, cost=self._cost(prompt))
+
+    async def agenerate_stream(self, prompt: str):
+        """Async `generate_stream`; throttling is retried only before the first piece arrives."""
+        cost = self._cost(prompt)
+        for attempt in range(self.controller.max_retries + 1):
+            await self.controller.aacquire(cost)
+            throttled, retry_after, started, completed = False, None, False, False
+            try:
+                if hasattr(self.model, "agenerate_stream"):
+                    stream = self.model.agenerate_stream(prompt)
+                    try:
+                        async for piece in stream:
+                            started = True
+                            yield piece
+                    finally:
+                        await stream.aclose()  # abort the provider stream if our consumer stopped early
+                else:
+                    yield await self._agenerate_model(prompt)
+                completed = True
+                return
+            except Exception as e:
+                throttled, retry_after = classify_error(e)
+                if not throttled or started or attempt == self.controller.max_retries:
+                    raise
+                print(f"⏳ Provider throttled the stream, retrying (window={int(self.controller.limit)}): {e}")
+                record_retry()
+            finally:
+                # A stream the consumer abandoned early (or that failed) only frees its slot
+                self.controller.release(throttled=throttled, retry_after=retry_after, attempt=attempt,
+                                        succeeded=completed)
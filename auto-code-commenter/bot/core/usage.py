@@ -0,0 +1,177 @@
+# bot/core/usage.py
+"""Token usage reported by providers, including prompt-cache hits, plus model call latency.
+
+Model wrappers call `record_response_usage` with each LangChain response. Counts are added to
+the process-wide `total_usage` and to every open `usage_scope`, which the pipeline opens per
+file and per run so the effect of prompt caching on each file's input cost is visible. The
+agent times each model call with `timed_call`, and retry loops report with `record_retry`.
+Call latency leaves out time spent queued behind our own rate limits and throttle backoff
+(`add_queued_seconds`), so it measures the provider rather than the client.
+"""
+
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class TokenUsage:
+    """Accumulated token counts for a set of requests.
+
+    Attributes:
+        requests (int): Responses that reported usage
+        input_tokens (int): Prompt tokens, cached ones included
+        cached_tokens (int): Prompt tokens served from the provider's prefix cache
+        output_tokens (int): Completion tokens
+        calls (int): Model calls timed with `timed_call`
+        latencies (deque[float]): Time of each timed call in seconds, less time queued for
+            rate limits (the most recent `latency_window` of them when a window is set)
+        retries (int): Requests re-sent after a throttle, error or rejected response
+
+    Args:
+        latency_window: Cap on the latencies kept, or None to keep all of them
+    """
+    def __init__(self, latency_window: int = None):
+        self.requests = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+        self.calls = 0
+        self.latencies = deque(maxlen=latency_window)
+        self.retries = 0
+        self.parent = None  # enclosing `usage_scope`, if any
+        self._lock = threading.Lock()
+
+    def add(self, input_tokens: int, cached_tokens: int = 0, output_tokens: int = 0):
+        with self._lock:
+            self.requests += 1
+            self.input_tokens += input_tokens
+            self.cached_tokens += cached_tokens
+            self.output_tokens += output_tokens
+
+    def add_call(self, seconds: float):
+        with self._lock:
+            self.calls += 1
+            self.latencies.append(seconds)
+
+    def add_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    @property
+    def cache_hit_ratio(self) -> float:
+        """Fraction of prompt tokens that were cache hits."""
+        return self.cached_tokens / self.input_tokens if self.input_tokens else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"requests={self.requests} input={self.input_tokens} "
+            f"cached={self.cached_tokens} ({self.cache_hit_ratio:.0%}) output={self.output_tokens}"
+        )
+
+
+# Process-wide; keeps a bounded latency window since a daemon lives across many runs
+total_usage = TokenUsage(latency_window=1000)
+_current_scope = contextvars.ContextVar("usage_scope", default=None)
+
+# Seconds the current context has spent waiting in `RateController.acquire`/`aacquire`, so
+# timings of a provider can leave out time queued behind our own limits
+_queued_seconds = contextvars.ContextVar("queued_seconds", default=0.0)
+
+
+@contextmanager
+def usage_scope(usage: TokenUsage = None):
+    """Collect the usage of every request made inside the block (including tasks and threads it starts).
+
+    Scopes nest: a request counts towards every enclosing scope.
+
+    Args:
+        usage: Existing counts to keep adding to, e.g. to charge a later stage to the same file
+
+    Yields:
+        TokenUsage: The counts for this block only
+    """
+    usage = usage or TokenUsage()
+    usage.parent = _current_scope.get()
+    token = _current_scope.set(usage)
+    try:
+        yield usage
+    finally:
+        _current_scope.reset(token)
+
+
+def usage_from_response(message):
+    """Read `(input, cached, output)` token counts from a LangChain message, or None if absent.
+
+    Cached tokens come from LangChain's normalized `input_token_details.cache_read`, falling back
+    to the raw OpenAI `prompt_tokens_details.cached_tokens` or DeepSeek `prompt_cache_hit_tokens`.
+    """
+    metadata = getattr(message, "usage_metadata", None) or {}
+    raw = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    input_tokens = metadata.get("input_tokens", raw.get("prompt_tokens"))
+    if input_tokens is None:
+        return None
+    cached = (
+        (metadata.get("input_token_details") or {}).get("cache_read")
+        or (raw.get("prompt_tokens_details") or {}).get("cached_tokens")
+        or raw.get("prompt_cache_hit_tokens")
+        or 0
+    )
+    output_tokens = metadata.get("output_tokens", raw.get("completion_tokens", 0))
+    return input_tokens, cached, output_tokens
+
+
+def record_response_usage(message):
+    """Add a response's reported usage to the totals and the current scope, if it has any."""
+    usage = usage_from_response(message)
+    if usage is not None:
+        record_usage(*usage)
+
+
+def record_usage(input_tokens: int, cached_tokens: int = 0, output_tokens: int = 0):
+    """Add token counts (e.g. replayed from a cassette) to the totals and the current scope."""
+    for target in _targets():
+        target.add(input_tokens, cached_tokens, output_tokens)
+
+
+def record_retry():
+    """Count a re-sent request against the totals and the current scope."""
+    for target in _targets():
+        target.add_retry()
+
+
+def queued_seconds(context: contextvars.Context = None) -> float:
+    """Total time the current context (or `context`, read without entering it) has waited for
+    rate-limit slots and budget."""
+    return context.get(_queued_seconds, 0.0) if context is not None else _queued_seconds.get()
+
+
+def add_queued_seconds(seconds: float):
+    """Count time the current context spent waiting for rate-limit slots or budget."""
+    _queued_seconds.set(_queued_seconds.get() + seconds)
+
+
+@contextmanager
+def timed_call():
+    """Time one model call (including its failure) against the totals and the current scope.
+
+    Time the call spends queued in the rate limiter, backoff after a throttle included, is not
+    counted.
+    """
+    started, queued_before = time.perf_counter(), queued_seconds()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started - (queued_seconds() - queued_before)
+        for target in _targets():
+            target.add_call(elapsed)
+
+
+def _targets():
+    """`total_usage` followed by the current scope and every scope enclosing it."""
+    yield total_usage
+    scope = _current_scope.get()
+    while scope is not None:
+        yield scope
+        scope = scope.parent
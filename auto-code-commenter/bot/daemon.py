@@ -0,0 +1,141 @@
+# bot/daemon.py
+"""Warm commenter process serving pre-commit requests over a local Unix socket.
+
+`python -m bot.cli --daemon` pays for imports (LangChain, provider SDKs, nbformat) and model
+setup once, then comments whatever files `bot.client` sends it, so a commit costs time in
+proportion to its staged files rather than to process start-up.
+
+Protocol: the client sends one JSON line `{"cwd", "config", "src", "files"}`; the daemon
+streams the run's output back as `{"out": text}` lines and finishes with `{"exit": code}`.
+Requests are served one at a time on a single event loop, which keeps the provider's async
+clients (bound to the loop they were created on) valid across runs.
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+import time
+import traceback
+
+from bot.client import DEFAULT_IDLE_TIMEOUT, default_socket_path
+from bot.pipeline import CommentingPipeline
+from bot.utils.config_loader import load_config
+
+
+class _SocketOutput:
+    """File-like object forwarding writes from any thread to a client connection."""
+    def __init__(self, writer: asyncio.StreamWriter, loop: asyncio.AbstractEventLoop):
+        self.writer = writer
+        self.loop = loop
+
+    def write(self, text: str) -> int:
+        if text and not self.writer.is_closing():
+            data = (json.dumps({"out": text}) + "\n").encode()
+            try:
+                on_loop = asyncio.get_running_loop() is self.loop
+            except RuntimeError:
+                on_loop = False
+            if on_loop:
+                self.writer.write(data)
+            else:
+                self.loop.call_soon_threadsafe(self.writer.write, data)
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+class CommenterDaemon:
+    """Keeps configured pipelines warm and runs them for socket clients.
+
+    Args:
+        socket_path: Unix socket to listen on
+        idle_timeout: Seconds without requests after which the daemon exits
+    """
+    def __init__(self, socket_path: str, idle_timeout: int = DEFAULT_IDLE_TIMEOUT):
+        self.socket_path = socket_path
+        self.idle_timeout = idle_timeout
+        self.pipelines = {}
+        self.last_used = time.monotonic()
+        self._lock = None
+
+    def _pipeline(self, request: dict) -> CommentingPipeline:
+        """Return the warm pipeline for a request, rebuilding it when the config file changed."""
+        config_path = request.get("config")
+        src = request.get("src") or ["./src"]
+        mtime = os.path.getmtime(config_path) if config_path else None
+        key = (request["cwd"], config_path, tuple(src))
+        cached = self.pipelines.get(key)
+        if cached is None or cached[0] != mtime:
+            config = load_config(config_path) if config_path else None
+            self.pipelines[key] = (mtime, CommentingPipeline(config, src_folder=src))
+        return self.pipelines[key][1]
+
+    async def _run(self, request: dict, writer: asyncio.StreamWriter) -> int:
+        previous = os.getcwd()
+        with contextlib.redirect_stdout(_SocketOutput(writer, asyncio.get_running_loop())):
+            try:
+                # Relative paths in the request and config are relative to the client's directory
+                os.chdir(request["cwd"])
+                await self._pipeline(request).arun(request.get("files"))
+                return 0
+            except Exception as e:
+                print(f"❌ Commenting failed: {e}")
+                traceback.print_exc()
+                return 1
+            finally:
+                os.chdir(previous)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = json.loads(await reader.readline())
+            async with self._lock:
+                code = await self._run(request, writer)
+                self.last_used = time.monotonic()
+            await asyncio.sleep(0)  # let output queued by worker threads go out before the exit line
+            writer.write((json.dumps({"exit": code}) + "\n").encode())
+            await writer.drain()
+        except (ConnectionError, ValueError) as e:
+            print(f"⚠️ Dropped client request: {e}")
+        finally:
+            writer.close()
+
+    async def _already_running(self) -> bool:
+        if not os.path.exists(self.socket_path):
+            return False
+        try:
+            _, writer = await asyncio.open_unix_connection(self.socket_path)
+        except OSError:
+            os.unlink(self.socket_path)  # stale socket left by a daemon that died
+            return False
+        writer.close()
+        return True
+
+    async def serve(self):
+        """Listen until `idle_timeout` seconds pass without a request."""
+        if await self._already_running():
+            print(f"⏭️ A commenter daemon is already listening on {self.socket_path}")
+            return
+        self._lock = asyncio.Lock()
+        # Bind under a restrictive umask so the socket is created 0600: chmod-ing it afterwards
+        # would leave a window in which other users could connect
+        previous_umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        finally:
+            os.umask(previous_umask)
+        print(f"🟢 Commenter daemon listening on {self.socket_path} (pid {os.getpid()})")
+        try:
+            async with server:
+                while self._lock.locked() or time.monotonic() - self.last_used < self.idle_timeout:
+                    await asyncio.sleep(min(5.0, self.idle_timeout))
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.socket_path)
+        print("💤 Commenter daemon idle, exiting.")
+
+
+def serve(socket_path: str = None, idle_timeout: int = DEFAULT_IDLE_TIMEOUT):
+    """Run a daemon in the foreground on `socket_path` (default: derived from the current directory)."""
+    asyncio.run(CommenterDaemon(socket_path or default_socket_path(os.getcwd()), idle_timeout).serve())
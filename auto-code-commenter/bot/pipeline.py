@@ -1,10 +1,37 @@
 # bot/pipeline.py
 
-from bot.agents.comment_agent import CodeCommentAgent
-from bot.utils.file_handler import walk_code_files, read_code, write_code
+from bot.agents.comment_agent import CodeCommentAgent, PROMPT_VERSION
+from bot.utils.file_handler import (CODE_EXTENSIONS, DEFAULT_MAX_FILE_BYTES, inspect_file, is_excluded,
+                                    walk_code_files, read_code, write_code)
+from bot.utils.ignore import IgnoreRules
+from bot.utils.ast_verify import mismatched_definitions
+from bot.utils.doc_coverage import analyze_coverage
+from bot.utils.packing import estimate_tokens
+from bot.utils.python_chunks import split_module
+from bot.utils.manifest import CommentManifest, DEFAULT_MANIFEST_PATH, file_sha256
+from bot.utils.report import RunReport, default_report_path
 from bot.core.models import get_model_instance
+from bot.core.usage import record_retry, usage_scope
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import ast
 import nbformat
 import os
+import time
+
+# Defaults for the staged pipeline; overridable via the `project` config section
+DEFAULT_CONCURRENCY = 4
+DEFAULT_IO_WORKERS = 2
+DEFAULT_QUEUE_SIZE = 32
+DEFAULT_PYTHON_MODE = "whole"
+DEFAULT_CHUNK_CONCURRENCY = 4
+DEFAULT_NOTEBOOK_BATCH_TOKENS = 0  # 0 sends one request per notebook cell
+DEFAULT_PACK_TOKEN_BUDGET = 0  # 0 sends every file in its own request
+DEFAULT_PACK_MAX_FILE_TOKENS = 400
+DEFAULT_COVERAGE_THRESHOLD = 1.0  # skip Python files whose docstring coverage is at least this
+DEFAULT_COMMENT_THRESHOLD = 0.0  # ...and that have at least this many comment lines per code line
+DEFAULT_WINDOW_TOKENS = 3000  # Python modules above this are commented in windows; 0 disables
+DEFAULT_MAX_CONTINUATIONS = 2  # continuations requested for a response cut off by max_tokens
 
 def extract_code_from_ipynb(filepath: str) -> str:
     """Extract code from code cells in a Jupyter notebook.
@@ -54,68 +81,635 @@ def write_notebook(filepath: str, notebook_node):
     except Exception as e:
         print(f"❌ Failed to write notebook {filepath}: {e}")
 
-def run_commenting_pipeline(config=None, model_name: str = "deepseek-chat", src_folder: list[str] = ["./src"]):
-    """Main pipeline for generating and adding code comments.
-    
-    Processes all code files in the specified directory, adding comments using the specified model.
-    Handles Python files, SQL files, and Jupyter notebooks.
-    
+class FileJob:
+    """A single file travelling through the pipeline stages.
+
     Args:
-        config: Optional configuration dictionary
-        model_name: Name of the model to use for comment generation
-        src_folder: Root directory containing source files to process
+        filepath: Path to the source file
     """
-    if config:
-        project_cfg = config.get("project", {})
-        include = project_cfg.get("include", [])
-        exclude = project_cfg.get("exclude", [])
-        file_types = project_cfg.get("file_types", [".py", ".sql", ".ipynb"])
-        model_cfg = config.get("model", {})
-        model = get_model_instance(model_cfg)
-        if include:
-            src_folder = include
-    else:
-        model = get_model_instance({
-            "provider": {"type": "deepseek"},
-            "model_name": model_name,
-        })
-        file_types = [".py", ".sql", ".ipynb"]
-        exclude = []
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self.original = None  # str for .py/.sql, NotebookNode for .ipynb
+        self.updated = None
+        self.focus = None  # top-level definitions to send instead of the whole file
+        self.usage = None  # model usage charged to this file, shared by a packed batch
 
-    agent = CodeCommentAgent(model)
-    for folder in src_folder:
-        for filepath in walk_code_files(folder):
-            if file_types and not any(filepath.endswith(ext) for ext in file_types):
+    @property
+    def is_notebook(self) -> bool:
+        return self.filepath.endswith(".ipynb")
+
+
+class FileBatch:
+    """Several small Python files that share one LLM request.
+
+    Args:
+        jobs: The packed file jobs
+    """
+    def __init__(self, jobs: list[FileJob]):
+        self.jobs = jobs
+
+    @property
+    def filepath(self) -> str:
+        """Label used in log lines."""
+        return f"batch of {len(self.jobs)} files ({self.jobs[0].filepath}, ...)"
+
+
+class StageStats:
+    """Collects queue depth and throughput figures for one pipeline stage.
+
+    Args:
+        name: Human-readable stage name used in the summary
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.processed = 0
+        self.dropped = 0
+        self.busy_seconds = 0.0
+        self.max_queue_depth = 0
+        self._depth_total = 0
+        self._depth_samples = 0
+        self.started = None
+        self.finished = None
+
+    def observe_queue(self, depth: int):
+        """Record the inbound queue depth seen when a worker picks up an item."""
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+        self._depth_total += depth
+        self._depth_samples += 1
+
+    def summary(self) -> str:
+        """Return a one-line summary of the stage's queue depth and throughput."""
+        elapsed = (self.finished or time.perf_counter()) - (self.started or time.perf_counter())
+        throughput = self.processed / elapsed if elapsed > 0 else 0.0
+        avg_depth = self._depth_total / self._depth_samples if self._depth_samples else 0.0
+        return (
+            f"{self.name:<9} processed={self.processed:<5} dropped={self.dropped:<4} "
+            f"queue(avg={avg_depth:.1f}, max={self.max_queue_depth}) "
+            f"busy={self.busy_seconds:.2f}s throughput={throughput:.2f}/s"
+        )
+
+
+class PrefilterStats:
+    """Tallies the LLM calls and tokens saved by the docstring-coverage prefilter."""
+    def __init__(self):
+        self.files_skipped = 0
+        self.files_narrowed = 0
+        self.calls_saved = 0
+        self.tokens_saved = 0
+
+    def summary(self) -> str:
+        """Return a one-line summary of the prefilter savings."""
+        return (
+            f"prefilter skipped={self.files_skipped} narrowed={self.files_narrowed} "
+            f"saved≈{self.calls_saved} call(s), ≈{self.tokens_saved} token(s)"
+        )
+
+
+def _analyze_python(source: str, threshold: float):
+    """CPU-bound part of the prefilter, run in a worker thread.
+
+    Returns:
+        tuple: The file's `analyze_coverage` result, and the estimated tokens of the top-level
+        chunks left out if the file is narrowed to its undocumented definitions (0 otherwise)
+
+    Raises:
+        SyntaxError: If the source cannot be parsed
+    """
+    coverage = analyze_coverage(source)
+    unsent_tokens = 0
+    if coverage.docstring_ratio < threshold and coverage.documented and coverage.undocumented_top_level:
+        unsent_tokens = sum(
+            estimate_tokens(c.source) for c in split_module(source)
+            if not (c.kind in ("function", "class") and c.name in coverage.undocumented_top_level)
+        )
+    return coverage, unsent_tokens
+
+
+def _parses(source: str) -> bool:
+    """True if `source` is valid Python."""
+    try:
+        ast.parse(source)
+    except SyntaxError:
+        return False
+    return True
+
+
+async def _prefilter_python(job: FileJob, threshold: float, stats: PrefilterStats, comment_threshold: float = 0.0):
+    """Apply the docstring-coverage prefilter to a Python job.
+
+    Returns None if the file is documented enough to skip: docstring coverage of at least
+    `threshold` and at least `comment_threshold` comment lines per line of code. Partially documented files are
+    narrowed to their undocumented top-level definitions via `job.focus`. Token savings are
+    estimated as input plus echoed output for everything that is no longer sent. Parsing runs
+    in a worker thread so it does not hold up the event loop.
+    """
+    try:
+        coverage, unsent_tokens = await asyncio.to_thread(_analyze_python, job.original, threshold)
+    except SyntaxError:
+        return job
+
+    if coverage.docstring_ratio >= threshold and coverage.comment_ratio >= comment_threshold:
+        print(f"⏭️  {job.filepath} is already documented (docstring coverage "
+              f"{coverage.docstring_ratio:.0%}, {coverage.comment_ratio:.2f} comments per line), skipping.")
+        stats.files_skipped += 1
+        stats.calls_saved += 1
+        stats.tokens_saved += 2 * estimate_tokens(job.original)
+        return None
+
+    if coverage.documented and coverage.undocumented_top_level:
+        job.focus = coverage.undocumented_top_level
+        stats.files_narrowed += 1
+        stats.tokens_saved += 2 * unsent_tokens
+    return job
+
+
+async def _run_stage(stats: StageStats, inbox: asyncio.Queue, outbox, workers: int, next_workers: int, handler,
+                     report: RunReport = None):
+    """Drain `inbox` with `workers` concurrent workers, forwarding results to `outbox`.
+
+    A `None` item on the inbox stops one worker. Once every worker has stopped, one
+    `None` per downstream worker is pushed so the next stage shuts down in turn.
+    Handlers return the job to forward it, a list of jobs to forward each of them,
+    or None to drop it from the pipeline. Jobs whose handler raised are recorded as
+    failed in `report`.
+    """
+    async def worker():
+        while True:
+            job = await inbox.get()
+            if job is None:
+                return
+            stats.observe_queue(inbox.qsize())
+            start = time.perf_counter()
+            try:
+                result = await handler(job)
+            except Exception as e:
+                print(f"❌ {stats.name} stage failed for {job.filepath}: {e}")
+                if report is not None:
+                    for failed in (job.jobs if isinstance(job, FileBatch) else [job]):
+                        report.fail(failed.filepath, f"{stats.name} stage: {e}")
+                result = None
+            stats.busy_seconds += time.perf_counter() - start
+            if result is None:
+                stats.dropped += 1
                 continue
+            stats.processed += 1
+            if outbox is not None:
+                for item in (result if isinstance(result, list) else [result]):
+                    await outbox.put(item)
+
+    stats.started = time.perf_counter()
+    try:
+        await asyncio.gather(*(worker() for _ in range(workers)))
+    finally:
+        stats.finished = time.perf_counter()
+        if outbox is not None:
+            for _ in range(next_workers):
+                await outbox.put(None)
+
+
+def _iter_candidates(src_folder: list[str], only_files, file_types=None, walk_options: dict = None, on_skip=None):
+    """Yield candidate paths: the explicit file list when given, otherwise a walk of each folder.
 
-            print(f"[...] Commenting: {filepath}")
-
-            if filepath.endswith(".ipynb"):
-                nb_node = load_notebook(filepath)
-                if not nb_node:
-                    print(f"⚠️  Could not load notebook {filepath}, skipping.")
-                    continue
-                updated_nb = agent.generate_comment_for_ipynb(nb_node)
-                write_notebook(filepath, updated_nb)
-                print(f"[✔] Updated: {filepath}")
-                continue  # Skip rest of loop
-
-            original = read_code(filepath)
-            if not original.strip():
-                print(f"⚠️  {filepath} is empty or could not be read, skipping.")
+    `walk_options` (exclude, max_file_bytes, gitignore) are passed to `walk_code_files`; explicit
+    lists get the same exclude patterns and content checks, but not `.gitignore` (they come from
+    git itself).
+    """
+    walk_options = walk_options or {}
+    extensions = tuple(file_types or CODE_EXTENSIONS)
+    if only_files is None:
+        for folder in src_folder:
+            yield from walk_code_files(folder, extensions, on_skip=on_skip, **walk_options)
+        return
+
+    # Explicit lists (e.g. from a git diff) are limited to files under the configured folders
+    roots = [os.path.normpath(os.path.abspath(folder)) for folder in src_folder]
+    exclude = walk_options.get("exclude")
+    excludes = IgnoreRules.from_patterns(os.getcwd(), exclude) if exclude else None
+    for filepath in only_files:
+        absolute = os.path.normpath(os.path.abspath(filepath))
+        if not absolute.endswith(extensions) or not os.path.isfile(absolute):
+            continue
+        if not any(absolute == root or absolute.startswith(root + os.sep) for root in roots):
+            continue
+        if excludes is not None and is_excluded(absolute, excludes):
+            continue
+        reason = inspect_file(absolute, os.path.getsize(absolute),
+                              walk_options.get("max_file_bytes", DEFAULT_MAX_FILE_BYTES))
+        if reason:
+            if on_skip is not None:
+                on_skip(filepath, reason)
+            continue
+        yield filepath
+
+
+async def _discover(src_folder: list[str], file_types: list[str], outbox: asyncio.Queue, stats: StageStats,
+                    next_workers: int, only_files=None, report: RunReport = None, walk_options: dict = None):
+    """Walk the source folders off the event loop and feed matching files downstream."""
+    def skipped(filepath, reason):
+        print(f"⏭️  Skipping {reason} file {filepath}")
+        if report is not None:
+            report.skip(filepath, f"{reason} file")
+
+    stats.started = time.perf_counter()
+    try:
+        files = _iter_candidates(src_folder, only_files, file_types, walk_options, skipped)
+        while True:
+            filepath = await asyncio.to_thread(next, files, None)
+            if filepath is None:
+                break
+            if file_types and not any(filepath.endswith(ext) for ext in file_types):
                 continue
+            stats.processed += 1
+            stats.observe_queue(outbox.qsize())
+            if report is not None:
+                report.file(filepath)  # starts the file's wall clock
+            await outbox.put(FileJob(filepath))
+    finally:
+        stats.finished = time.perf_counter()
+        for _ in range(next_workers):
+            await outbox.put(None)
 
-            if filepath.endswith(".py"):
-                updated = agent.generate_comment_for_python(original)
-            elif filepath.endswith(".sql"):
-                updated = agent.generate_comment_for_sql(original)
-            else:
-                print(f"⚠️  Skipping unsupported file {filepath}")
+
+async def _pack(inbox: asyncio.Queue, outbox: asyncio.Queue, stats: StageStats, next_workers: int,
+                token_budget: int, max_file_tokens: int):
+    """Group small Python files into `FileBatch`es of up to `token_budget` tokens.
+
+    Larger files, notebooks, SQL and files narrowed by the prefilter pass straight through.
+    A batch is flushed as soon as the next file would overflow the budget, and whatever is
+    left is flushed once the read stage is done.
+    """
+    pending, used = [], 0
+
+    async def flush():
+        nonlocal pending, used
+        if len(pending) == 1:
+            await outbox.put(pending[0])
+        elif pending:
+            await outbox.put(FileBatch(pending))
+        pending, used = [], 0
+
+    stats.started = time.perf_counter()
+    try:
+        while True:
+            job = await inbox.get()
+            if job is None:
+                break
+            stats.observe_queue(inbox.qsize())
+            stats.processed += 1
+            size = estimate_tokens(job.original) if isinstance(job.original, str) else 0
+            if not job.filepath.endswith(".py") or job.focus or size > max_file_tokens:
+                await outbox.put(job)
                 continue
+            if pending and used + size > token_budget:
+                await flush()
+            pending.append(job)
+            used += size
+        await flush()
+    finally:
+        stats.finished = time.perf_counter()
+        for _ in range(next_workers):
+            await outbox.put(None)
+
+
+def _make_read_handler(report: RunReport, manifest, coverage_threshold=None, prefilter_stats=None,
+                       comment_threshold: float = 0.0):
+    """Build the read stage handler.
+
+    Files already recorded in the manifest are dropped, and Python files are run through the
+    docstring/comment-coverage prefilter when `coverage_threshold` is set.
+    """
+    async def _read(job: FileJob):
+        if not (job.is_notebook or job.filepath.endswith(".py") or job.filepath.endswith(".sql")):
+            print(f"⚠️  Skipping unsupported file {job.filepath}")
+            report.skip(job.filepath, "unsupported file type")
+            return None
+
+        if manifest is not None:
+            digest = await asyncio.to_thread(file_sha256, job.filepath)
+            if manifest.is_done(digest):
+                print(f"⏭️  Unchanged since last run: {job.filepath}")
+                report.skip(job.filepath, "unchanged since last run")
+                return None
+
+        if job.is_notebook:
+            job.original = await asyncio.to_thread(load_notebook, job.filepath)
+            if not job.original:
+                print(f"⚠️  Could not load notebook {job.filepath}, skipping.")
+                report.skip(job.filepath, "notebook could not be loaded")
+                return None
+            return job
+
+        job.original = await asyncio.to_thread(read_code, job.filepath)
+        if not job.original.strip():
+            print(f"⚠️  {job.filepath} is empty or could not be read, skipping.")
+            report.skip(job.filepath, "empty or unreadable")
+            return None
+        if coverage_threshold is not None and job.filepath.endswith(".py"):
+            if await _prefilter_python(job, coverage_threshold, prefilter_stats, comment_threshold) is None:
+                report.skip(job.filepath, "already documented")
+                return None
+        return job
+    return _read
+
+
+def _make_llm_handler(agent: CodeCommentAgent, report: RunReport):
+    """Build the LLM stage handler; the model is driven through the agent's async API."""
+    async def _comment(job: FileJob):
+        print(f"[...] Commenting: {job.filepath}")
+        jobs = job.jobs if isinstance(job, FileBatch) else [job]
+        with usage_scope() as usage:
+            for member in jobs:
+                member.usage = usage
+                report.file(member.filepath).usage = usage
+                report.file(member.filepath).batch_size = len(jobs)
+            result = await _dispatch(job)
+        if usage.requests:
+            print(f"💾 Tokens for {job.filepath}: {usage.summary()}")
+        return result
 
+    async def _dispatch(job: FileJob):
+        if isinstance(job, FileBatch):
+            return await _comment_batch(job)
+        if job.is_notebook:
+            job.updated = await agent.agenerate_comment_for_ipynb(job.original)
+        elif job.filepath.endswith(".py") and job.focus:
+            job.updated = await agent.agenerate_comment_for_python_symbols(job.original, job.focus)
+        elif job.filepath.endswith(".py"):
+            job.updated = await agent.agenerate_comment_for_python(job.original)
+        else:
+            job.updated = await agent.agenerate_comment_for_sql(job.original)
+        return job
+
+    async def _comment_batch(batch: FileBatch):
+        results = await agent.agenerate_comment_for_python_files([job.original for job in batch.jobs])
+        for job, updated in zip(batch.jobs, results):
+            if updated is None:
+                print(f"🔁 {job.filepath} missing from packed response, sending it on its own.")
+                record_retry()
+                updated = await agent.agenerate_comment_for_python(job.original)
+            job.updated = updated
+        return batch.jobs
+    return _comment
+
+
+def _make_verify_handler(agent: CodeCommentAgent, verify_ast: bool, report: RunReport):
+    """Build the verify stage handler.
+
+    Empty responses and Python that no longer parses are rejected. With `verify_ast`, the
+    result must also match the original AST once docstrings are stripped; definitions the
+    model changed are re-requested individually and spliced back instead of redoing the file.
+    A file whose original does not parse is skipped, since there is nothing to compare against.
+    """
+    async def _verify(job: FileJob):
+        if job.is_notebook:
+            return job
+        if not job.updated or not job.updated.strip():
+            print(f"⚠️  Empty response for {job.filepath}, leaving file untouched.")
+            report.skip(job.filepath, "empty model response")
+            return None
+        if not job.filepath.endswith(".py"):
+            return job
+
+        try:
+            # Parsing and comparing trees is CPU-bound; keep it off the loop so model calls keep flowing
+            if not verify_ast:
+                await asyncio.to_thread(ast.parse, job.updated)
+                return job
+            mismatches = await asyncio.to_thread(mismatched_definitions, job.original, job.updated)
+        except SyntaxError as e:
+            if verify_ast and not await asyncio.to_thread(_parses, job.original):
+                # Nothing to compare the response against; the original has to be fixed first
+                print(f"⚠️  {job.filepath} is not valid Python ({e}), leaving file untouched.")
+                report.skip(job.filepath, "original is not valid Python")
+                return None
+            print(f"⚠️  Response for {job.filepath} is not valid Python ({e}), leaving file untouched.")
+            report.skip(job.filepath, "response is not valid Python")
+            return None
+        if mismatches is None:
+            print(f"⚠️  Response for {job.filepath} changed module-level logic, leaving file untouched.")
+            report.skip(job.filepath, "response changed module-level logic")
+            return None
+        if mismatches:
+            print(f"🔁 {len(mismatches)} definition(s) in {job.filepath} changed logic, re-requesting them.")
+            record_retry()
+            with usage_scope(job.usage):  # charge the repair to the file
+                job.updated = await agent.arepair_definitions(job.original, job.updated, mismatches)
+            try:
+                remaining = await asyncio.to_thread(mismatched_definitions, job.original, job.updated)
+            except SyntaxError:
+                remaining = None  # the spliced repair does not parse
+            if remaining is None or remaining:
+                print(f"⚠️  Could not repair {job.filepath}, leaving file untouched.")
+                report.skip(job.filepath, "response changed logic and could not be repaired")
+                return None
+        return job
+    return _verify
+
+
+def _make_write_handler(manifest, report: RunReport):
+    """Build the write stage handler; written files are recorded in the manifest."""
+    async def _write(job: FileJob):
+        if job.is_notebook:
+            await asyncio.to_thread(write_notebook, job.filepath, job.updated)
+        else:
             print("----- begin updated snippet -----")
-            print(updated[:200])  # Show first 200 chars of updated code as preview
+            print(job.updated[:200])  # Show first 200 chars of updated code as preview
             print("-----  end updated snippet  ------")
+            await asyncio.to_thread(write_code, job.filepath, job.updated)
+        if manifest is not None:
+            manifest.mark_done(await asyncio.to_thread(file_sha256, job.filepath), job.filepath)
+        report.written(job.filepath, await asyncio.to_thread(os.path.getsize, job.filepath))
+        print(f"[✔] Updated: {job.filepath}")
+        return job
+    return _write
+
+
+async def _run_stages(agent: CodeCommentAgent, src_folder: list[str], file_types: list[str],
+                      concurrency: int, io_workers: int, queue_size: int, manifest=None, only_files=None,
+                      verify_ast: bool = True, coverage_threshold=None,
+                      pack_token_budget: int = 0, pack_max_file_tokens: int = DEFAULT_PACK_MAX_FILE_TOKENS,
+                      report: RunReport = None, walk_options: dict = None, comment_threshold: float = 0.0):
+    """Wire the discover → read → (pack) → llm → verify → write stages together and run them.
+
+    What happened to each file is recorded in `report`, which is finished when the run ends.
+    """
+    to_read, to_pack, to_comment, to_verify, to_write = (asyncio.Queue(maxsize=queue_size) for _ in range(5))
+    stats = {name: StageStats(name) for name in ("discover", "read", "pack", "llm", "verify", "write")}
+    prefilter_stats = PrefilterStats()
+    report = report or RunReport()
+    read_handler = _make_read_handler(report, manifest, coverage_threshold, prefilter_stats, comment_threshold)
+
+    # Without packing the read stage feeds the LLM stage directly
+    packing = pack_token_budget > 0
+    if not packing:
+        del stats["pack"]
+        to_pack = to_comment
+    stages = [
+        _discover(src_folder, file_types, to_read, stats["discover"], io_workers, only_files, report, walk_options),
+        _run_stage(stats["read"], to_read, to_pack, io_workers, 1 if packing else concurrency, read_handler, report),
+    ]
+    if packing:
+        stages.append(_pack(to_pack, to_comment, stats["pack"], concurrency, pack_token_budget, pack_max_file_tokens))
+
+    with usage_scope() as run_usage:
+        await asyncio.gather(
+            *stages,
+            _run_stage(stats["llm"], to_comment, to_verify, concurrency, concurrency,
+                       _make_llm_handler(agent, report), report),
+            _run_stage(stats["verify"], to_verify, to_write, concurrency, io_workers,
+                       _make_verify_handler(agent, verify_ast, report), report),
+            _run_stage(stats["write"], to_write, None, io_workers, 0, _make_write_handler(manifest, report), report),
+        )
+    report.finish(run_usage)
 
-            write_code(filepath, updated)
-            print(f"[✔] Updated: {filepath}")
\ No newline at end of file
+    if manifest is not None:
+        manifest.save()
+
+    print("📊 Pipeline stage summary:")
+    for stage in stats.values():
+        print(f"   {stage.summary()}")
+    if coverage_threshold is not None:
+        print(f"   {prefilter_stats.summary()}")
+    if hasattr(agent.llm, "timing_summary"):
+        print(f"   {agent.llm.timing_summary()}")
+    if run_usage.requests:
+        print(f"   tokens    {run_usage.summary()}")
+    print(f"   {report.summary()}")
+    return stats
+
+
+class CommentingPipeline:
+    """A configured pipeline whose model and agent are reused across runs.
+
+    Building it resolves the configuration and instantiates the model once; `run`/`arun` then
+    process files. The daemon keeps one alive so each run skips imports and model setup.
+
+    Args:
+        config: Optional configuration dictionary
+        model_name: Name of the model to use for comment generation
+        src_folder: Root directory containing source files to process
+    """
+    def __init__(self, config=None, model_name: str = "deepseek-chat", src_folder: list[str] = ["./src"]):
+        project_cfg = {}
+        if config:
+            project_cfg = config.get("project", {})
+            include = project_cfg.get("include", [])
+            exclude = project_cfg.get("exclude", [])
+            file_types = project_cfg.get("file_types", [".py", ".sql", ".ipynb"])
+            model_cfg = config.get("model", {})
+            model = get_model_instance(model_cfg)
+            # A list of models hedges across providers; the first one names the cache
+            primary_cfg = model_cfg[0] if isinstance(model_cfg, list) else model_cfg
+            # An unnamed model is identified by its provider type, so cache entries written by
+            # one unnamed provider are never taken as done by another
+            provider_type = primary_cfg.get("provider", {}).get("type")
+            model_name = primary_cfg.get("model_name") or f"{provider_type}:{model_name or ''}"
+            if include:
+                src_folder = include
+        else:
+            model = get_model_instance({
+                "provider": {"type": "deepseek"},
+                "model_name": model_name,
+            })
+            file_types = [".py", ".sql", ".ipynb"]
+            exclude = []
+            model_name = model_name or "deepseek:"
+
+        self.src_folder = src_folder
+        self.file_types = file_types
+        # How the source folders are walked; see `walk_code_files`
+        self.walk_options = {
+            "exclude": exclude,
+            "max_file_bytes": int(project_cfg.get("max_file_bytes", DEFAULT_MAX_FILE_BYTES)),
+            "gitignore": bool(project_cfg.get("respect_gitignore", True)),
+        }
+        self.model_name = model_name
+        self.concurrency = max(1, int(project_cfg.get("concurrency", DEFAULT_CONCURRENCY)))
+        self.io_workers = max(1, int(project_cfg.get("io_workers", DEFAULT_IO_WORKERS)))
+        self.queue_size = max(1, int(project_cfg.get("queue_size", DEFAULT_QUEUE_SIZE)))
+
+        # Set `cache_file` to an empty value to disable the manifest, `report_file` to false to
+        # disable the JSON report; an unset `report_file` keeps the report out of the worktree
+        self.cache_file = project_cfg.get("cache_file", DEFAULT_MANIFEST_PATH)
+        report_file = project_cfg.get("report_file")
+        self.report_file = default_report_path() if report_file is None else report_file
+        self.last_report = None
+
+        self.agent = CodeCommentAgent(
+            model,
+            python_mode=project_cfg.get("python_mode", DEFAULT_PYTHON_MODE),
+            chunk_concurrency=int(project_cfg.get("chunk_concurrency", DEFAULT_CHUNK_CONCURRENCY)),
+            notebook_batch_tokens=int(project_cfg.get("notebook_batch_tokens", DEFAULT_NOTEBOOK_BATCH_TOKENS)),
+            stream_guard=bool(project_cfg.get("stream_guard", True)),
+            sql_split=bool(project_cfg.get("sql_split", True)),
+            window_tokens=int(project_cfg.get("window_tokens", DEFAULT_WINDOW_TOKENS)),
+            max_continuations=int(project_cfg.get("max_continuations", DEFAULT_MAX_CONTINUATIONS)),
+        )
+        self.verify_ast = bool(project_cfg.get("verify_ast", True))
+        # Set `docstring_coverage_threshold` to an empty value to disable the prefilter
+        coverage_threshold = project_cfg.get("docstring_coverage_threshold", DEFAULT_COVERAGE_THRESHOLD)
+        self.coverage_threshold = float(coverage_threshold) if coverage_threshold is not None else None
+        self.comment_threshold = float(project_cfg.get("comment_coverage_threshold") or DEFAULT_COMMENT_THRESHOLD)
+        self.pack_token_budget = int(project_cfg.get("pack_token_budget", DEFAULT_PACK_TOKEN_BUDGET))
+        self.pack_max_file_tokens = int(project_cfg.get("pack_max_file_tokens", DEFAULT_PACK_MAX_FILE_TOKENS))
+        self._executor_loop = None
+
+    async def arun(self, only_files: list[str] | None = None) -> dict:
+        """Process the configured folders (or just `only_files`) on the running event loop.
+
+        Returns:
+            dict: `StageStats` per stage name
+        """
+        # Models without a native `agenerate` fall back to blocking calls in worker threads, so size
+        # the default executor to keep `concurrency` of them in flight with threads left for disk I/O.
+        loop = asyncio.get_running_loop()
+        if self._executor_loop is not loop:
+            loop.set_default_executor(ThreadPoolExecutor(max_workers=2 * self.concurrency + 2 * self.io_workers + 1))
+            self._executor_loop = loop
+
+        # The manifest is re-read every run since the working tree may have changed in between
+        manifest = CommentManifest(self.cache_file, self.model_name, PROMPT_VERSION) if self.cache_file else None
+        report = RunReport(self.model_name, {
+            "prompt_version": PROMPT_VERSION,
+            "python_mode": self.agent.python_mode,
+            "concurrency": self.concurrency,
+            "io_workers": self.io_workers,
+            "pack_token_budget": self.pack_token_budget,
+            "only_files": only_files is not None,
+        })
+        stats = await _run_stages(self.agent, self.src_folder, self.file_types, self.concurrency, self.io_workers,
+                                  self.queue_size, manifest, only_files, self.verify_ast, self.coverage_threshold,
+                                  self.pack_token_budget, self.pack_max_file_tokens, report, self.walk_options,
+                                  self.comment_threshold)
+        self.last_report = report
+        if self.report_file:
+            await asyncio.to_thread(report.save, self.report_file)
+            print(f"📄 Run report written to {self.report_file}")
+        return stats
+
+    def run(self, only_files: list[str] | None = None) -> dict:
+        """Blocking `arun` on a fresh event loop."""
+        return asyncio.run(self.arun(only_files))
+
+
+def run_commenting_pipeline(config=None, model_name: str = "deepseek-chat", src_folder: list[str] = ["./src"],
+                            only_files: list[str] | None = None):
+    """Main pipeline for generating and adding code comments.
+    
+    Processes all code files in the specified directory, adding comments using the specified model.
+    Handles Python files, SQL files, and Jupyter notebooks. Files flow through bounded queues
+    between discover, read, LLM, verify and write stages so disk I/O overlaps with network waits
+    and up to `project.concurrency` model requests are kept in flight. Files whose content matches
+    an entry in the `project.cache_file` manifest for the same model and prompt version are skipped.
+    A JSON report of per-file timings, tokens, retries and skip reasons plus run throughput and
+    call latency percentiles is written to `project.report_file` (by default in `$RUNNER_TEMP` or
+    the system temp directory).
+    
+    Args:
+        config: Optional configuration dictionary
+        model_name: Name of the model to use for comment generation
+        src_folder: Root directory containing source files to process
+        only_files: Optional explicit list of files to process instead of walking `src_folder`;
+            files outside `src_folder` are ignored
+    """
+    return CommentingPipeline(config, model_name, src_folder).run(only_files)
@@ -0,0 +1,89 @@
+# bot/utils/ast_verify.py
+"""Check that commented Python code is logically identical to the original.
+
+Both versions are parsed, docstrings are stripped (comments never reach the AST) and the
+trees are compared node by node. Differences are reported per top-level definition so a
+caller can re-request only the functions or classes the model actually changed.
+"""
+
+import ast
+
+from bot.utils.python_chunks import DEFINITION_NODES
+
+
+class _DocstringStripper(ast.NodeTransformer):
+    """Remove docstrings from modules, classes and functions."""
+
+    def _strip(self, node):
+        self.generic_visit(node)
+        body = node.body
+        if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) \
+                and isinstance(body[0].value.value, str):
+            body = body[1:]
+        # Keep bodies non-empty so a docstring-only function matches a commented `pass`-less one
+        node.body = body or [ast.Pass()]
+        return node
+
+    visit_Module = _strip
+    visit_ClassDef = _strip
+    visit_FunctionDef = _strip
+    visit_AsyncFunctionDef = _strip
+
+
+def _strip_docstrings(tree):
+    """Remove docstrings in place; only for trees parsed just for the comparison."""
+    return _DocstringStripper().visit(tree)
+
+
+def ast_equivalent(original: str, updated: str) -> bool:
+    """Return True if two sources differ only in docstrings, comments and formatting.
+
+    Raises:
+        SyntaxError: If either source cannot be parsed
+    """
+    return _source_dump(original) == _source_dump(updated)
+
+
+def _source_dump(source: str) -> str:
+    return ast.dump(_strip_docstrings(ast.parse(source)), include_attributes=False)
+
+
+def _skeleton(tree: ast.Module) -> list:
+    """Module-level statements of a stripped tree, with each top-level definition reduced to its kind and name."""
+    return [
+        (type(node).__name__, node.name) if isinstance(node, DEFINITION_NODES)
+        else ast.dump(node, include_attributes=False)
+        for node in tree.body
+    ]
+
+
+def mismatched_definitions(original: str, updated: str):
+    """Find the top-level definitions whose logic differs between two sources.
+
+    Both sources are parsed afresh, so their trees are stripped in place rather than copied.
+    This is CPU-bound; async callers should run it in a worker thread.
+
+    Args:
+        original: Source before commenting
+        updated: Source returned by the model
+
+    Returns:
+        list[int]|None: Ordinals (0-based, counting only top-level functions/classes) of the
+        definitions that differ; an empty list if the sources are equivalent; or None if the
+        difference lies outside definitions (or definitions were added, removed or reordered)
+        and cannot be fixed by re-requesting individual definitions
+
+    Raises:
+        SyntaxError: If either source cannot be parsed
+    """
+    original_tree = _strip_docstrings(ast.parse(original))
+    updated_tree = _strip_docstrings(ast.parse(updated))
+    if _skeleton(original_tree) != _skeleton(updated_tree):
+        return None
+
+    original_defs = [n for n in original_tree.body if isinstance(n, DEFINITION_NODES)]
+    updated_defs = [n for n in updated_tree.body if isinstance(n, DEFINITION_NODES)]
+    return [
+        ordinal for ordinal, (before, after) in enumerate(zip(original_defs, updated_defs))
+        if ast.dump(before, include_attributes=False) != ast.dump(after, include_attributes=False)
+    ]
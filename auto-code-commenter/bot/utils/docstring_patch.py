@@ -0,0 +1,183 @@
+# bot/utils/docstring_patch.py
+"""Apply model-produced docstring/comment patches to Python source using `ast` positions.
+
+A patch is a flat JSON object. Keys that are line numbers map to an inline comment for that
+(1-based) line; every other key is a qualified symbol name (``Class.method``, ``outer.inner``)
+or ``__module__`` and maps to the docstring text for that symbol. Only docstrings and comments
+are ever inserted, so the program's logic cannot change.
+"""
+
+import ast
+import io
+import json
+import tokenize
+
+from bot.utils.python_chunks import definition_start
+
+MODULE_KEY = "__module__"
+
+
+def number_lines(code: str) -> str:
+    """Prefix each line with its 1-based line number so the model can reference it."""
+    lines = code.splitlines()
+    width = len(str(len(lines)))
+    return "\n".join(f"{i:>{width}}| {line}" for i, line in enumerate(lines, start=1))
+
+
+def parse_patch_response(text: str) -> dict:
+    """Extract the JSON patch object from a model response.
+
+    Args:
+        text: Raw model output, possibly wrapped in prose or a Markdown fence
+
+    Returns:
+        dict: The decoded patch
+
+    Raises:
+        ValueError: If no JSON object can be decoded
+    """
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        raise ValueError("response does not contain a JSON object")
+    patch = json.loads(text[start:end + 1])
+    if not isinstance(patch, dict):
+        raise ValueError("patch must be a JSON object")
+    return patch
+
+
+def collect_symbols(tree: ast.Module) -> dict:
+    """Map qualified names of all functions and classes to their nodes."""
+    symbols = {}
+
+    def visit(node, prefix):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                name = f"{prefix}{child.name}"
+                symbols.setdefault(name, child)
+                visit(child, f"{name}.")
+
+    visit(tree, "")
+    return symbols
+
+
+def _commentable_lines(code: str) -> set:
+    """Return 1-based line numbers that can safely take a trailing `# comment`.
+
+    A line qualifies if it ends outside any string, is not a backslash continuation,
+    and does not already carry a comment.
+    """
+    ends, commented = set(), set()
+    try:
+        for tok in tokenize.generate_tokens(io.StringIO(code).readline):
+            if tok.type in (tokenize.NEWLINE, tokenize.NL):
+                ends.add(tok.start[0])
+            elif tok.type == tokenize.COMMENT:
+                commented.add(tok.start[0])
+    except (tokenize.TokenError, IndentationError):
+        return set()
+    return ends - commented
+
+
+def _format_docstring(text: str, indent: str) -> list[str]:
+    """Render docstring text as source lines at the given indentation."""
+    text = text.strip().replace("\\", "\\\\").replace('"""', '\\"\\"\\"')
+    if text.endswith('"'):
+        text = text[:-1] + '\\"'  # a trailing quote would merge with the closing delimiter
+    doc_lines = text.splitlines() or [""]
+    if len(doc_lines) == 1:
+        return [f'{indent}"""{doc_lines[0]}"""\n']
+    rendered = [f'{indent}"""{doc_lines[0]}\n']
+    rendered += [f"{indent}{line}\n" if line.strip() else "\n" for line in doc_lines[1:]]
+    rendered.append(f'{indent}"""\n')
+    return rendered
+
+
+def _existing_docstring(body: list):
+    """Return the docstring expression node at the top of a body, if any."""
+    if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) \
+            and isinstance(body[0].value.value, str):
+        return body[0]
+    return None
+
+
+def _module_insert_index(lines: list[str]) -> int:
+    """Index where a new module docstring goes: after any shebang/encoding lines."""
+    index = 0
+    while index < len(lines) and index < 2 and lines[index].startswith("#") and (
+        lines[index].startswith("#!") or "coding" in lines[index]
+    ):
+        index += 1
+    return index
+
+
+def apply_patch(code: str, patch: dict) -> str:
+    """Insert the docstrings and inline comments described by `patch` into `code`.
+
+    Unknown symbols, out-of-range lines, lines that cannot take a comment and one-line
+    definitions are skipped silently.
+
+    Args:
+        code: Original Python source
+        patch: Mapping of qualified names / line numbers to docstring / comment text
+
+    Returns:
+        str: The patched source
+    """
+    tree = ast.parse(code)
+    lines = code.splitlines(keepends=True)
+    if lines and not lines[-1].endswith("\n"):
+        lines[-1] += "\n"
+        had_final_newline = False
+    else:
+        had_final_newline = True
+
+    symbols = collect_symbols(tree)
+    commentable = _commentable_lines(code)
+    docstrings = {}
+
+    # Inline comments only modify existing lines, so apply them before any insertions
+    for key, value in patch.items():
+        if not isinstance(value, str) or not value.strip():
+            continue
+        if str(key).strip().isdigit():
+            lineno = int(str(key).strip())
+            if lineno in commentable and lines[lineno - 1].strip():
+                comment = " ".join(value.strip().lstrip("#").split())
+                lines[lineno - 1] = f"{lines[lineno - 1].rstrip()}  # {comment}\n"
+        else:
+            docstrings[key] = value
+
+    # Docstring edits as (start, end, new_lines); applied bottom-up so indices stay valid
+    edits = []
+    for key, text in docstrings.items():
+        if key == MODULE_KEY:
+            body, indent = tree.body, ""
+        elif key in symbols:
+            node = symbols[key]
+            body = node.body
+            if body[0].lineno == node.lineno:
+                continue  # one-line definition like `def f(): return 1`
+            first_line = lines[body[0].lineno - 1]
+            indent = first_line[:len(first_line) - len(first_line.lstrip())]
+        else:
+            continue
+
+        existing = _existing_docstring(body)
+        if existing is not None:
+            existing_line = lines[existing.lineno - 1]
+            indent = existing_line[:len(existing_line) - len(existing_line.lstrip())]
+            edits.append((existing.lineno - 1, existing.end_lineno, _format_docstring(text, indent)))
+        elif key == MODULE_KEY:
+            index = _module_insert_index(lines)
+            edits.append((index, index, _format_docstring(text, indent)))
+        else:
+            index = definition_start(body[0]) - 1
+            edits.append((index, index, _format_docstring(text, indent)))
+
+    for start, end, new_lines in sorted(edits, key=lambda e: e[0], reverse=True):
+        lines[start:end] = new_lines
+
+    patched = "".join(lines)
+    if not had_final_newline:
+        patched = patched[:-1]
+    return patched
@@ -4,19 +4,126 @@
 import os
 import json
 
-def walk_code_files(src_folder):
-    """Generator that yields paths to code files (.py, .sql, .ipynb) in a directory tree.
-    
+from bot.utils.ignore import IgnoreRules, ancestor_gitignores, is_ignored
+
+CODE_EXTENSIONS = (".py", ".sql", ".ipynb")
+DEFAULT_MAX_FILE_BYTES = 1_000_000
+
+# Never worth descending into, whether or not a .gitignore says so
+PRUNED_DIRS = {
+    ".git", ".hg", ".svn", "node_modules", "__pycache__", ".venv", "venv", ".tox", ".nox",
+    ".mypy_cache", ".pytest_cache", ".ruff_cache", ".ipynb_checkpoints", "site-packages",
+}
+
+# Generator headers; only looked for in the comment lines a file starts with, so docstrings
+# and string literals that merely mention them do not count
+GENERATED_MARKERS = (
+    "@generated", "do not edit", "code generated by", "auto-generated", "autogenerated",
+    "automatically generated", "generated by the protocol buffer compiler",
+)
+HEAD_BYTES = 1024
+COMMENT_PREFIXES = ("#", "--", "//")
+
+
+def _leading_comments(text: str) -> str:
+    """The comment lines (and blank lines between them) at the very top of `text`."""
+    comments = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith(COMMENT_PREFIXES):
+            comments.append(stripped)
+        elif stripped:
+            break
+    return "\n".join(comments)
+
+
+def inspect_file(path: str, size: int, max_file_bytes: int = DEFAULT_MAX_FILE_BYTES):
+    """Return why a file should not be commented ('oversized', 'binary', 'generated'), or None.
+
+    Args:
+        path: File to check
+        size: Its size in bytes
+        max_file_bytes: Size limit; 0 disables it
+    """
+    if max_file_bytes and size > max_file_bytes:
+        return "oversized"
+    try:
+        with open(path, "rb") as f:
+            head = f.read(HEAD_BYTES)
+    except OSError:
+        return "unreadable"
+    if b"\0" in head:
+        return "binary"
+    header = _leading_comments(head.decode("utf-8", errors="replace")).lower()
+    if any(marker in header for marker in GENERATED_MARKERS):
+        return "generated"
+    return None
+
+
+def walk_code_files(src_folder, extensions=CODE_EXTENSIONS, exclude=None, max_file_bytes=DEFAULT_MAX_FILE_BYTES,
+                    gitignore=True, on_skip=None):
+    """Generator that yields paths to code files in a directory tree.
+
+    Directories are pruned before they are entered: version-control and tool caches
+    (`PRUNED_DIRS`), paths matched by `.gitignore` files (those above `src_folder` in the
+    repository and any found while walking), and the config `exclude` patterns. Patterns are
+    compiled once per file. Only files with a matching extension are stat-ed, and those that
+    are oversized, binary or carry an auto-generated header are skipped.
+
     Args:
         src_folder: Root directory to search for code files
+        extensions: File extensions to yield
+        exclude: gitignore-style patterns relative to the current (project) directory
+        max_file_bytes: Files larger than this are skipped; 0 disables the limit
+        gitignore: Honour `.gitignore` files
+        on_skip: Optional callback `(path, reason)` for files skipped by the content checks
         
     Yields:
         str: Full path to each matching code file
     """
-    for root, _, files in os.walk(src_folder):
-        for file in files:
-            if file.endswith(".py") or file.endswith(".sql") or file.endswith(".ipynb"):
-                yield os.path.join(root, file)
+    extensions = tuple(extensions or CODE_EXTENSIONS)
+    # Config excludes come last so they win over anything a .gitignore re-includes
+    excludes = [IgnoreRules.from_patterns(os.getcwd(), exclude)] if exclude else []
+
+    def walk(directory, gitignores):
+        local = IgnoreRules.from_file(os.path.join(directory, ".gitignore")) if gitignore else None
+        rulesets = gitignores + ([local] if local is not None else [])
+        applied = rulesets + excludes
+        try:
+            entries = sorted(os.scandir(directory), key=lambda e: e.name)
+        except OSError:
+            return
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in PRUNED_DIRS and not is_ignored(applied, os.path.abspath(entry.path), True):
+                    subdirs.append(entry.path)
+                continue
+            if not entry.name.endswith(extensions) or not entry.is_file():
+                continue
+            if is_ignored(applied, os.path.abspath(entry.path), False):
+                continue
+            reason = inspect_file(entry.path, entry.stat().st_size, max_file_bytes)
+            if reason:
+                if on_skip is not None:
+                    on_skip(entry.path, reason)
+                continue
+            yield entry.path
+        for subdir in subdirs:
+            yield from walk(subdir, rulesets)
+
+    yield from walk(src_folder, ancestor_gitignores(src_folder) if gitignore else [])
+
+
+def is_excluded(path: str, excludes: IgnoreRules) -> bool:
+    """True if `path` or a directory above it (below the rules' base) matches the exclude rules."""
+    current, is_dir = os.path.abspath(path), False
+    while current.startswith(excludes.base + os.sep):
+        if is_ignored([excludes], current, is_dir):
+            return True
+        current, is_dir = os.path.dirname(current), True
+    return False
+
 
 def read_code(filepath):
     """Reads content from a code file, handling Jupyter notebooks specially.
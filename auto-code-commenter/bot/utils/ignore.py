@@ -0,0 +1,166 @@
+# bot/utils/ignore.py
+"""Compile `.gitignore`-style patterns once and match paths against them.
+
+Supports the usual gitignore syntax: `#` comments, `!` negation, a trailing `/` for
+directories only, a leading or inner `/` to anchor a pattern to its base directory,
+`*`, `?`, `[...]` and `**`. A pattern without a slash matches a name at any depth.
+As in git, the last matching pattern wins, and a file inside an ignored directory stays
+ignored because the walker never descends into that directory.
+"""
+
+import os
+import re
+
+
+def _translate(pattern: str) -> str:
+    """Translate a gitignore glob (without anchoring or a trailing slash) into a regex."""
+    out, i, n = [], 0, len(pattern)
+    while i < n:
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == n:
+            out.append("/.*")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            out.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2:]:
+            end = pattern.index("]", i + 2)
+            body = pattern[i + 1:end].replace("\\", "\\\\")
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            out.append(f"[{body}]")
+            i = end + 1
+        elif pattern[i] == "\\" and i + 1 < n:
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(out)
+
+
+class IgnoreRule:
+    """One compiled pattern line.
+
+    Attributes:
+        negated (bool): The pattern re-includes matches (`!pattern`)
+        dir_only (bool): The pattern only matches directories (trailing `/`)
+    """
+    def __init__(self, line: str):
+        self.negated = line.startswith("!")
+        if self.negated:
+            line = line[1:]
+        self.dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        anchored = "/" in line
+        line = line.lstrip("/")
+        prefix = "" if anchored else "(?:.*/)?"
+        self.regex = re.compile(f"^{prefix}{_translate(line)}$")
+
+    def matches(self, relpath: str, is_dir: bool) -> bool:
+        return (is_dir or not self.dir_only) and self.regex.match(relpath) is not None
+
+
+def parse_patterns(lines) -> list[IgnoreRule]:
+    """Compile gitignore lines, skipping blanks and comments."""
+    rules = []
+    for raw in lines:
+        line = raw.rstrip("\n")
+        if not line.endswith("\\ "):
+            line = line.rstrip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith(("\\#", "\\!")):
+            line = line[1:]
+        rules.append(IgnoreRule(line))
+    return rules
+
+
+class IgnoreRules:
+    """Patterns that apply below one base directory (a `.gitignore`'s folder, or the project root).
+
+    Args:
+        base: Directory the patterns are relative to
+        rules: Compiled patterns, in file order
+    """
+    def __init__(self, base: str, rules: list[IgnoreRule]):
+        self.base = os.path.abspath(base)
+        self.rules = rules
+
+    @classmethod
+    def from_patterns(cls, base: str, patterns: list[str]):
+        return cls(base, parse_patterns(patterns))
+
+    @classmethod
+    def from_file(cls, path: str):
+        """Load a `.gitignore`; returns None if it is missing, unreadable or empty."""
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                rules = parse_patterns(f)
+        except OSError:
+            return None
+        return cls(os.path.dirname(path), rules) if rules else None
+
+    def decide(self, abspath: str, is_dir: bool):
+        """Return True (ignored), False (re-included) or None (no pattern matched)."""
+        relpath = os.path.relpath(abspath, self.base)
+        if relpath == "." or relpath.startswith(".."):
+            return None
+        relpath = relpath.replace(os.sep, "/")
+        decision = None
+        for rule in self.rules:
+            if rule.matches(relpath, is_dir):
+                decision = not rule.negated
+        return decision
+
+
+def is_ignored(rulesets, abspath: str, is_dir: bool) -> bool:
+    """Apply rule sets from outermost to innermost; the last decision wins."""
+    ignored = False
+    for ruleset in rulesets:
+        decision = ruleset.decide(abspath, is_dir)
+        if decision is not None:
+            ignored = decision
+    return ignored
+
+
+def find_repo_root(path: str):
+    """Return the nearest directory at or above `path` that contains `.git`, or None."""
+    current = os.path.abspath(path)
+    while True:
+        if os.path.exists(os.path.join(current, ".git")):
+            return current
+        parent = os.path.dirname(current)
+        if parent == current:
+            return None
+        current = parent
+
+
+def ancestor_gitignores(path: str) -> list[IgnoreRules]:
+    """`.gitignore` rules of the directories from the repository root down to `path`'s parent.
+
+    Outside a git repository no ancestor rules apply.
+    """
+    root = find_repo_root(path)
+    if root is None:
+        return []
+    rulesets, current = [], os.path.dirname(os.path.abspath(path))
+    chain = []
+    while current.startswith(root):
+        chain.append(current)
+        if current == root:
+            break
+        current = os.path.dirname(current)
+    for directory in reversed(chain):
+        rules = IgnoreRules.from_file(os.path.join(directory, ".gitignore"))
+        if rules is not None:
+            rulesets.append(rules)
+    return rulesets
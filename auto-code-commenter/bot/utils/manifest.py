@@ -0,0 +1,106 @@
+# bot/utils/manifest.py
+"""Content-addressed manifest of files the bot has already commented.
+
+The manifest is a small JSON file committed next to the code (``.commenter-cache.json`` by
+default). It maps the sha256 of each file's post-comment content to the model and prompt
+version that produced it, so a later run can skip files nobody has touched since.
+"""
+
+import hashlib
+import json
+import os
+
+DEFAULT_MANIFEST_PATH = ".commenter-cache.json"
+MANIFEST_VERSION = 1
+
+
+def file_sha256(filepath: str) -> str:
+    """Return the hex sha256 digest of a file's raw bytes.
+
+    Args:
+        filepath: Path to the file to hash
+
+    Returns:
+        str: Hex digest of the file content
+    """
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class CommentManifest:
+    """Tracks which file contents have already been commented by a given model and prompt.
+
+    Args:
+        path: Location of the manifest JSON file
+        model_name: Model identifier recorded with each entry
+        prompt_version: Prompt version recorded with each entry
+    """
+    def __init__(self, path: str, model_name: str, prompt_version: str):
+        self.path = path
+        self.model_name = model_name or ""
+        self.prompt_version = prompt_version
+        self.entries = {}
+        self._digests_by_path = {}  # path -> digests of its entries, so updates skip a full scan
+        self._dirty = False
+        self.load()
+
+    def load(self):
+        """Load entries from disk, starting empty if the file is missing or unreadable."""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.entries = data.get("entries", {})
+        except Exception as e:
+            print(f"⚠️  Could not read manifest {self.path}, starting fresh: {e}")
+            self.entries = {}
+        self._digests_by_path = {}
+        for digest, entry in self.entries.items():
+            self._digests_by_path.setdefault(entry.get("path"), set()).add(digest)
+
+    def is_done(self, digest: str) -> bool:
+        """Return True if content with this digest was commented by the current model and prompt."""
+        entry = self.entries.get(digest)
+        return bool(
+            entry
+            and entry.get("model") == self.model_name
+            and entry.get("prompt_version") == self.prompt_version
+        )
+
+    def mark_done(self, digest: str, filepath: str):
+        """Record the post-comment digest of a file, replacing older entries for the same path.
+
+        Args:
+            digest: sha256 of the file content after commenting
+            filepath: Path of the file, kept so stale entries can be dropped
+        """
+        path = os.path.normpath(filepath)
+        for stale in self._digests_by_path.pop(path, ()):
+            if self.entries.get(stale, {}).get("path") == path:
+                del self.entries[stale]
+        previous = self.entries.get(digest)
+        if previous is not None:  # identical content recorded under another path moves here
+            self._digests_by_path.get(previous.get("path"), set()).discard(digest)
+        self._digests_by_path[path] = {digest}
+        self.entries[digest] = {
+            "path": path,
+            "model": self.model_name,
+            "prompt_version": self.prompt_version,
+        }
+        self._dirty = True
+
+    def save(self):
+        """Atomically write the manifest back to disk if it changed."""
+        if not self._dirty:
+            return
+        payload = {"version": MANIFEST_VERSION, "entries": self.entries}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=2, sort_keys=True)
+            f.write("\n")
+        os.replace(tmp_path, self.path)
+        self._dirty = False
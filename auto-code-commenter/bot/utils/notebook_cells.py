@@ -0,0 +1,44 @@
+# bot/utils/notebook_cells.py
+"""Helpers for deciding which notebook cells actually need an LLM call."""
+
+import hashlib
+
+# Key under each cell's metadata where the bot records what it last commented
+METADATA_KEY = "auto_code_commenter"
+
+
+def cell_digest(source: str) -> str:
+    """Return the sha256 hex digest of a cell's source."""
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+
+def is_magic_only(source: str) -> bool:
+    """True if a cell holds nothing but IPython magics, shell escapes and comments.
+
+    Cell magics (`%%bash`, `%%sql`, ...) make the whole cell non-Python, so they count too.
+    """
+    lines = [line.strip() for line in source.splitlines() if line.strip()]
+    if not lines:
+        return True
+    if lines[0].startswith("%%"):
+        return True
+    return all(line.startswith(("%", "!", "#")) for line in lines)
+
+
+def needs_commenting(cell, prompt_version: str) -> bool:
+    """True for non-empty code cells that are not magic-only and changed since last commented."""
+    if cell.cell_type != "code" or not cell.source.strip() or is_magic_only(cell.source):
+        return False
+    record = cell.get("metadata", {}).get(METADATA_KEY) or {}
+    return not (
+        record.get("sha256") == cell_digest(cell.source)
+        and record.get("prompt_version") == prompt_version
+    )
+
+
+def mark_commented(cell, prompt_version: str):
+    """Record the hash of the cell's (commented) source in its metadata."""
+    cell.metadata[METADATA_KEY] = {
+        "sha256": cell_digest(cell.source),
+        "prompt_version": prompt_version,
+    }
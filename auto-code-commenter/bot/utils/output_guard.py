@@ -0,0 +1,58 @@
+# bot/utils/output_guard.py
+"""Detect output-rule violations (Markdown fences, prose) from the first tokens of a response."""
+
+import re
+
+# How much of a streamed response to look at before deciding it is clean
+HEAD_CHARS = 80
+
+_PROSE_LEAD_IN = re.compile(
+    r"^(here(?:'s| is| are)|sure\b|certainly\b|of course\b|okay\b|ok\b|below\b|i(?:'ve| have| added)\b"
+    r"|the (?:following|annotated|updated|commented)\b|this (?:code|is)\b|as requested\b)",
+    re.IGNORECASE,
+)
+# A lead-in word followed by one of these is an identifier in code (`ok = check()`,
+# `below[0]`, `sure.x`, `sure: bool = True`), not the start of a sentence ("Sure. Here ...")
+_CODE_AFTER_LEAD_IN = re.compile(r"\s*(?:[=(\[:]|\.(?=\w)|(?:[-+*/%&|^@]|//|\*\*|<<|>>)=)")
+
+STRICT_PREFIX = (
+    "IMPORTANT: a previous answer to this request was rejected because it did not start with code. "
+    "The very first characters of your reply must be the code itself: no Markdown fences, "
+    "no introduction, no explanation.\n"
+)
+
+
+def detect_violation(head: str):
+    """Inspect the beginning of a response and describe the rule it breaks, if any.
+
+    Args:
+        head: The first characters of the model response
+
+    Returns:
+        str|None: A short reason such as 'markdown fence' or 'prose', or None if the start
+        looks like code (or there is not enough text yet to tell)
+
+    A prose lead-in ("Sure", "Here is", "Below") only counts when the token after it is not
+    code, so lines such as ``ok = check()`` or ``below = 3`` pass.
+    """
+    text = head.lstrip()
+    if not text:
+        return None
+    if text.startswith("```") or text.startswith("~~~"):
+        return "markdown fence"
+    first_line = text.splitlines()[0]
+    match = _PROSE_LEAD_IN.match(first_line)
+    if match is None:
+        return None
+    rest = first_line[match.end():]
+    if not rest.strip() and "\n" not in text:
+        return None  # the token after the lead-in has not arrived yet
+    if _CODE_AFTER_LEAD_IN.match(rest):
+        return None
+    return "prose"
+
+
+def head_is_decided(head: str) -> bool:
+    """True once enough of the response has arrived to judge its opening."""
+    text = head.lstrip()
+    return len(text) >= HEAD_CHARS or "\n" in text
@@ -0,0 +1,77 @@
+# bot/utils/packing.py
+"""Pack several code sections into one LLM request and split the response back apart.
+
+Sections are wrapped in comment-style delimiter lines carrying a stable id, e.g.::
+
+    # <<<CELL 3>>>
+    ...code...
+    # <<<END CELL 3>>>
+
+Both Python and SQL tolerate the delimiters as comments if the model echoes them oddly,
+and sections the model drops or mangles are simply missing from the unpacked result.
+"""
+
+import re
+
+# Rough characters-per-token ratio for code; good enough for budgeting requests
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheaply estimate the number of tokens in `text`."""
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def section_markers(tag: str, section_id, comment: str = "#") -> tuple[str, str]:
+    """Return the start and end delimiter lines for a section."""
+    return f"{comment} <<<{tag} {section_id}>>>", f"{comment} <<<END {tag} {section_id}>>>"
+
+
+def pack_sections(sections: list[tuple], tag: str, comment: str = "#") -> str:
+    """Join `(id, text)` sections into one delimited payload.
+
+    Args:
+        sections: Ordered list of (section id, text) pairs
+        tag: Delimiter tag, e.g. 'CELL' or 'FILE'
+        comment: Line-comment prefix of the language being packed
+
+    Returns:
+        str: The packed payload
+    """
+    parts = []
+    for section_id, text in sections:
+        start, end = section_markers(tag, section_id, comment)
+        parts.append(f"{start}\n{text.rstrip(chr(10))}\n{end}")
+    return "\n".join(parts) + "\n"
+
+
+def unpack_sections(response: str, tag: str, comment: str = "#") -> dict:
+    """Split a packed response back into `{id: text}`.
+
+    Only sections with matching start and end markers are returned; ids are returned as strings.
+    """
+    pattern = re.compile(
+        rf"^[ \t]*{re.escape(comment)} <<<{re.escape(tag)} (?P<id>[^>\s]+)>>>[ \t]*\n"
+        rf"(?P<body>.*?)"
+        rf"^[ \t]*{re.escape(comment)} <<<END {re.escape(tag)} (?P=id)>>>[ \t]*$",
+        re.MULTILINE | re.DOTALL,
+    )
+    return {m.group("id"): m.group("body") for m in pattern.finditer(response)}
+
+
+def plan_batches(sections: list[tuple], token_budget: int) -> list[list[tuple]]:
+    """Greedily group `(id, text)` sections into batches of at most `token_budget` tokens.
+
+    A section larger than the budget on its own gets a batch to itself.
+    """
+    batches, current, used = [], [], 0
+    for section in sections:
+        size = estimate_tokens(section[1])
+        if current and used + size > token_budget:
+            batches.append(current)
+            current, used = [], 0
+        current.append(section)
+        used += size
+    if current:
+        batches.append(current)
+    return batches
@@ -0,0 +1,114 @@
+# bot/utils/python_chunks.py
+"""Split Python modules into top-level chunks and splice them back together by line range."""
+
+import ast
+
+DEFINITION_NODES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+class CodeChunk:
+    """A contiguous line range of a module.
+
+    Attributes:
+        kind (str): 'header' (code before the first definition), 'function', 'class' or 'glue'
+            (module-level code between or after definitions)
+        name (str|None): Name of the function or class, if any
+        start (int): 0-based index of the first line
+        end (int): 0-based index one past the last line
+        source (str): Text of the chunk, without trailing blank lines
+        trailing (str): Trailing blank lines, kept aside so they survive the round trip
+    """
+    def __init__(self, kind: str, name, start: int, end: int, lines: list[str]):
+        self.kind = kind
+        self.name = name
+        self.start = start
+        self.end = end
+        body = lines[start:end]
+        cut = len(body)
+        while cut and not body[cut - 1].strip():
+            cut -= 1
+        self.source = "".join(body[:cut])
+        self.trailing = "".join(body[cut:])
+
+    @property
+    def has_code(self) -> bool:
+        """True if the chunk contains anything other than blank lines and comments."""
+        return any(
+            line.strip() and not line.lstrip().startswith("#")
+            for line in self.source.splitlines()
+        )
+
+    @property
+    def label(self) -> str:
+        """Short human-readable description used in prompts and logs."""
+        if self.name:
+            return f"{self.kind} `{self.name}`"
+        return f"module {self.kind}"
+
+
+def definition_start(node) -> int:
+    """Return the 1-based first line of a definition, including its decorators."""
+    return min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+
+
+def split_module(code: str) -> list[CodeChunk]:
+    """Split a module into ordered chunks that together cover every line.
+
+    Args:
+        code: Python source code
+
+    Returns:
+        list[CodeChunk]: Header, definition and glue chunks in file order
+
+    Raises:
+        SyntaxError: If the code cannot be parsed
+    """
+    tree = ast.parse(code)
+    lines = code.splitlines(keepends=True)
+    chunks = []
+    cursor = 0
+
+    for node in tree.body:
+        if not isinstance(node, DEFINITION_NODES):
+            continue
+        start = definition_start(node) - 1
+        if start > cursor:
+            kind = "header" if not chunks else "glue"
+            chunks.append(CodeChunk(kind, None, cursor, start, lines))
+        kind = "class" if isinstance(node, ast.ClassDef) else "function"
+        chunks.append(CodeChunk(kind, node.name, start, node.end_lineno, lines))
+        cursor = node.end_lineno
+
+    if cursor < len(lines):
+        kind = "header" if not chunks else "glue"
+        chunks.append(CodeChunk(kind, None, cursor, len(lines), lines))
+    return chunks
+
+
+def splice_chunks(chunks: list[CodeChunk], replacements: dict) -> str:
+    """Reassemble a module from its chunks, substituting commented versions where available.
+
+    Args:
+        chunks: Chunks returned by `split_module`
+        replacements: Mapping of chunk index to replacement source
+
+    Returns:
+        str: The reassembled module
+    """
+    parts = []
+    for index, chunk in enumerate(chunks):
+        text = replacements.get(index, chunk.source)
+        if chunk.source.endswith("\n") and not text.endswith("\n"):
+            text += "\n"
+        parts.append(text)
+        parts.append(chunk.trailing)
+    return "".join(parts)
+
+
+def strip_code_fences(text: str) -> str:
+    """Remove a surrounding Markdown code fence if the model added one anyway."""
+    stripped = text.strip("\n")
+    lines = stripped.splitlines()
+    if len(lines) >= 2 and lines[0].lstrip().startswith("```") and lines[-1].strip() == "```":
+        return "\n".join(lines[1:-1]) + "\n"
+    return text
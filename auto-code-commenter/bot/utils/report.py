@@ -0,0 +1,183 @@
+# bot/utils/report.py
+"""Machine-readable per-run performance report.
+
+The pipeline records what happened to every file it discovered (written, skipped with a
+reason, or failed), how long the file took end to end, and the model calls, tokens and
+retries spent on it. Run totals add throughput in files/minute and p50/p95/p99 model call
+latency, so runs can be compared across releases and providers. The report is written as
+JSON, by default to ``commenter-report.json`` in ``$RUNNER_TEMP`` (GitHub Actions) or the
+system temp directory, so it never lands in the worktree being commented.
+"""
+
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+
+REPORT_FILENAME = "commenter-report.json"
+REPORT_VERSION = 1
+
+
+def default_report_path() -> str:
+    """Where the report goes when `report_file` is not set: outside any checkout."""
+    return os.path.join(os.environ.get("RUNNER_TEMP") or tempfile.gettempdir(), REPORT_FILENAME)
+
+
+def percentile(values, p: float):
+    """Nearest-rank `p`-th percentile (0-100) of `values`, or None if there are none."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def _latency_summary(latencies) -> dict:
+    def rounded(value):
+        return round(value, 4) if value is not None else None
+    return {
+        "count": len(latencies),
+        "p50": rounded(percentile(latencies, 50)),
+        "p95": rounded(percentile(latencies, 95)),
+        "p99": rounded(percentile(latencies, 99)),
+        "max": rounded(max(latencies, default=None)),
+    }
+
+
+class FileReport:
+    """What the pipeline did with one file.
+
+    Attributes:
+        filepath (str): Path as discovered
+        status (str): "pending", "written", "skipped" or "failed"
+        reason (str|None): Why the file was skipped or failed
+        wall_seconds (float): Time from discovery to the file's final status
+        bytes_written (int): Size of the file after writing
+        batch_size (int): Files that shared this file's model requests; model figures of a
+            packed file are those of the whole batch
+        usage (TokenUsage|None): Model calls, latency, tokens and retries spent on the file
+    """
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self.status = "pending"
+        self.reason = None
+        self.wall_seconds = 0.0
+        self.bytes_written = 0
+        self.batch_size = 1
+        self.usage = None
+        self._started = time.perf_counter()
+
+    def finish(self, status: str, reason: str = None):
+        """Set the final status; only the first call counts."""
+        if self.status != "pending":
+            return
+        self.status = status
+        self.reason = reason
+        self.wall_seconds = time.perf_counter() - self._started
+
+    def to_dict(self) -> dict:
+        usage = self.usage
+        return {
+            "path": self.filepath,
+            "status": self.status,
+            "reason": self.reason,
+            "wall_seconds": round(self.wall_seconds, 4),
+            "llm_calls": usage.calls if usage else 0,
+            "llm_seconds": round(sum(usage.latencies), 4) if usage else 0.0,
+            "input_tokens": usage.input_tokens if usage else 0,
+            "cached_tokens": usage.cached_tokens if usage else 0,
+            "output_tokens": usage.output_tokens if usage else 0,
+            "retries": usage.retries if usage else 0,
+            "bytes_written": self.bytes_written,
+            "batch_size": self.batch_size,
+        }
+
+
+class RunReport:
+    """Collects `FileReport`s for one pipeline run and writes them out as JSON.
+
+    Args:
+        model_name: Model recorded in the report header
+        settings: Pipeline settings recorded in the report header (concurrency, mode, ...)
+    """
+    def __init__(self, model_name: str = None, settings: dict = None):
+        self.model_name = model_name
+        self.settings = settings or {}
+        self.files = {}
+        self.usage = None
+        self.started_at = datetime.now(timezone.utc)
+        self.wall_seconds = 0.0
+        self._started = time.perf_counter()
+
+    def file(self, filepath: str) -> FileReport:
+        """Return the record for a file, starting its clock on first use."""
+        if filepath not in self.files:
+            self.files[filepath] = FileReport(filepath)
+        return self.files[filepath]
+
+    def skip(self, filepath: str, reason: str):
+        self.file(filepath).finish("skipped", reason)
+
+    def fail(self, filepath: str, reason: str):
+        self.file(filepath).finish("failed", reason)
+
+    def written(self, filepath: str, bytes_written: int):
+        record = self.file(filepath)
+        record.bytes_written = bytes_written
+        record.finish("written")
+
+    def finish(self, usage=None):
+        """Stop the run clock; `usage` is the run's `TokenUsage`, used for the totals."""
+        self.wall_seconds = time.perf_counter() - self._started
+        self.usage = usage
+        for record in self.files.values():
+            record.finish("failed", "did not finish")
+
+    def to_dict(self) -> dict:
+        records = list(self.files.values())
+        counts = {status: sum(r.status == status for r in records) for status in ("written", "skipped", "failed")}
+        minutes = self.wall_seconds / 60
+        usage = self.usage
+        latencies = list(usage.latencies) if usage else []
+        return {
+            "version": REPORT_VERSION,
+            "started_at": self.started_at.isoformat(),
+            "model": self.model_name,
+            "settings": self.settings,
+            "totals": {
+                "files": len(records),
+                **counts,
+                "wall_seconds": round(self.wall_seconds, 4),
+                "files_per_minute": round(len(records) / minutes, 2) if minutes else None,
+                "written_per_minute": round(counts["written"] / minutes, 2) if minutes else None,
+                "llm_calls": usage.calls if usage else 0,
+                "llm_latency_seconds": _latency_summary(latencies),
+                "input_tokens": usage.input_tokens if usage else 0,
+                "cached_tokens": usage.cached_tokens if usage else 0,
+                "output_tokens": usage.output_tokens if usage else 0,
+                "retries": usage.retries if usage else 0,
+                "bytes_written": sum(r.bytes_written for r in records),
+            },
+            "files": [r.to_dict() for r in records],
+        }
+
+    def summary(self) -> str:
+        """One-line summary of throughput and call latency."""
+        totals = self.to_dict()["totals"]
+        latency = totals["llm_latency_seconds"]
+
+        def fmt(value):
+            return f"{value:.2f}s" if value is not None else "n/a"
+        return (
+            f"report    files={totals['files']} written={totals['written']} skipped={totals['skipped']} "
+            f"failed={totals['failed']} files/min={totals['files_per_minute']} "
+            f"latency p50={fmt(latency['p50'])} p95={fmt(latency['p95'])} p99={fmt(latency['p99'])}"
+        )
+
+    def save(self, path: str):
+        """Atomically write the report as JSON."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+            f.write("\n")
+        os.replace(tmp_path, path)
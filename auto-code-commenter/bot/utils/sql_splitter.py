@@ -0,0 +1,129 @@
+# bot/utils/sql_splitter.py
+"""Local SQL tokenizer used to split files into statements and spot trivial ones.
+
+The tokenizer only needs to know where strings, quoted identifiers, comments and
+PostgreSQL dollar-quoted bodies start and end, so that a `;` inside any of them is not
+mistaken for a statement terminator. Splitting is lossless: joining the returned
+statements gives back the original text exactly.
+"""
+
+import re
+
+_DOLLAR_TAG = re.compile(r"\$([A-Za-z_][A-Za-z0-9_]*)?\$")
+
+# Constructs that make a statement worth annotating
+_COMPLEX_PATTERNS = [
+    re.compile(p, re.IGNORECASE) for p in (
+        r"\bJOIN\b", r"\(\s*SELECT\b", r"\bGROUP\s+BY\b", r"\bHAVING\b", r"\bOVER\s*\(",
+        r"\bWINDOW\b", r"\bCASE\b", r"\bUNION\b", r"\bINTERSECT\b", r"\bEXCEPT\b",
+        r"^\s*WITH\b", r"\bMERGE\b", r"\bEXISTS\b", r"\bCREATE\s+(OR\s+REPLACE\s+)?(FUNCTION|PROCEDURE|TRIGGER|VIEW)\b",
+        r"\bPARTITION\s+BY\b", r"\bLATERAL\b", r"\bRECURSIVE\b",
+    )
+]
+
+# Statements longer than this many lines are annotated even without complex constructs
+TRIVIAL_MAX_LINES = 15
+
+
+def tokenize_sql(sql: str):
+    """Yield `(kind, text)` tokens covering `sql` exactly.
+
+    Kinds are 'ws', 'comment', 'string', 'quoted' (quoted identifier), 'dollar'
+    (dollar-quoted body), 'semicolon' and 'other' (words, numbers, operators).
+    Unterminated strings or comments run to the end of the input.
+    """
+    i, n = 0, len(sql)
+    while i < n:
+        ch = sql[i]
+        if ch.isspace():
+            j = i + 1
+            while j < n and sql[j].isspace():
+                j += 1
+            yield "ws", sql[i:j]
+        elif sql.startswith("--", i):
+            j = sql.find("\n", i)
+            j = n if j == -1 else j
+            yield "comment", sql[i:j]
+        elif sql.startswith("/*", i):
+            # PostgreSQL allows nested block comments
+            depth, j = 1, i + 2
+            while j < n and depth:
+                if sql.startswith("/*", j):
+                    depth, j = depth + 1, j + 2
+                elif sql.startswith("*/", j):
+                    depth, j = depth - 1, j + 2
+                else:
+                    j += 1
+            yield "comment", sql[i:j]
+        elif ch in ("'", '"', "`"):
+            j = i + 1
+            while j < n:
+                if sql[j] == ch:
+                    if j + 1 < n and sql[j + 1] == ch:  # doubled quote escapes itself
+                        j += 2
+                        continue
+                    j += 1
+                    break
+                j += 1
+            else:
+                j = n
+            yield ("string" if ch == "'" else "quoted"), sql[i:j]
+        elif ch == "$" and (m := _DOLLAR_TAG.match(sql, i)):
+            end = sql.find(m.group(0), m.end())
+            j = n if end == -1 else end + len(m.group(0))
+            yield "dollar", sql[i:j]
+        elif ch == ";":
+            j = i + 1
+            yield "semicolon", ";"
+        else:
+            j = i + 1
+            while j < n and not sql[j].isspace() and sql[j] not in "'\"`;$" \
+                    and not sql.startswith("--", j) and not sql.startswith("/*", j):
+                j += 1
+            yield "other", sql[i:j]
+        i = j
+
+
+def split_statements(sql: str) -> list[str]:
+    """Split SQL text into statements, each ending with its `;`.
+
+    Whitespace and comments before a statement belong to it; anything after the last
+    `;` forms a final piece. `"".join(split_statements(sql)) == sql` always holds.
+    """
+    statements, current = [], []
+    for kind, text in tokenize_sql(sql):
+        current.append(text)
+        if kind == "semicolon":
+            statements.append("".join(current))
+            current = []
+    if current:
+        statements.append("".join(current))
+    return statements
+
+
+def code_signature(sql: str) -> str:
+    """Return the statement with comments dropped and whitespace collapsed.
+
+    Two pieces of SQL with the same signature differ only in comments and layout.
+    """
+    parts = [text for kind, text in tokenize_sql(sql) if kind not in ("ws", "comment")]
+    return " ".join(parts)
+
+
+def has_code(sql: str) -> bool:
+    """True if the text contains anything besides whitespace, comments and `;`."""
+    return any(kind not in ("ws", "comment", "semicolon") for kind, _ in tokenize_sql(sql))
+
+
+def is_trivial(statement: str) -> bool:
+    """Heuristically decide whether a statement is too simple to be worth annotating.
+
+    Statements with joins, subqueries, aggregation, window functions, CASE, set operations,
+    CTEs or routine/view definitions are non-trivial, as is anything long.
+    """
+    code = code_signature(statement)
+    if not code:
+        return True
+    if any(pattern.search(code) for pattern in _COMPLEX_PATTERNS):
+        return False
+    return len(statement.strip().splitlines()) <= TRIVIAL_MAX_LINES
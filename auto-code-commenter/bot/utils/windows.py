@@ -0,0 +1,80 @@
+# bot/utils/windows.py
+"""Plan overlapping request windows over a large module and stitch cut-off responses.
+
+A module too large for one request is cut into windows along top-level chunk boundaries
+(see `python_chunks.split_module`). Each window owns a run of whole chunks; the code just
+before it (and the module header with its imports) is sent along as read-only context so
+the model sees what the window's code refers to. Only the owned chunks are taken from the
+response, so the overlap is never duplicated when the results are spliced back.
+"""
+
+from bot.utils.packing import estimate_tokens, plan_batches
+
+
+class Window:
+    """One request's worth of a module.
+
+    Attributes:
+        indexes (list[int]): Indexes of the chunks this window owns
+        context (str): Preceding code shown for reference only (may be empty)
+    """
+    def __init__(self, indexes: list[int], context: str = ""):
+        self.indexes = indexes
+        self.context = context
+
+
+def tail_lines(text: str, token_budget: int) -> str:
+    """Return the last whole lines of `text` that fit in `token_budget` tokens."""
+    kept, used = [], 0
+    for line in reversed(text.splitlines(keepends=True)):
+        used += estimate_tokens(line)
+        if kept and used > token_budget:
+            break
+        kept.append(line)
+    return "".join(reversed(kept))
+
+
+def plan_windows(chunks: list, token_budget: int, overlap_tokens: int) -> list[Window]:
+    """Group chunks into windows of at most `token_budget` tokens, aligned to chunk boundaries.
+
+    A chunk larger than the budget gets a window to itself. Every window after the first
+    carries up to `overlap_tokens` of context: the module header if the window does not own
+    it, then the tail of the code just before the window.
+
+    Args:
+        chunks: Chunks returned by `split_module`
+        token_budget: Maximum estimated tokens of owned code per window
+        overlap_tokens: Maximum estimated tokens of context per window
+
+    Returns:
+        list[Window]: Windows in file order; chunks without code are not owned by any window
+    """
+    sections = [(i, chunk.source) for i, chunk in enumerate(chunks) if chunk.has_code]
+    header = chunks[0].source if chunks and chunks[0].kind == "header" else ""
+    windows = []
+    for batch in plan_batches(sections, token_budget):
+        indexes = [i for i, _ in batch]
+        context = ""
+        if windows:
+            first = indexes[0]
+            header_part = tail_lines(header, overlap_tokens // 2) if header and first > 0 else ""
+            remaining = overlap_tokens - (estimate_tokens(header_part) if header_part else 0)
+            previous = "".join(c.source + c.trailing for c in chunks[:first] if c.kind != "header")
+            before = tail_lines(previous, remaining) if previous and remaining > 0 else ""
+            context = header_part + ("\n...\n" if header_part and before else "") + before
+        windows.append(Window(indexes, context))
+    return windows
+
+
+def stitch_continuation(partial: str, continuation: str, min_overlap: int = 8, max_overlap: int = 400) -> str:
+    """Append a continuation to a cut-off response, dropping text the model repeated.
+
+    Models asked to continue often restart the interrupted line; the longest suffix of
+    `partial` (between `min_overlap` and `max_overlap` characters) that the continuation
+    starts with is removed. Shorter matches are kept, as they are as likely to be real text.
+    """
+    limit = min(len(partial), len(continuation), max_overlap)
+    for size in range(limit, min_overlap - 1, -1):
+        if continuation.startswith(partial[-size:]):
+            return partial + continuation[size:]
+    return partial + continuation
@@ -7,6 +7,41 @@ def pr_exists(g, repo_name, branch):
     pulls = repo.get_pulls(state="open", head=f"{repo.owner.login}:{branch}")
     return pulls.totalCount > 0
 
+def ref_exists(ref):
+    result = subprocess.run(["git", "rev-parse", "--verify", "--quiet", f"{ref}^{{commit}}"], capture_output=True, text=True)
+    return result.returncode == 0
+
+def resolve_incremental_base(bot_branch, bot_name, base_branch):
+    """Pick the commit to diff against: the last bot commit on the bot branch, else the base branch."""
+    # Actions checkouts are usually shallow; make sure both candidate refs are available locally
+    for branch in (bot_branch, base_branch):
+        subprocess.run(["git", "fetch", "--no-tags", "origin", f"+{branch}:refs/remotes/origin/{branch}"], capture_output=True)
+
+    bot_ref = f"origin/{bot_branch}"
+    if ref_exists(bot_ref):
+        last_bot_commit = subprocess.run(
+            ["git", "log", "-1", "--format=%H", f"--author={bot_name}", bot_ref],
+            capture_output=True, text=True,
+        ).stdout.strip()
+        if last_bot_commit:
+            return last_bot_commit
+
+    base_ref = f"origin/{base_branch}"
+    if ref_exists(base_ref):
+        return base_ref
+    return None
+
+def changed_files(base):
+    """List files added, copied, modified or renamed between `base` and HEAD, or None if git can't tell."""
+    result = subprocess.run(
+        ["git", "diff", "--name-only", "--diff-filter=ACMR", f"{base}...HEAD"],
+        capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        print(f"⚠️ git diff against {base} failed: {result.stderr.strip()}")
+        return None
+    return [line for line in result.stdout.splitlines() if line.strip()]
+
 def run():
     subprocess.run(["git", "config", "--global", "--add", "safe.directory", os.getcwd()], check=True)
 
@@ -18,6 +53,8 @@ def run():
     BRANCH_NAME = os.environ.get("BOT_BRANCH", "auto/comment-update")
     PR_TITLE = os.environ.get("PR_TITLE", "🤖 Add Code Comments")
     PR_BODY = os.environ.get("PR_BODY", "This PR includes auto-generated code comments.")
+    INCREMENTAL = os.environ.get("INCREMENTAL", "false").lower() in ("1", "true", "yes")
+    BASE_BRANCH = os.environ.get("BASE_BRANCH") or os.environ.get("GITHUB_BASE_REF") or "main"
 
     # Optional CLI arguments via ENV
     args = ["python", "-m", "bot.cli"]
@@ -41,6 +78,20 @@ def run():
     append_flag("aws_access_key_id", os.environ.get("AWS_ACCESS_KEY_ID"))
     append_flag("aws_secret_access_key", os.environ.get("AWS_SECRET_ACCESS_KEY"))
 
+    # Incremental mode: only send files changed since the last bot commit (or the base branch)
+    if INCREMENTAL:
+        base = resolve_incremental_base(BRANCH_NAME, BOT_NAME, BASE_BRANCH)
+        files = changed_files(base) if base else None
+        if files is not None:
+            print(f"🔍 Incremental mode: {len(files)} file(s) changed since {base}")
+            if not files:
+                print("⚠️ No changed files. Skipping commenting run.")
+                return
+            args.append("--files")
+            args.extend(files)
+        else:
+            print("⚠️ Could not determine changed files for incremental mode, processing all files.")
+
     # Initialize GitHub client
     gh = Github(GITHUB_TOKEN)
     if pr_exists(gh, GITHUB_REPOSITORY, BRANCH_NAME):
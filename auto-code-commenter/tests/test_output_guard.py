@@ -0,0 +1,44 @@
+# tests/test_output_guard.py
+"""Regression tests for the streamed-response guard in `bot.utils.output_guard`."""
+
+import pytest
+
+from bot.utils.output_guard import detect_violation
+
+
+@pytest.mark.parametrize("head", [
+    "ok = check()\n",
+    "below = 3\n",
+    "sure = True\n",
+    "okay(result)\n",
+    "certainly.value = 1\n",
+    "below[0] = None\n",
+    "sure: bool = True\n",
+    "ok += 1\n",
+    "below //= 2\n",
+])
+def test_identifier_led_code_lines_pass(head):
+    assert detect_violation(head) is None
+
+
+@pytest.mark.parametrize("head", [
+    "Here is the commented code:\n",
+    "Sure! Here you go.\n",
+    "Sure. Here is the code\n",
+    "Certainly, the code below\n",
+    "Below is the updated module\n",
+    "I've added docstrings to every function.\n",
+    "Okay\n",
+])
+def test_prose_lead_ins_are_rejected(head):
+    assert detect_violation(head) == "prose"
+
+
+def test_fence_is_rejected():
+    assert detect_violation("```python\nimport os\n") == "markdown fence"
+
+
+@pytest.mark.parametrize("head", ["ok", "Sure", "below  "])
+def test_lead_in_waits_for_the_next_token(head):
+    # A stream may pause right after the word; it is only judged once more text arrives
+    assert detect_violation(head) is None